@@ -0,0 +1,344 @@
+"""
+Graph analytics over the genre DAG and band memberships.
+
+Works on two undirected graphs built from the graph index (graph_index.py):
+  - the combined graph: genres and bands as nodes, with genre-parent and
+    band-genre links as edges (the bipartite membership graph plus the DAG)
+  - the genre graph: just the genres and their parent links
+
+and computes:
+  - degree: bands, parents and children per genre; genres per band
+  - PageRank on the combined graph (power iteration)
+  - betweenness centrality (Brandes), exact on the genre graph and sampled
+    from ANALYTICS_BETWEENNESS_SAMPLES sources on the combined graph
+  - connected components of both graphs
+  - bridging bands: bands whose genres are far apart in the genre graph
+
+Everything runs over the index's flat CSR arrays in plain Python (the app
+has no numpy/scipy dependency), so it's the background worker's job
+('graph_analytics' in jobs.py), run once per data version and stored in the
+graph_analytics table. Web workers only read the stored results (and keep
+them in memory until the version changes); while a newer version is being
+computed the previous results are served, marked stale.
+"""
+
+import json
+import random
+import time
+from array import array
+from collections import deque
+
+from graph_index import NO_PARENT, build_csr
+from models import db, GraphAnalytics
+
+ANALYTICS_KINDS = ('summary', 'genres', 'bands', 'bridges')
+
+
+# =============================================================================
+# Graph building
+# =============================================================================
+
+def undirected_csr(edges, size):
+    """CSR adjacency for an undirected graph from (a, b) pairs (duplicates dropped)"""
+    unique = {(a, b) if a < b else (b, a) for a, b in edges if a != b}
+    return build_csr([(a, b) for a, b in unique] + [(b, a) for a, b in unique], size)
+
+
+def genre_edges(index):
+    """(child, parent) genre positions from genre_parents plus primary parents"""
+    for i in range(index.genre_count):
+        for parent in index.genre_parents(i):
+            yield i, parent
+        if index.genre_primary_parent[i] != NO_PARENT:
+            yield i, index.genre_primary_parent[i]
+
+
+def membership_edges(index):
+    """(band, genre) positions from band_genres plus primary genres"""
+    for i in range(index.band_count):
+        for genre in index.band_genres(i):
+            yield i, genre
+        if index.band_primary_genre[i] != NO_PARENT:
+            yield i, index.band_primary_genre[i]
+
+
+# =============================================================================
+# Algorithms (all take CSR offsets/indices of an undirected graph)
+# =============================================================================
+
+def neighbour_lists(offsets, indices):
+    """Per-node neighbour lists: slicing the CSR arrays once up front is much
+    faster than slicing them in every inner loop"""
+    indices = indices.tolist()
+    return [indices[offsets[v]:offsets[v + 1]] for v in range(len(offsets) - 1)]
+
+
+def pagerank(offsets, indices, damping=0.85, tolerance=1e-6, max_iterations=100):
+    """PageRank scores (summing to 1) by power iteration"""
+    n = len(offsets) - 1
+    if n == 0:
+        return []
+    neighbours = neighbour_lists(offsets, indices)
+    degree = [len(adjacent) for adjacent in neighbours]
+    isolated = [v for v in range(n) if not degree[v]]
+    rank = [1.0 / n] * n
+    for _ in range(max_iterations):
+        # Nodes without edges spread their rank evenly over everything
+        dangling = sum(rank[v] for v in isolated)
+        base = (1.0 - damping) / n + damping * dangling / n
+        share = [r / d if d else 0.0 for r, d in zip(rank, degree)]
+        new_rank = [base + damping * sum(map(share.__getitem__, adjacent)) for adjacent in neighbours]
+        change = sum([abs(a - b) for a, b in zip(new_rank, rank)])
+        rank = new_rank
+        if change < tolerance:
+            break
+    return rank
+
+
+def betweenness(offsets, indices, samples=0, seed=0):
+    """Normalized betweenness centrality (Brandes' algorithm).
+
+    With `samples` > 0 only that many randomly chosen source nodes are
+    used and the result is scaled up - an estimate that keeps large graphs
+    tractable. 0 means exact.
+    """
+    n = len(offsets) - 1
+    scores = [0.0] * n
+    if n < 3:
+        return scores
+    sources = range(n)
+    if 0 < samples < n:
+        sources = random.Random(seed).sample(range(n), samples)
+
+    neighbours = neighbour_lists(offsets, indices)
+    distance = [-1] * n
+    paths = [0] * n
+    dependency = [0.0] * n
+    for source in sources:
+        # Single-source shortest paths (BFS, unweighted)
+        distance[source] = 0
+        paths[source] = 1
+        order = [source]
+        for v in order:  # `order` grows while we walk it, like a queue
+            next_distance = distance[v] + 1
+            for w in neighbours[v]:
+                if distance[w] < 0:
+                    distance[w] = next_distance
+                    order.append(w)
+                if distance[w] == next_distance:
+                    paths[w] += paths[v]
+
+        # Accumulate dependencies back from the furthest nodes
+        for w in reversed(order):
+            previous_distance = distance[w] - 1
+            coefficient = (1.0 + dependency[w]) / paths[w]
+            for v in neighbours[w]:
+                if distance[v] == previous_distance:
+                    dependency[v] += paths[v] * coefficient
+            if w != source:
+                scores[w] += dependency[w]
+
+        for v in order:
+            distance[v] = -1
+            paths[v] = 0
+            dependency[v] = 0.0
+
+    # Every pair is counted from both ends in an undirected graph
+    scale = (n / len(sources)) / ((n - 1) * (n - 2))
+    return [score * scale for score in scores]
+
+
+def connected_components(offsets, indices):
+    """Component number for every node, and the number of components"""
+    n = len(offsets) - 1
+    labels = array('i', [-1]) * n
+    count = 0
+    for start in range(n):
+        if labels[start] != -1:
+            continue
+        labels[start] = count
+        stack = [start]
+        while stack:
+            v = stack.pop()
+            for w in indices[offsets[v]:offsets[v + 1]]:
+                if labels[w] == -1:
+                    labels[w] = count
+                    stack.append(w)
+        count += 1
+    return labels, count
+
+
+def distances_from(offsets, indices, source):
+    """Hop distance from `source` to every reachable node"""
+    distance = {source: 0}
+    queue = deque([source])
+    while queue:
+        v = queue.popleft()
+        for w in indices[offsets[v]:offsets[v + 1]]:
+            if w not in distance:
+                distance[w] = distance[v] + 1
+                queue.append(w)
+    return distance
+
+
+def bridging_bands(genre_offsets, genre_indices, band_genre_sets):
+    """Bands whose genres are far apart in the genre graph.
+
+    A band's span is the largest hop distance between any two of its
+    genres; None means two of its genres aren't connected at all (the band
+    links otherwise separate parts of the catalog). Bands with a single
+    genre, or only neighbouring genres, are left out.
+    """
+    distance_cache = {}
+    bridges = []
+    for band, genres in enumerate(band_genre_sets):
+        if len(genres) < 2:
+            continue
+        genres = sorted(genres)
+        span = 0
+        for i, a in enumerate(genres):
+            if a not in distance_cache:
+                distance_cache[a] = distances_from(genre_offsets, genre_indices, a)
+            reachable = distance_cache[a]
+            for b in genres[i + 1:]:
+                if b not in reachable:
+                    span = None
+                    break
+                span = max(span, reachable[b])
+            if span is None:
+                break
+        if span is None or span >= 2:
+            bridges.append((band, genres, span))
+    return bridges
+
+
+# =============================================================================
+# Putting it together
+# =============================================================================
+
+def compute_analytics(index, betweenness_samples=0):
+    """All analytics for one graph index, as JSON-ready dicts"""
+    start = time.perf_counter()
+    genre_count, band_count = index.genre_count, index.band_count
+
+    genre_offsets, genre_indices = undirected_csr(genre_edges(index), genre_count)
+    memberships = list(membership_edges(index))
+    # Combined graph: genres are nodes 0..G-1, bands are G..G+B-1
+    combined_offsets, combined_indices = undirected_csr(
+        list(genre_edges(index)) + [(genre_count + band, genre) for band, genre in memberships],
+        genre_count + band_count)
+
+    band_genre_sets = [set() for _ in range(band_count)]
+    genre_band_counts = [set() for _ in range(genre_count)]
+    for band, genre in memberships:
+        band_genre_sets[band].add(genre)
+        genre_band_counts[genre].add(band)
+    parent_sets = [set() for _ in range(genre_count)]
+    child_counts = [0] * genre_count
+    for child, parent in set(genre_edges(index)):
+        parent_sets[child].add(parent)
+        child_counts[parent] += 1
+
+    rank = pagerank(combined_offsets, combined_indices)
+    combined_betweenness = betweenness(combined_offsets, combined_indices, samples=betweenness_samples)
+    genre_betweenness = betweenness(genre_offsets, genre_indices)
+    combined_labels, combined_components = connected_components(combined_offsets, combined_indices)
+    _, genre_components = connected_components(genre_offsets, genre_indices)
+
+    component_sizes = {}
+    for label in combined_labels:
+        component_sizes[label] = component_sizes.get(label, 0) + 1
+
+    genres = [{
+        'id': index.genre_ids[i],
+        'name': index.genre_names[i],
+        'bands': len(genre_band_counts[i]),
+        'parents': len(parent_sets[i]),
+        'children': child_counts[i],
+        'pagerank': rank[i],
+        'betweenness': combined_betweenness[i],
+        'genre_betweenness': genre_betweenness[i],
+    } for i in range(genre_count)]
+
+    bands = [{
+        'id': index.band_ids[i],
+        'name': index.band_names[i],
+        'genres': len(band_genre_sets[i]),
+        'pagerank': rank[genre_count + i],
+        'betweenness': combined_betweenness[genre_count + i],
+    } for i in range(band_count)]
+
+    bridges = [{
+        'id': index.band_ids[band],
+        'name': index.band_names[band],
+        'genres': [index.genre_ids[g] for g in genre_positions],
+        'span': span,
+    } for band, genre_positions, span in bridging_bands(genre_offsets, genre_indices, band_genre_sets)]
+
+    return {
+        'summary': {
+            'genres': genre_count,
+            'bands': band_count,
+            'memberships': len(set(memberships)),
+            'genre_links': len(genre_indices) // 2,
+            'components': combined_components,
+            'largest_component': max(component_sizes.values(), default=0),
+            'genre_components': genre_components,
+            'betweenness_samples': betweenness_samples or None,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+        },
+        # Most central first; unconnected bridges are the strongest
+        'genres': sorted(genres, key=lambda g: -g['pagerank']),
+        'bands': sorted(bands, key=lambda b: (-b['betweenness'], -b['pagerank'])),
+        'bridges': sorted(bridges, key=lambda b: (b['span'] is not None, -(b['span'] or 0), b['id'])),
+    }
+
+
+# =============================================================================
+# Shared results: written by the worker, read (and cached) by web workers
+# =============================================================================
+
+_results = None  # {'version': int, 'data': dict} last read from the table
+
+
+def stored_analytics_version():
+    """Data version of the stored results (None before the first run)"""
+    table = GraphAnalytics.__table__
+    return db.session.execute(db.select(table.c.version).where(table.c.id == 1)).scalar()
+
+
+def store_analytics(version, data):
+    """Replace the stored results, unless newer ones are already there.
+    The caller commits."""
+    table = GraphAnalytics.__table__
+    values = {'version': version, 'data': json.dumps(data, separators=(',', ':')), 'computed_at': db.func.now()}
+    updated = db.session.execute(
+        table.update().where(table.c.id == 1, table.c.version <= version).values(**values)).rowcount
+    if not updated and stored_analytics_version() is None:
+        db.session.execute(table.insert().values(id=1, **values))
+
+
+def get_analytics(version):
+    """Newest stored results, read from the table only when they may have changed.
+
+    Returns (results, fresh): results is None until the worker's first run
+    has finished, fresh is False while results are for an older data version.
+    """
+    global _results
+    results = _results
+    if results is None or results['version'] != version:
+        stored_version = stored_analytics_version()
+        if stored_version is not None and (results is None or stored_version != results['version']):
+            table = GraphAnalytics.__table__
+            row = db.session.execute(
+                db.select(table.c.version, table.c.data).where(table.c.id == 1)).one_or_none()
+            if row is not None:
+                results = _results = {'version': row.version, 'data': json.loads(row.data)}
+    fresh = results is not None and results['version'] == version
+    return results, fresh
+
+
+def clear_analytics():
+    """Forget cached results (tests recreate the database between runs)"""
+    global _results
+    _results = None
@@ -1,76 +1,188 @@
-from flask import Flask, render_template
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, current_app
 from config import Config
-from models import db, Genre, Band, User
-from flask import Flask, render_template, request, redirect, url_for, flash
+from models import db, Genre, Band, User, get_data_version
+from graph_data import build_graph_changes
+from graph_lod import build_graph_view, build_graph_expansion
+from read_models import iter_genres, iter_bands, count_genres, count_bands, genre_options, GenreListing, BandListing
+from query_cache import query_cache_stats
+from streaming import stream_page, stream_csv, stream_json
+from analytics import ANALYTICS_KINDS, get_analytics
+from similarity import get_similar
+from graph_paths import find_path
+from instrumentation import init_instrumentation
+from assets import init_assets
+from db_routing import init_routing, replica_reads
+from jobs import enqueue_rebuilds, job_status
+from static_site import init_static_site
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from functools import wraps
+import json
+import time
 
-
-
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Initialize database
-db.init_app(app)
-
-# Initialize Flask-Migrate
-migrate = Migrate(app, db)
+# Extensions are created here and bound to an app in create_app()
+migrate = Migrate()
 
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'  # Where to redirect if not logged in
+login_manager.login_view = 'main.login'  # Where to redirect if not logged in
 
-# Initialize rate limiter (protects against brute force attacks)
+# Rate limiter (protects against brute force attacks)
 limiter = Limiter(
     get_remote_address,
-    app=app,
     storage_uri="memory://",
 )
 
+# All web routes live on this blueprint
+main = Blueprint('main', __name__)
+
 # User loader callback
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-def get_unique_connections(genres):
-    """Get unique connections (avoid duplicates)"""
-    connections = set()
-    for genre in genres:
-        if genre.parent:
-            # Create connection between genre and its parent
-            edge = tuple(sorted([genre.id, genre.parent_id]))
-            connections.add(edge)
-    return list(connections)
-
 def admin_required(f):
     """Decorator to require admin access"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated:
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         if not current_user.is_admin:
             flash('Admin access required.', 'error')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/')
-def index():
-    # Query all genres and bands from database
-    genres = Genre.query.all()
-    bands = Band.query.all()
-
-    connections = get_unique_connections(genres)
+# Set by the page to the version of the graph it holds in IndexedDB
+GRAPH_CACHE_COOKIE = 'graph_cache'
 
-    return render_template('index.html',
-                         genres=genres,
-                         bands=bands,
-                         connections=connections)
-
-@app.route('/add-genre', methods=['GET', 'POST'])
+@main.route('/')
+@replica_reads
+def index():
+    budget = current_app.config['GRAPH_NODE_BUDGET']
+    graph_boot = {'budget': budget, 'cached': None, 'patch': None}
+    graph_data = None
+
+    # A page with the graph cached locally only needs what changed since
+    cached = request.cookies.get(GRAPH_CACHE_COOKIE, type=int)
+    if cached is not None and cached >= 0:
+        patch = build_graph_changes(cached, limit=current_app.config['GRAPH_CHANGES_LIMIT'])
+        if not patch['reset']:
+            graph_boot.update(version=patch['version'], cached=cached, patch=patch)
+
+    if graph_boot['cached'] is None:
+        # Build the graph (nodes, edges, panel data) in one pass - clustered
+        # if it's too big to draw; the template embeds it as a single JSON document
+        graph_data = build_graph_view(budget)
+        graph_boot['version'] = graph_data['version']
+
+    return render_template('index.html', graph_data=graph_data, graph_boot=graph_boot)
+
+@main.route('/api/graph')
+@replica_reads
+def graph_api():
+    """The graph as JSON (same payload index.html embeds)"""
+    return jsonify(build_graph_view(current_app.config['GRAPH_NODE_BUDGET']))
+
+@main.route('/api/graph/expand/<genre_id>')
+@replica_reads
+def graph_expand(genre_id):
+    """A clustered genre's children and bands, for level-of-detail views"""
+    data = build_graph_expansion(genre_id, current_app.config['GRAPH_NODE_BUDGET'])
+    if data is None:
+        return jsonify({'error': 'Genre not found'}), 404
+    return jsonify(data)
+
+@main.route('/api/graph/changes')
+@replica_reads
+def graph_changes():
+    """Patch for a client whose graph is at version `since`"""
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': "Query parameter 'since' must be a non-negative integer"}), 400
+    return jsonify(build_graph_changes(since, limit=current_app.config['GRAPH_CHANGES_LIMIT']))
+
+@main.route('/api/graph/stream')
+def graph_stream():
+    """Server-Sent Events stream announcing each new data version"""
+    if not current_app.config['GRAPH_STREAM_ENABLED']:
+        return jsonify({'error': 'Graph stream is disabled'}), 404
+
+    app = current_app._get_current_object()  # The generator outlives this request
+    check_interval = app.config['GRAPH_STREAM_CHECK_INTERVAL']
+
+    def events():
+        last_version = None
+        last_sent = 0
+        while True:
+            with app.app_context():
+                version = get_data_version()
+                db.session.remove()  # Don't hold a connection while sleeping
+            if version != last_version:
+                last_version = version
+                last_sent = time.monotonic()
+                yield f'event: version\ndata: {json.dumps({"version": version})}\n\n'
+            elif time.monotonic() - last_sent > 15:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'  # Stops proxies closing an idle stream
+            time.sleep(check_interval)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main.route('/api/analytics/<kind>')
+@replica_reads
+def analytics_api(kind):
+    """Graph analytics: summary, genres, bands or bridges.
+
+    Answers from the results the background worker stored for the newest
+    data version so far ('stale' is true while it computes a newer one);
+    202 until its very first run has finished.
+    """
+    if kind not in ANALYTICS_KINDS:
+        return jsonify({'error': f"Unknown analytics '{kind}'"}), 404
+    version = get_data_version()
+    results, fresh = get_analytics(version)
+    if results is None:
+        return jsonify({'status': 'computing', 'version': version}), 202
+
+    data = results['data'][kind]
+    if kind != 'summary':
+        limit = request.args.get('limit', 50, type=int)
+        data = data[:max(1, min(limit or 50, 1000))]
+    return jsonify({'version': results['version'], 'stale': not fresh, kind: data})
+
+@main.route('/api/similar/<any(genre, band):entity_type>/<entity_id>')
+@replica_reads
+def similar_api(entity_type, entity_id):
+    """Similar genres and related bands for a detail panel, as the worker
+    last stored them ('stale' is true while it computes a newer version);
+    202 until its very first run has finished.
+    """
+    version = get_data_version()
+    panel, stored_version = get_similar(version, entity_type, entity_id)
+    if stored_version is None:
+        return jsonify({'status': 'computing', 'version': version}), 202
+    if panel is None:
+        return jsonify({'error': f'{entity_type.capitalize()} not found'}), 404
+    return jsonify(dict(panel, version=stored_version, stale=stored_version != version))
+
+@main.route('/api/path')
+@replica_reads
+def path_api():
+    """Shortest connection between two genres/bands: /api/path?from=<id>&to=<id>"""
+    from_id = request.args.get('from', '').strip()
+    to_id = request.args.get('to', '').strip()
+    if not from_id or not to_id:
+        return jsonify({'error': "Query parameters 'from' and 'to' are required"}), 400
+    version = get_data_version()
+    result = find_path(version, from_id, to_id, current_app.config['PATH_MAX_DEPTH'])
+    if result is None:
+        return jsonify({'error': 'Genre or band not found'}), 404
+    return jsonify(dict(result, version=version, max_depth=current_app.config['PATH_MAX_DEPTH']))
+
+@main.route('/add-genre', methods=['GET', 'POST'])
 @admin_required
 def add_genre():
     if request.method == 'POST':
@@ -115,7 +227,7 @@ def add_genre():
             for error in errors:
                 flash(error, 'error')
             # Re-render form with existing data
-            genres = Genre.query.order_by(Genre.name).all()
+            genres = genre_options()
             return render_template('add_genre.html',
                                  genres=genres,
                                  form_data=request.form)
@@ -134,24 +246,25 @@ def add_genre():
                 selected_parents = Genre.query.filter(Genre.id.in_(selected_parent_ids)).all()
                 new_genre.parent_genres = selected_parents
             db.session.add(new_genre)
+            enqueue_rebuilds()
             db.session.commit()
             
             flash(f'Genre "{name}" added successfully!', 'success')
-            return redirect(url_for('add_genre'))
+            return redirect(url_for('main.add_genre'))
             
         except Exception as e:
             db.session.rollback()
             flash(f'Error adding genre: {str(e)}', 'error')
-            genres = Genre.query.order_by(Genre.name).all()
+            genres = genre_options()
             return render_template('add_genre.html',
                                  genres=genres,
                                  form_data=request.form)
 
     # GET request - show the form
-    genres = Genre.query.order_by(Genre.name).all()
+    genres = genre_options()
     return render_template('add_genre.html', genres=genres)
 
-@app.route('/add-band', methods=['GET', 'POST'])
+@main.route('/add-band', methods=['GET', 'POST'])
 @admin_required
 def add_band():
     if request.method == 'POST':
@@ -201,7 +314,7 @@ def add_band():
         if errors:
             for error in errors:
                 flash(error, 'error')
-            genres = Genre.query.filter_by(type='leaf').order_by(Genre.name).all()
+            genres = genre_options(leaf_only=True)
             return render_template('add_band.html',
                                  genres=genres,
                                  form_data=request.form)
@@ -220,25 +333,26 @@ def add_band():
             new_band.genres = selected_genres
             
             db.session.add(new_band)
+            enqueue_rebuilds()
             db.session.commit()
             
             flash(f'Band "{name}" added successfully!', 'success')
-            return redirect(url_for('add_band'))
+            return redirect(url_for('main.add_band'))
             
         except Exception as e:
             db.session.rollback()
             flash(f'Error adding band: {str(e)}', 'error')
-            genres = Genre.query.filter_by(type='leaf').order_by(Genre.name).all()
+            genres = genre_options(leaf_only=True)
             return render_template('add_band.html',
                                  genres=genres,
                                  form_data=request.form)
 
     # GET request - show the form
     # Only show leaf genres (bands can't be assigned to intermediate/root)
-    genres = Genre.query.filter_by(type='leaf').order_by(Genre.name).all()
+    genres = genre_options(leaf_only=True)
     return render_template('add_band.html', genres=genres)
 
-@app.route('/edit-genre/<genre_id>', methods=['GET', 'POST'])
+@main.route('/edit-genre/<genre_id>', methods=['GET', 'POST'])
 @admin_required
 def edit_genre(genre_id):
     # Get the genre to edit
@@ -278,7 +392,7 @@ def edit_genre(genre_id):
         if errors:
             for error in errors:
                 flash(error, 'error')
-            genres = Genre.query.filter(Genre.id != genre_id).order_by(Genre.name).all()
+            genres = genre_options(exclude=genre_id)
             return render_template('edit_genre.html',
                                  genre=genre,
                                  genres=genres,
@@ -297,25 +411,26 @@ def edit_genre(genre_id):
             else:
                 genre.parent_genres = []
             
+            enqueue_rebuilds()
             db.session.commit()
             
             flash(f'Genre "{new_name}" updated successfully!', 'success')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
             
         except Exception as e:
             db.session.rollback()
             flash(f'Error updating genre: {str(e)}', 'error')
-            genres = Genre.query.filter(Genre.id != genre_id).order_by(Genre.name).all()
+            genres = genre_options(exclude=genre_id)
             return render_template('edit_genre.html',
                                  genre=genre,
                                  genres=genres,
                                  form_data=request.form)
 
     # GET request - show the form
-    genres = Genre.query.filter(Genre.id != genre_id).order_by(Genre.name).all()
+    genres = genre_options(exclude=genre_id)
     return render_template('edit_genre.html', genre=genre, genres=genres)
 
-@app.route('/edit-band/<band_id>', methods=['GET', 'POST'])
+@main.route('/edit-band/<band_id>', methods=['GET', 'POST'])
 @admin_required
 def edit_band(band_id):
     # Get the band to edit
@@ -352,7 +467,7 @@ def edit_band(band_id):
         if errors:
             for error in errors:
                 flash(error, 'error')
-            genres = Genre.query.filter_by(type='leaf').order_by(Genre.name).all()
+            genres = genre_options(leaf_only=True)
             return render_template('edit_band.html',
                                  band=band,
                                  genres=genres,
@@ -367,25 +482,26 @@ def edit_band(band_id):
             selected_genres = Genre.query.filter(Genre.id.in_(selected_genre_ids)).all()
             band.genres = selected_genres
             
+            enqueue_rebuilds()
             db.session.commit()
             
             flash(f'Band "{new_name}" updated successfully!', 'success')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
             
         except Exception as e:
             db.session.rollback()
             flash(f'Error updating band: {str(e)}', 'error')
-            genres = Genre.query.filter_by(type='leaf').order_by(Genre.name).all()
+            genres = genre_options(leaf_only=True)
             return render_template('edit_band.html',
                                  band=band,
                                  genres=genres,
                                  form_data=request.form)
 
     # GET request - show the form
-    genres = Genre.query.filter_by(type='leaf').order_by(Genre.name).all()
+    genres = genre_options(leaf_only=True)
     return render_template('edit_band.html', band=band, genres=genres)
 
-@app.route('/delete-genre/<genre_id>', methods=['POST'])
+@main.route('/delete-genre/<genre_id>', methods=['POST'])
 @admin_required
 def delete_genre(genre_id):
     genre = Genre.query.get_or_404(genre_id)
@@ -408,48 +524,72 @@ def delete_genre(genre_id):
     if errors:
         for error in errors:
             flash(error, 'error')
-        return redirect(request.referrer or url_for('index'))
+        return redirect(request.referrer or url_for('main.index'))
     
     # Safe to delete
     try:
         db.session.delete(genre)
+        enqueue_rebuilds()
         db.session.commit()
         flash(f'Genre "{genre.name}" deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error deleting genre: {str(e)}', 'error')
     
-    return redirect(request.referrer or url_for('index'))
+    return redirect(request.referrer or url_for('main.index'))
 
 
-@app.route('/delete-band/<band_id>', methods=['POST'])
+@main.route('/delete-band/<band_id>', methods=['POST'])
 @admin_required
 def delete_band(band_id):
     band = Band.query.get_or_404(band_id)
     
     try:
         db.session.delete(band)
+        enqueue_rebuilds()
         db.session.commit()
         flash(f'Band "{band.name}" deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error deleting band: {str(e)}', 'error')
     
-    return redirect(request.referrer or url_for('index'))
+    return redirect(request.referrer or url_for('main.index'))
 
-@app.route('/admin')
+@main.route('/admin')
+@replica_reads
 @admin_required
 def admin():
-    genres = Genre.query.order_by(Genre.name).all()
-    bands = Band.query.order_by(Band.name).all()
-    return render_template('admin.html', genres=genres, bands=bands)
-
-@app.route('/login', methods=['GET', 'POST'])
+    # Read models, not ORM objects, streamed: rows are fetched a batch at a
+    # time while the page is sent, so the first rows arrive straight away
+    # and memory doesn't grow with the catalog
+    return stream_page('admin.html', genres=iter_genres(), bands=iter_bands(),
+                       genre_count=count_genres(), band_count=count_bands())
+
+# Full dumps of the admin listings, streamed like the page
+EXPORTS = {
+    'genres': (GenreListing._fields, iter_genres),
+    'bands': (BandListing._fields, iter_bands),
+}
+
+@main.route('/admin/export/<any(genres, bands):kind>.<any(csv, json):fmt>')
+@replica_reads
+@admin_required
+def admin_export(kind, fmt):
+    fields, rows = EXPORTS[kind]
+    filename = f'{kind}.{fmt}'
+    if fmt == 'json':
+        return stream_json(filename, (row._asdict() for row in rows()))
+    # One cell per field; a band's genre names are joined with "; "
+    return stream_csv(filename, fields, (
+        [('; '.join(value) if isinstance(value, tuple) else value) for value in row]
+        for row in rows()))
+
+@main.route('/login', methods=['GET', 'POST'])
 @limiter.limit("5 per minute")
 def login():
     # If already logged in, redirect to home
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     if request.method == 'POST':
         username = request.form['username'].strip()
@@ -461,7 +601,7 @@ def login():
         # Check if user exists and password is correct
         if user is None or not user.check_password(password):
             flash('Invalid username or password', 'error')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         
         # Log the user in
         login_user(user)
@@ -471,15 +611,15 @@ def login():
         next_page = request.args.get('next')
         if next_page:
             return redirect(next_page)
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     # Registration disabled - only admins can create users via CLI
     flash('Registration is currently disabled.', 'error')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
     # Original registration code kept for future use
     if False and request.method == 'POST':
@@ -535,7 +675,7 @@ def register():
             login_user(new_user)
             
             flash(f'Account created successfully! Welcome, {username}!', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
             
         except Exception as e:
             db.session.rollback()
@@ -544,20 +684,34 @@ def register():
     
     return render_template('register.html')
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out.', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/admin/users')
+@main.route('/admin/users')
+@replica_reads
 @admin_required
 def manage_users():
     users = User.query.order_by(User.created_at.desc()).all()
     return render_template('manage_users.html', users=users)
 
-@app.route('/admin/users/toggle-admin/<int:user_id>', methods=['POST'])
+@main.route('/api/jobs')
+@admin_required
+def jobs_api():
+    """Background job queue status: counts per status and the latest jobs"""
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(job_status(limit=max(1, min(limit or 20, 200))))
+
+@main.route('/api/query-cache')
+@admin_required
+def query_cache_api():
+    """Memoized query hits, misses and bypasses in this worker process"""
+    return jsonify(query_cache_stats())
+
+@main.route('/admin/users/toggle-admin/<int:user_id>', methods=['POST'])
 @admin_required
 def toggle_admin(user_id):
     user = User.query.get_or_404(user_id)
@@ -565,7 +719,7 @@ def toggle_admin(user_id):
     # Prevent removing your own admin rights
     if user.id == current_user.id:
         flash('You cannot change your own admin status', 'error')
-        return redirect(url_for('manage_users'))
+        return redirect(url_for('main.manage_users'))
     
     user.is_admin = not user.is_admin
     action = "granted" if user.is_admin else "removed"
@@ -577,7 +731,50 @@ def toggle_admin(user_id):
         db.session.rollback()
         flash(f'Error updating user: {str(e)}', 'error')
     
-    return redirect(url_for('manage_users'))
+    return redirect(url_for('main.manage_users'))
+
+def create_app(config_class=Config):
+    """Create the web application.
+
+    CLI scripts that only need the database should use
+    database.create_db_app() instead - it skips the login, rate limiting
+    and migration extensions (and their imports).
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+
+    # Initialize database
+    db.init_app(app)
+
+    # Send read-only requests to the replica (when DATABASE_REPLICA_URL is set)
+    init_routing(app)
+
+    # Initialize Flask-Migrate
+    migrate.init_app(app, db)
+
+    login_manager.init_app(app)
+    limiter.init_app(app)
+
+    # Per-request query/render timing (Server-Timing header and /metrics)
+    init_instrumentation(app)
+
+    # Fingerprinted, precompressed static files with immutable caching
+    init_assets(app)
+
+    # `flask graph freeze`: static export of the graph page for CDN serving
+    init_static_site(app)
+
+    # N+1/slow query detection and request profiling (dev/staging only)
+    if app.config['PROFILING_ENABLED']:
+        from profiling import init_profiling
+        init_profiling(app)
+
+    app.register_blueprint(main)
+    return app
+
+
+# Module-level app for Gunicorn (app:app) and `flask` CLI discovery
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False)
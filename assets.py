@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Static asset pipeline: vendored scripts, content-hashed filenames and
+precompressed copies, served with immutable caching.
+
+`python assets.py build` (run by the Dockerfile):
+  1. downloads the third-party scripts in VENDOR into static/vendor/
+     (skipped when they're already there), so pages never wait on a CDN.
+     Each must match its sha256 in vendor.sha256 or the build fails; a
+     script without one isn't vendored at all (pages keep loading it from
+     the CDN, and the build warns)
+  2. copies every file under static/ into static/dist/ under a name that
+     includes its content hash (style.css -> style.3f9c1e0a2b4d.css), with
+     .gz and - if the `brotli` package is installed - .br versions next to it
+  3. writes static/dist/manifest.json mapping original -> hashed names
+
+At runtime (init_assets):
+  - url_for('static', filename='style.css') resolves to the hashed file
+    when the manifest lists it, so templates don't change
+  - hashed files are served with `Cache-Control: public, max-age=31536000,
+    immutable`, precompressed for browsers that accept it; a changed file
+    gets a new name, so nothing ever needs revalidating
+  - asset_url() (a template global) does the same, and for vendored
+    scripts falls back to the CDN when the build step hasn't run
+
+Without a build (local development) static/ is served as before. Rebuild
+or delete static/dist after editing a static file, or the old hashed copy
+keeps being served.
+
+`python assets.py pin` downloads the scripts in VENDOR, records their
+sha256 in vendor.sha256 and writes them to static/vendor/. Run it (and
+commit vendor.sha256) after adding or upgrading a script.
+
+usage:
+python assets.py build [--no-fetch]
+python assets.py pin
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import sys
+import urllib.request
+
+from flask import current_app, request, send_from_directory, url_for
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.map'}
+MIN_COMPRESS_SIZE = 256  # Smaller files aren't worth an extra request header
+
+# Third-party scripts served from our own origin: path under static/ ->
+# source. Their sha256s live in PIN_FILE (`python assets.py pin`)
+VENDOR = {
+    'vendor/vis-network.min.js': 'https://unpkg.com/vis-network@10.0.2/standalone/umd/vis-network.min.js',
+}
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+PIN_FILE = os.path.join(basedir, 'vendor.sha256')
+PIN_HEADER = '# sha256  path under static/ - written by `python assets.py pin`\n'
+
+
+# =============================================================================
+# Build step
+# =============================================================================
+
+class VendorChecksumError(Exception):
+    """A downloaded script doesn't match its pinned sha256"""
+
+
+def _sha256_of(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def read_pins(path=None):
+    """{filename: sha256} from a `sha256sum`-style pin file ({} when missing)"""
+    try:
+        with open(path or PIN_FILE) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return {}
+    pins = {}
+    for line in lines:
+        if line.strip() and not line.startswith('#'):
+            digest, filename = line.split(None, 1)
+            pins[filename.lstrip('*')] = digest
+    return pins
+
+
+def write_pins(pins, path=None):
+    with open(path or PIN_FILE, 'w') as f:
+        f.write(PIN_HEADER)
+        for filename, digest in sorted(pins.items()):
+            f.write(f'{digest}  {filename}\n')
+
+
+def _download(source):
+    print(f"Downloading {source}")
+    with urllib.request.urlopen(source, timeout=60) as response:
+        return response.read()
+
+
+def _write(target, data):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(target + '.tmp', target)
+
+
+def fetch_vendor(static_dir, pin_file=None):
+    """Download every pinned vendored script that isn't in static/ (with
+    the pinned contents) yet, checking it before it's written"""
+    pins = read_pins(pin_file)
+    for filename, source in VENDOR.items():
+        target = os.path.join(static_dir, filename)
+        sha256 = pins.get(filename)
+        if sha256 is None:
+            print(f"WARNING: {filename} has no sha256 in vendor.sha256 - not vendored, pages load {source}")
+            continue
+        if _sha256_of(target) == sha256:
+            continue
+        data = _download(source)
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != sha256:
+            raise VendorChecksumError(f'{source}: sha256 {digest}, expected {sha256}')
+        _write(target, data)
+
+
+def pin_vendor(static_dir, pin_file=None):
+    """Download every vendored script, record its sha256 in the pin file
+    and write it to static/; returns the pins"""
+    pins = read_pins(pin_file)
+    for filename, source in VENDOR.items():
+        data = _download(source)
+        pins[filename] = hashlib.sha256(data).hexdigest()
+        _write(os.path.join(static_dir, filename), data)
+    for filename in set(pins) - set(VENDOR):
+        del pins[filename]
+    write_pins(pins, pin_file)
+    return pins
+
+
+def hashed_name(filename, data):
+    """style.css -> style.<first HASH_LENGTH hex digits of sha256>.css"""
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def compress(data):
+    """{suffix: compressed bytes} for every encoding that actually saves space"""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass  # Optional: gzip only
+    else:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {suffix: body for suffix, body in variants.items() if len(body) < len(data)}
+
+
+def build_assets(static_dir, fetch=True, pin_file=None):
+    """Fingerprint and precompress everything under static_dir; returns the manifest"""
+    if fetch:
+        fetch_vendor(static_dir, pin_file)
+    dist = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = hashed_name(filename, data)
+            target = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            if os.path.splitext(name)[1] in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+                for suffix, body in compress(data).items():
+                    with open(target + suffix, 'wb') as f:
+                        f.write(body)
+            manifest[filename] = hashed
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+# =============================================================================
+# Flask integration
+# =============================================================================
+
+def load_manifest(app):
+    """Read static/dist/manifest.json into the app ({} when there's no build)"""
+    try:
+        with open(os.path.join(app.static_folder, DIST_DIR, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+    app.extensions['assets'] = manifest
+    return manifest
+
+
+def asset_url(filename):
+    """url_for('static', filename=...) that knows vendored scripts: their CDN
+    URL is used until the build step has downloaded them"""
+    if (filename in VENDOR and filename not in current_app.extensions['assets']
+            and not os.path.exists(os.path.join(current_app.static_folder, filename))):
+        return VENDOR[filename]
+    return url_for('static', filename=filename)
+
+
+def _hashed_static(endpoint, values):
+    """url_defaults hook: point static URLs at the fingerprinted copy"""
+    if endpoint == 'static':
+        hashed = current_app.extensions['assets'].get(values.get('filename'))
+        if hashed:
+            values['filename'] = f'{DIST_DIR}/{hashed}'
+
+
+def serve_static(filename):
+    """Static view: fingerprinted files are immutable and precompressed,
+    everything else is served as usual"""
+    app = current_app
+    if not filename.startswith(DIST_DIR + '/'):
+        return app.send_static_file(filename)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(
+                os.path.join(app.static_folder, filename + suffix)):
+            response = send_from_directory(app.static_folder, filename + suffix,
+                                           mimetype=mimetype, max_age=MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(app.static_folder, filename, mimetype=mimetype, max_age=MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Serve fingerprinted assets and resolve static URLs through the manifest"""
+    load_manifest(app)
+    app.url_defaults(_hashed_static)
+    app.view_functions['static'] = serve_static
+    app.add_template_global(asset_url)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets.')
+    parser.add_argument('command', choices=['build', 'pin'])
+    parser.add_argument('--no-fetch', action='store_true', help="don't download vendored scripts")
+    parser.add_argument('--static-dir', default=os.path.join(basedir, 'static'))
+    args = parser.parse_args(argv)
+
+    if args.command == 'pin':
+        for filename, digest in sorted(pin_vendor(args.static_dir).items()):
+            print(f"  {digest}  {filename}")
+        print(f"✓ Pinned {len(VENDOR)} script(s) in {os.path.relpath(PIN_FILE)}; commit it")
+        return 0
+
+    manifest = build_assets(args.static_dir, fetch=not args.no_fetch)
+    for filename, hashed in sorted(manifest.items()):
+        print(f"  {filename} -> {DIST_DIR}/{hashed}")
+    print(f"✓ Built {len(manifest)} asset(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
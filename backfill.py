@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Set-based, resumable data backfills.
+
+A backfill fills a target table from a source table with one
+`INSERT ... SELECT ... WHERE NOT EXISTS` per batch instead of loading rows
+into Python and writing them one at a time:
+
+  - batches are ranges of the source table's key, `batch_size` keys each,
+    found with one indexed query per batch; each batch commits on its own,
+    so there's never one giant transaction
+  - the last key done is recorded (backfill_progress table) in the same
+    transaction as the batch's rows, so an interrupted run resumes after
+    the last committed batch and never writes a row twice
+  - the NOT EXISTS makes every batch idempotent: rows already there are
+    skipped, so re-running a finished backfill (--restart) is harmless
+  - --dry-run counts the rows it would write (one COUNT query) and writes
+    nothing; progress is printed per batch with a rate and an ETA
+
+Backfills write through Core, bypassing the ORM flush hooks, so each batch
+bumps the data version itself, logging the keys it wrote rows for as
+updated entities of `entity_type`. If a backfill changes data the genre
+counters are built from, run rebuild_genre_stats.py afterwards.
+
+Adding one: subclass Backfill, set name/target/columns/key, implement
+pending(), and decorate it with @register_backfill.
+
+usage:
+python backfill.py list
+python backfill.py run genre_parents [--dry-run] [--batch-size N] [--restart]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from database import create_db_app
+from jobs import enqueue_rebuilds
+from models import db, Genre, BackfillProgress, genre_parents, bump_data_version
+
+BACKFILLS = {}
+
+
+def register_backfill(cls):
+    BACKFILLS[cls.name] = cls
+    return cls
+
+
+class Backfill:
+    """One data backfill: the rows `pending()` selects are inserted into
+    `target` (`columns`), batch by batch in order of `key`"""
+    name = None
+    description = ''
+    target = None       # Table written to
+    columns = ()        # Target columns, in the order pending() selects them
+    key = None          # Unique, ordered source column the batches are ranges of
+    entity_type = None  # ChangeLog entity type of `key` values, if rows show in the graph
+
+    def pending(self):
+        """Select of the rows still to write; the first column is the key"""
+        raise NotImplementedError
+
+    def pending_in(self, lower, upper):
+        """pending() for keys in (lower, upper] (None = unbounded)"""
+        query = self.pending()
+        if lower is not None:
+            query = query.where(self.key > lower)
+        if upper is not None:
+            query = query.where(self.key <= upper)
+        return query
+
+    def apply(self, connection, lower, upper):
+        """Write one batch; returns (rows written, keys written for)"""
+        query = self.pending_in(lower, upper)
+        keys = set()
+        if self.entity_type:
+            keys = {row[0] for row in connection.execute(query)}
+        result = connection.execute(self.target.insert().from_select(list(self.columns), query))
+        return result.rowcount, keys
+
+
+# =============================================================================
+# Backfills
+# =============================================================================
+
+@register_backfill
+class GenreParentsBackfill(Backfill):
+    """Copy each genre's primary parent (genres.parent_id) into genre_parents"""
+    name = 'genre_parents'
+    description = 'Add every genre\'s parent_id to its genre_parents'
+    target = genre_parents
+    columns = ('genre_id', 'parent_genre_id')
+    key = Genre.__table__.c.id
+    entity_type = 'genre'
+
+    def pending(self):
+        genres = Genre.__table__
+        parents = genres.alias('parent')
+        return (db.select(genres.c.id, genres.c.parent_id)
+                .join(parents, parents.c.id == genres.c.parent_id)  # Skips parents that don't exist
+                .where(~db.select(genre_parents.c.genre_id)
+                       .where(genre_parents.c.genre_id == genres.c.id,
+                              genre_parents.c.parent_genre_id == genres.c.parent_id)
+                       .exists()))
+
+
+# =============================================================================
+# Runner
+# =============================================================================
+
+def count_pending(backfill, connection):
+    return connection.execute(
+        db.select(db.func.count()).select_from(backfill.pending().subquery())).scalar_one()
+
+
+def next_boundary(backfill, connection, lower, batch_size):
+    """(key that ends the batch starting after `lower`, whether keys follow
+    it); the key is None when the batch runs to the end"""
+    query = db.select(backfill.key).order_by(backfill.key).offset(batch_size - 1).limit(2)
+    if lower is not None:
+        query = query.where(backfill.key > lower)
+    keys = connection.execute(query).scalars().all()
+    if not keys:
+        return None, False
+    return keys[0], len(keys) > 1
+
+
+def _save_progress(connection, name, last_key, rows, finished):
+    table = BackfillProgress.__table__
+    values = {'last_key': json.dumps(last_key), 'updated_at': db.func.now(),
+              'rows_written': table.c.rows_written + rows, 'batches': table.c.batches + 1}
+    if finished:
+        values['finished_at'] = db.func.now()
+    if not connection.execute(table.update().where(table.c.name == name).values(**values)).rowcount:
+        connection.execute(table.insert().values(
+            name=name, last_key=json.dumps(last_key), rows_written=rows, batches=1,
+            updated_at=db.func.now(), finished_at=db.func.now() if finished else None))
+
+
+def get_progress(name):
+    return db.session.get(BackfillProgress, name)
+
+
+def run_backfill(backfill, batch_size=1000, dry_run=False, restart=False, report=print):
+    """Run (or resume) `backfill`; returns the number of rows written (with
+    `dry_run`, the number that would be)"""
+    engine = db.engine
+    with engine.connect() as connection:
+        pending = count_pending(backfill, connection)
+        total_keys = connection.execute(db.select(db.func.count(backfill.key))).scalar_one()
+    if dry_run:
+        report(f"{backfill.name}: {pending} row(s) to write ({total_keys} keys to scan, "
+               f"{-(-total_keys // batch_size)} batch(es) of {batch_size})")
+        return pending
+
+    table = BackfillProgress.__table__
+    with engine.begin() as connection:
+        if restart:
+            connection.execute(table.delete().where(table.c.name == backfill.name))
+        progress = connection.execute(db.select(table).where(table.c.name == backfill.name)).first()
+    if progress is not None and progress.finished_at is not None:
+        report(f"{backfill.name}: already finished ({progress.rows_written} row(s) written) - "
+               f"use --restart to run it again")
+        return 0
+
+    lower = None if progress is None or progress.last_key is None else json.loads(progress.last_key)
+    with engine.connect() as connection:
+        done_keys = 0 if lower is None else connection.execute(
+            db.select(db.func.count(backfill.key)).where(backfill.key <= lower)).scalar_one()
+    if lower is not None:
+        report(f"{backfill.name}: resuming after {lower!r} ({done_keys}/{total_keys} keys done)")
+    report(f"{backfill.name}: {pending} row(s) to write")
+
+    written = 0
+    start = time.monotonic()
+    more = True
+    while more:
+        with engine.begin() as connection:
+            upper, more = next_boundary(backfill, connection, lower, batch_size)
+            rows, keys = backfill.apply(connection, lower, upper)
+            if keys:
+                bump_data_version(connection, {(backfill.entity_type, str(key)): 'update' for key in keys})
+            _save_progress(connection, backfill.name, upper if upper is not None else lower,
+                           rows, finished=not more)
+
+        written += rows
+        done_keys = min(done_keys + batch_size, total_keys) if more else total_keys
+        elapsed = time.monotonic() - start
+        rate = done_keys / elapsed if elapsed else 0
+        eta = (total_keys - done_keys) / rate if rate else 0
+        report(f"  {done_keys}/{total_keys} keys, {written} row(s) written "
+               f"({rate:.0f} keys/s, ETA {eta:.0f}s)")
+        lower = upper
+
+    if written:
+        enqueue_rebuilds()
+        db.session.commit()
+    report(f"✓ {backfill.name}: {written} row(s) written in {time.monotonic() - start:.1f}s")
+    return written
+
+
+def main(argv=None, app=None):
+    parser = argparse.ArgumentParser(description='Run set-based, resumable data backfills.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='show the backfills and their progress')
+    run = subparsers.add_parser('run', help='run or resume a backfill')
+    run.add_argument('name', choices=sorted(BACKFILLS))
+    run.add_argument('--dry-run', action='store_true', help='only count the rows it would write')
+    run.add_argument('--batch-size', type=int, default=1000, help='keys per transaction (default 1000)')
+    run.add_argument('--restart', action='store_true', help='forget saved progress and start over')
+    args = parser.parse_args(argv)
+
+    # Database-only app: scripts don't need the web stack
+    app = app or create_db_app()
+    with app.app_context():
+        if args.command == 'list':
+            for name, cls in sorted(BACKFILLS.items()):
+                progress = get_progress(name)
+                if progress is None:
+                    state = 'not run'
+                elif progress.finished_at:
+                    state = f'finished, {progress.rows_written} row(s)'
+                else:
+                    state = f'in progress after {json.loads(progress.last_key)!r}, {progress.rows_written} row(s)'
+                print(f"  {name}: {cls.description} [{state}]")
+            return 0
+        run_backfill(BACKFILLS[args.name](), batch_size=max(1, args.batch_size),
+                     dry_run=args.dry_run, restart=args.restart)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: graph snapshot size and open time for a large synthetic catalog.
+
+Builds a GraphIndex in memory (no database), writes it with
+write_snapshot(), then compares opening the memory-mapped file against
+building the index from rows, and against holding the same graph as the
+JSON payload.
+
+usage:
+python benchmarks/graph_snapshot.py [--genres 2000] [--bands 1000000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from graph_index import GraphIndex  # noqa: E402
+from graph_snapshot import open_snapshot, write_snapshot  # noqa: E402
+
+
+def synthetic_rows(genre_count, band_count):
+    genres = [('root', 'Root', None, 'root')] + [
+        (f'genre-{i}', f'Genre {i}', 'root', 'leaf') for i in range(genre_count)]
+    bands = [(f'band-{i}', f'Band Number {i}', f'genre-{i % genre_count}') for i in range(band_count)]
+    parents = [(f'genre-{i}', 'root') for i in range(genre_count)]
+    memberships = [(f'band-{i}', f'genre-{(i + k * 7) % genre_count}')
+                   for i in range(band_count) for k in range(2)]
+    return genres, bands, parents, memberships
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--genres', type=int, default=2000)
+    parser.add_argument('--bands', type=int, default=1000000)
+    args = parser.parse_args()
+
+    genres, bands, parents, memberships = synthetic_rows(args.genres, args.bands)
+    index, build_time = timed(lambda: GraphIndex.from_rows(1, genres, bands, parents, memberships))
+
+    fd, path = tempfile.mkstemp(suffix='.snapshot')
+    os.close(fd)
+    try:
+        _, write_time = timed(lambda: write_snapshot(index, path))
+        mapped, open_time = timed(lambda: open_snapshot(path))
+        size = os.path.getsize(path)
+        _, lookup_time = timed(lambda: [mapped.band_genres(mapped.band_index(f'band-{i}'))
+                                        for i in range(0, args.bands, max(1, args.bands // 10000))])
+    finally:
+        os.remove(path)
+
+    json_size = len(json.dumps({'genres': genres, 'bands': bands, 'band_genres': memberships}))
+
+    print(f'{args.genres} genres, {args.bands} bands, {len(memberships)} memberships')
+    print(f'build from rows:   {build_time * 1000:9.1f} ms')
+    print(f'write snapshot:    {write_time * 1000:9.1f} ms')
+    print(f'open snapshot:     {open_time * 1000:9.1f} ms (mmap, nothing copied)')
+    print(f'10k band lookups:  {lookup_time * 1000:9.1f} ms')
+    print(f'snapshot size:     {size / 2**20:9.1f} MiB')
+    print(f'JSON of same rows: {json_size / 2**20:9.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
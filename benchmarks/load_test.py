@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Load test: mixed traffic against the app served by Gunicorn.
+
+Starts Gunicorn (gunicorn.conf.py, so the same preload and settings as
+entrypoint.sh) on a fresh SQLite database seeded by init_db.py plus
+--bands synthetic bands, then runs for --duration seconds:
+  - --users anonymous readers: the graph page, /api/graph and
+    /api/graph/changes, with --think-time between requests
+  - one login prober: an admin login through /login every
+    --login-interval seconds (the rate limiter answers 429 past 5/minute)
+  - --writers admins: each logs in once, then adds, edits and deletes
+    its own bands in a loop
+
+and reports, per request type, throughput, latency percentiles, errors and
+rate-limited responses. Reads are also split by whether a write was in
+flight when they started: if they're much slower while writes run, reads
+and writes are contending for locks (SQLite's database lock, PostgreSQL
+row locks, the graph index rebuild).
+
+Run it once per Gunicorn setting to compare (worker count, threads,
+worker class - the GUNICORN_* variables entrypoint.sh passes through).
+Only the standard library is used on the client side.
+
+usage:
+python benchmarks/load_test.py [--duration 30] [--users 20] [--writers 2] [--bands 2000]
+                               [--workers 4] [--threads 1] [--worker-class sync]
+                               [--snapshot] [--job-worker] [--json]
+# Against a server that's already running (its admin login and a leaf genre)
+python benchmarks/load_test.py --url http://localhost:5000 --genre death-metal
+# Against an existing database (e.g. local PostgreSQL) instead of a seeded SQLite file
+python benchmarks/load_test.py --database-url postgresql://... --genre death-metal
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SEED_BANDS = """
+import sys
+from database import create_db_app
+from models import db, Band, Genre, band_genres, bump_data_version, verify_genre_stats
+
+app = create_db_app()
+count = int(sys.argv[1])
+with app.app_context():
+    leaves = [g.id for g in Genre.query.filter_by(type='leaf').order_by(Genre.id)]
+    rows = [{'id': f'load-seed-{i}', 'name': f'Seed Band {i}', 'primary_genre_id': leaves[i % len(leaves)]}
+            for i in range(count)]
+    connection = db.session.connection()
+    if rows:
+        connection.execute(Band.__table__.insert(), rows)
+        connection.execute(band_genres.insert(), [{'band_id': r['id'], 'genre_id': r['primary_genre_id']} for r in rows])
+    bump_data_version(connection, {('all', '*'): 'reset'})
+    db.session.commit()
+    verify_genre_stats(repair=True)
+"""
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+# =============================================================================
+# HTTP client
+# =============================================================================
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # Measure the request itself; a 302 is its answer
+
+
+class Client:
+    """One browser: its own cookies, no redirect following"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, path, form=None):
+        """(status, seconds, body); status 0 for connection errors"""
+        data = None if form is None else urllib.parse.urlencode(form, doseq=True).encode()
+        start = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=self.timeout) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            status = e.code
+        except (urllib.error.URLError, OSError) as e:
+            return 0, time.perf_counter() - start, str(e).encode()
+        return status, time.perf_counter() - start, body
+
+
+# =============================================================================
+# Results
+# =============================================================================
+
+class Recorder:
+    """Latencies and outcomes per request type (thread safe)"""
+
+    def __init__(self):
+        self.samples = {}  # name -> [(seconds, outcome)]
+        self.reads = {True: [], False: []}  # write in flight? -> read latencies
+        self.writes_in_flight = 0
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, outcome, during_write=None):
+        with self._lock:
+            self.samples.setdefault(name, []).append((seconds, outcome))
+            if during_write is not None and outcome == 'ok':
+                self.reads[during_write].append(seconds)
+
+    def write_started(self):
+        with self._lock:
+            self.writes_in_flight += 1
+
+    def write_finished(self):
+        with self._lock:
+            self.writes_in_flight -= 1
+
+    def summary(self, duration):
+        rows = {}
+        for name, samples in sorted(self.samples.items()):
+            latencies = sorted(seconds for seconds, outcome in samples if outcome == 'ok')
+            outcomes = [outcome for _, outcome in samples]
+            rows[name] = {
+                'requests': len(samples),
+                'rps': len(samples) / duration,
+                'ok': len(latencies),
+                'errors': outcomes.count('error'),
+                'rate_limited': outcomes.count('limited'),
+                'error_rate': outcomes.count('error') / len(samples),
+                'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+                'p90_ms': percentile(latencies, 0.90) * 1000 if latencies else None,
+                'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+                'max_ms': latencies[-1] * 1000 if latencies else None,
+            }
+        contention = {}
+        for during_write, label in ((False, 'reads_no_write'), (True, 'reads_during_write')):
+            latencies = sorted(self.reads[during_write])
+            contention[label] = {
+                'requests': len(latencies),
+                'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+                'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+            }
+        total = sum(row['requests'] for row in rows.values())
+        return {'duration_s': duration, 'requests': total, 'rps': total / duration,
+                'errors': sum(row['errors'] for row in rows.values()),
+                'endpoints': rows, 'contention': contention}
+
+
+def outcome_of(status, write=False):
+    if status == 429:
+        return 'limited'
+    if status == 0 or status >= 400:
+        return 'error'
+    if write and status == 200:
+        return 'error'  # The form came back with validation errors
+    return 'ok'
+
+
+# =============================================================================
+# Traffic
+# =============================================================================
+
+def reader(base_url, recorder, deadline, think_time, seed):
+    rng = random.Random(seed)
+    client = Client(base_url)
+    version = 0
+    while time.monotonic() < deadline:
+        choice = rng.random()
+        during_write = recorder.writes_in_flight > 0
+        if choice < 0.5:
+            name, path = 'GET /', '/'
+        elif choice < 0.75:
+            name, path = 'GET /api/graph', '/api/graph'
+        else:
+            name, path = 'GET /api/graph/changes', f'/api/graph/changes?since={version}'
+        status, seconds, body = client.request(path)
+        recorder.record(name, seconds, outcome_of(status), during_write)
+        if status == 200 and path.startswith('/api/'):
+            try:
+                version = json.loads(body).get('version', version)
+            except ValueError:
+                pass
+        if think_time:
+            time.sleep(rng.uniform(0, 2 * think_time))
+
+
+def login(client, username, password):
+    return client.request('/login', {'username': username, 'password': password})
+
+
+def login_prober(base_url, recorder, deadline, interval, username, password):
+    while time.monotonic() < deadline:
+        status, seconds, _ = login(Client(base_url), username, password)
+        # A successful login redirects; 200 means the form came back (bad credentials)
+        recorder.record('POST /login', seconds, 'error' if status == 200 else outcome_of(status))
+        time.sleep(interval)
+
+
+def writer(base_url, recorder, deadline, think_time, seed, genre, username, password):
+    rng = random.Random(seed)
+    client = Client(base_url)
+    while time.monotonic() < deadline:
+        status, seconds, _ = login(client, username, password)
+        recorder.record('POST /login (writer)', seconds, 'error' if status == 200 else outcome_of(status))
+        if status == 302:
+            break
+        time.sleep(5)  # Rate limited: wait for the window to move
+    else:
+        return
+
+    mine = []
+    counter = 0
+    while time.monotonic() < deadline:
+        if len(mine) < 3 or (len(mine) < 20 and rng.random() < 0.4):
+            counter += 1
+            band_id = f'load-{seed}-{counter}'
+            name, path = 'POST /add-band', '/add-band'
+            form = {'id': band_id, 'name': f'Load Band {seed}-{counter}',
+                    'primary_genre_id': genre, 'genres': [genre]}
+        elif rng.random() < 0.7:
+            band_id = rng.choice(mine)
+            name, path = 'POST /edit-band', f'/edit-band/{band_id}'
+            form = {'name': f'Load Band {band_id} {rng.randrange(10**6)}',
+                    'primary_genre_id': genre, 'genres': [genre]}
+        else:
+            band_id = mine.pop(rng.randrange(len(mine)))
+            name, path, form = 'POST /delete-band', f'/delete-band/{band_id}', {}
+
+        recorder.write_started()
+        try:
+            status, seconds, _ = client.request(path, form)
+        finally:
+            recorder.write_finished()
+        outcome = outcome_of(status, write=True)
+        recorder.record(name, seconds, outcome)
+        if name == 'POST /add-band' and outcome == 'ok':
+            mine.append(band_id)
+        if think_time:
+            time.sleep(rng.uniform(0, 2 * think_time))
+
+
+# =============================================================================
+# Server
+# =============================================================================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(base_url, process, timeout=90):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Gunicorn exited during startup')
+        status, _, _ = Client(base_url, timeout=2).request('/login')
+        if status == 200:
+            return
+        time.sleep(0.25)
+    raise RuntimeError(f'Gunicorn not answering after {timeout}s')
+
+
+def start_server(args, workdir):
+    """Seed the database and start Gunicorn (plus worker.py); returns
+    (base URL, processes, log path)"""
+    port = free_port()
+    env = dict(os.environ,
+               SECRET_KEY='load-test', PORT=str(port),
+               GUNICORN_WORKERS=str(args.workers), GUNICORN_THREADS=str(args.threads),
+               GRAPH_SNAPSHOT_PATH=os.path.join(workdir, 'graph.snapshot') if args.snapshot else '')
+    if args.worker_class:
+        env['GUNICORN_WORKER_CLASS'] = args.worker_class
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+    else:
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+        subprocess.run([sys.executable, 'init_db.py'], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([sys.executable, '-c', SEED_BANDS, str(args.bands)], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    log_path = os.path.join(workdir, 'gunicorn.log')
+    log = open(log_path, 'w')
+    processes = [subprocess.Popen([sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'app:app'],
+                                  cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)]
+    if args.job_worker:
+        processes.append(subprocess.Popen([sys.executable, 'worker.py'], cwd=ROOT, env=env,
+                                          stdout=log, stderr=subprocess.STDOUT))
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(base_url, processes[0])
+    except RuntimeError:
+        stop(processes)
+        with open(log_path) as f:
+            sys.stderr.write(f.read()[-4000:])
+        raise
+    return base_url, processes, log_path
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# =============================================================================
+# Report
+# =============================================================================
+
+def format_ms(value):
+    return f'{value:8.1f}' if value is not None else '       -'
+
+
+def print_report(result, args):
+    print(f"\n{args.users} readers, {args.writers} writers, {result['duration_s']:.0f}s"
+          + ('' if args.url else f" - gunicorn: {args.workers} workers x {args.threads} threads"
+             f" ({args.worker_class or 'default'} class)"))
+    print(f"{'request':<24}{'count':>8}{'req/s':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}"
+          f"{'max ms':>9}{'errors':>8}{'429':>6}")
+    for name, row in result['endpoints'].items():
+        print(f"{name:<24}{row['requests']:>8}{row['rps']:>8.1f}{format_ms(row['p50_ms'])} "
+              f"{format_ms(row['p90_ms'])} {format_ms(row['p99_ms'])} {format_ms(row['max_ms'])}"
+              f"{row['errors']:>8}{row['rate_limited']:>6}")
+    print(f"{'total':<24}{result['requests']:>8}{result['rps']:>8.1f}"
+          f"{'':>36}{result['errors']:>8}")
+
+    quiet, busy = result['contention']['reads_no_write'], result['contention']['reads_during_write']
+    print('\nread latency (lock contention check):')
+    print(f"  no write in flight:  p50 {format_ms(quiet['p50_ms'])} ms  p99 {format_ms(quiet['p99_ms'])} ms"
+          f"  ({quiet['requests']} reads)")
+    print(f"  write in flight:     p50 {format_ms(busy['p50_ms'])} ms  p99 {format_ms(busy['p99_ms'])} ms"
+          f"  ({busy['requests']} reads)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--duration', type=float, default=30, help='seconds of traffic (default 30)')
+    parser.add_argument('--users', type=int, default=20, help='concurrent anonymous readers (default 20)')
+    parser.add_argument('--writers', type=int, default=2, help='concurrent admin writers (default 2)')
+    parser.add_argument('--think-time', type=float, default=0.1, help='mean pause between requests, seconds')
+    parser.add_argument('--login-interval', type=float, default=5, help='seconds between login probes (0: none)')
+    parser.add_argument('--bands', type=int, default=2000, help='synthetic bands seeded into the test database')
+    parser.add_argument('--workers', type=int, default=4, help='GUNICORN_WORKERS (default 4)')
+    parser.add_argument('--threads', type=int, default=1, help='GUNICORN_THREADS (default 1)')
+    parser.add_argument('--worker-class', default='', help="GUNICORN_WORKER_CLASS (default: gunicorn.conf.py's)")
+    parser.add_argument('--snapshot', action='store_true', help='share the graph index through a snapshot file')
+    parser.add_argument('--job-worker', action='store_true', help='also run worker.py for background rebuilds')
+    parser.add_argument('--database-url', help='use this (already initialized) database instead of a seeded SQLite file')
+    parser.add_argument('--url', help='test a server that is already running instead of starting one')
+    parser.add_argument('--genre', default='death-metal', help='leaf genre the writers add bands to')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='music-graph-load-')
+    processes = []
+    try:
+        if args.url:
+            base_url = args.url
+        else:
+            base_url, processes, log_path = start_server(args, workdir)
+            print(f'Gunicorn up at {base_url} (log: {log_path})', file=sys.stderr)
+
+        recorder = Recorder()
+        start = time.monotonic()
+        deadline = start + args.duration
+        threads = [threading.Thread(target=reader, args=(base_url, recorder, deadline, args.think_time, i))
+                   for i in range(args.users)]
+        threads += [threading.Thread(target=writer, args=(base_url, recorder, deadline, args.think_time,
+                                                          1000 + i, args.genre, args.username, args.password))
+                    for i in range(args.writers)]
+        if args.login_interval:
+            threads.append(threading.Thread(target=login_prober, args=(
+                base_url, recorder, deadline, args.login_interval, args.username, args.password)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result = recorder.summary(time.monotonic() - start)
+    except BaseException:
+        stop(processes)
+        raise
+    stop(processes)
+    if result['errors'] and processes:
+        print(f'Errors: server log kept in {workdir}', file=sys.stderr)
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result, args)
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark: level-of-detail views on a large synthetic catalog.
+
+Builds a GraphIndex in memory (no database) with a four-level genre tree
+and --bands bands, then times the LevelIndex build (once per data version)
+and reports how many nodes the initial view holds for a few budgets.
+
+usage:
+python benchmarks/lod_view.py [--genres 5000] [--bands 1000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from graph_index import GraphIndex  # noqa: E402
+from graph_lod import LevelIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--genres', type=int, default=5000)
+    parser.add_argument('--bands', type=int, default=1000000)
+    args = parser.parse_args()
+
+    # root -> 20 intermediate -> 400 -> the rest as leaves
+    genres = [('g0', 'Genre 0', None, 'root')]
+    for i in range(1, args.genres):
+        parent = 0 if i <= 20 else (i % 20) + 1 if i <= 420 else (i % 400) + 21
+        genres.append((f'g{i}', f'Genre {i}', f'g{parent}', 'leaf'))
+    bands = [(f'b{i}', f'Band {i}', f'g{420 + i % (args.genres - 420)}') for i in range(args.bands)]
+    index = GraphIndex.from_rows(1, genres, bands, [], [(b[0], b[2]) for b in bands])
+
+    start = time.perf_counter()
+    levels = LevelIndex(index)
+    build_time = time.perf_counter() - start
+
+    print(f'{args.genres} genres, {args.bands} bands ({args.genres + args.bands} nodes)')
+    print(f'level index build: {build_time * 1000:8.1f} ms (once per data version)')
+    print(f'genres per level (cumulative): {levels.level_sizes}')
+    for budget in (100, 500, 2000, 10000):
+        level, view = levels.view(budget)
+        clusters = sum(1 for g in view if levels.depth[g] == level and levels.children[g])
+        print(f'budget {budget:>6}: level {level}, {len(view):>5} nodes ({clusters} clusters)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /api/path search latency on a large synthetic catalog.
+
+Builds a GraphIndex in memory (no database) with --bands bands in two
+genres each, then times PathIndex.shortest_path() between random pairs of
+bands - the worst case, since each end starts in a crowded genre.
+The result cache is bypassed.
+
+usage:
+python benchmarks/path_latency.py [--genres 2000] [--bands 1000000] [--queries 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from graph_index import GraphIndex  # noqa: E402
+from graph_paths import PathIndex  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--genres', type=int, default=2000)
+    parser.add_argument('--bands', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--max-depth', type=int, default=8)
+    args = parser.parse_args()
+
+    # A root, 50 intermediate genres and leaves under them
+    genres = [('root', 'Root', None, 'root')] + [
+        (f'g{i}', f'Genre {i}', 'root' if i < 50 else f'g{i % 50}', 'leaf') for i in range(args.genres)]
+    bands = [(f'b{i}', f'Band {i}', f'g{i % args.genres}') for i in range(args.bands)]
+    index = GraphIndex.from_rows(
+        1, genres, bands,
+        [(genre_id, parent_id) for genre_id, _, parent_id, _ in genres if parent_id],
+        [(f'b{i}', f'g{(i + k * 37) % args.genres}') for i in range(args.bands) for k in range(2)])
+
+    start = time.perf_counter()
+    path_index = PathIndex(index)
+    build_time = time.perf_counter() - start
+
+    rng = random.Random(1)
+    timings = []
+    lengths = []
+    for _ in range(args.queries):
+        source = path_index.node(f'b{rng.randrange(args.bands)}')
+        target = path_index.node(f'b{rng.randrange(args.bands)}')
+        start = time.perf_counter()
+        path = path_index.shortest_path(source, target, args.max_depth)
+        timings.append(time.perf_counter() - start)
+        lengths.append(len(path) - 1 if path else None)
+    timings.sort()
+
+    print(f'{args.genres} genres, {args.bands} bands ({args.genres + args.bands} nodes)')
+    print(f'path index build: {build_time * 1000:8.1f} ms (once per data version)')
+    print(f'p50:              {percentile(timings, 0.50) * 1000:8.2f} ms')
+    print(f'p99:              {percentile(timings, 0.99) * 1000:8.2f} ms')
+    print(f'max:              {timings[-1] * 1000:8.2f} ms')
+    print(f'paths found:      {sum(1 for n in lengths if n is not None)}/{args.queries}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ORM objects vs read models for the admin band listing.
+
+Loads every band with its primary genre and genre names, the data the
+admin table shows, three ways:
+  - orm lazy:    Band.query.all(), relationships lazy loaded per row (the
+                 old admin page; only run on a sample, it's one query per row)
+  - orm eager:   Band.query with selectinload() for both relationships
+  - read models: read_models.list_bands()
+
+Reports wall time and peak traced memory, scaled to 100k rows.
+
+usage:
+python benchmarks/read_models.py [--bands 100000] [--lazy-sample 2000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+PER_ROWS = 100000
+
+
+def measure(app, func):
+    """(seconds, peak bytes) for func() in a fresh session.
+
+    Timed and traced in separate runs: tracemalloc slows allocation down a lot.
+    """
+    from models import db
+    with app.app_context():
+        db.session.remove()
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        db.session.remove()
+
+        gc.collect()
+        tracemalloc.start()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        db.session.remove()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--bands', type=int, default=PER_ROWS)
+    parser.add_argument('--lazy-sample', type=int, default=2000)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from sqlalchemy.orm import selectinload
+    from database import create_db_app
+    from models import db, Genre, Band, band_genres
+    from read_models import list_bands
+
+    genre_count = 500
+    app = create_db_app()
+    try:
+        with app.app_context():
+            db.create_all()
+            db.session.execute(db.insert(Genre), [
+                {'id': f'g{i}', 'name': f'Genre {i}', 'type': 'leaf'} for i in range(genre_count)])
+            db.session.execute(db.insert(Band), [
+                {'id': f'b{i}', 'name': f'Band {i}', 'primary_genre_id': f'g{i % genre_count}'}
+                for i in range(args.bands)])
+            db.session.execute(band_genres.insert(), [
+                {'band_id': f'b{i}', 'genre_id': f'g{(i + k) % genre_count}'}
+                for i in range(args.bands) for k in range(2)])
+            db.session.commit()
+
+        def orm_lazy():
+            bands = Band.query.order_by(Band.name).limit(args.lazy_sample).all()
+            return [(b.name, b.primary_genre.name, [g.name for g in b.genres]) for b in bands]
+
+        def orm_eager():
+            bands = (Band.query.options(selectinload(Band.primary_genre), selectinload(Band.genres))
+                     .order_by(Band.name).all())
+            return [(b.name, b.primary_genre.name, [g.name for g in b.genres]) for b in bands]
+
+        results = [
+            ('orm lazy', args.lazy_sample, measure(app, orm_lazy)),
+            ('orm eager', args.bands, measure(app, orm_eager)),
+            ('read models', args.bands, measure(app, list_bands)),
+        ]
+    finally:
+        os.remove(db_path)
+
+    print(f'{args.bands} bands, 2 genres each (figures per {PER_ROWS} rows)')
+    print(f'{"":<12} {"time":>10} {"peak memory":>14}')
+    for label, rows, (elapsed, peak) in results:
+        scale = PER_ROWS / rows
+        print(f'{label:<12} {elapsed * scale:>8.2f} s {peak * scale / 2**20:>10.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark: container startup checks, old entrypoint vs bootstrap.py.
+
+The old entrypoint.sh ran two separate Python processes before Gunicorn:
+a SQLAlchemy `SELECT 1` probe, then a full `from app import app` just to
+run `Genre.query.first()`. bootstrap.py does both checks in one process
+that never imports Flask.
+
+usage:
+python benchmarks/startup_time.py [--runs 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+OLD_PROBE = """
+from sqlalchemy import create_engine, text
+import os
+engine = create_engine(os.environ['DATABASE_URL'])
+with engine.connect() as conn:
+    conn.execute(text('SELECT 1'))
+"""
+
+OLD_CHECK = """
+from app import app
+from models import db, Genre
+with app.app_context():
+    Genre.query.first()
+"""
+
+
+def run(commands, env):
+    """Wall time to run the commands one after another"""
+    start = time.perf_counter()
+    for command in commands:
+        subprocess.run(command, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+    try:
+        subprocess.run([sys.executable, 'init_db.py'], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+        old = [sys.executable, '-c', OLD_PROBE], [sys.executable, '-c', OLD_CHECK]
+        new = [[sys.executable, 'bootstrap.py', '--check']]
+        old_times = [run(old, env) for _ in range(args.runs)]
+        new_times = [run(new, env) for _ in range(args.runs)]
+    finally:
+        os.remove(db_path)
+
+    old_median = statistics.median(old_times)
+    new_median = statistics.median(new_times)
+    print(f'old entrypoint checks: {old_median * 1000:7.1f} ms (median of {args.runs})')
+    print(f'bootstrap.py --check:  {new_median * 1000:7.1f} ms (median of {args.runs})')
+    print(f'speedup:               {old_median / new_median:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory per Gunicorn worker as the worker count grows.
+
+Starts Gunicorn with gunicorn.conf.py against a generated catalog, sends a
+few requests so every worker has rendered the graph, then reads each
+worker's memory from /proc/<pid>/smaps_rollup:
+  - private: pages only this worker uses (what each extra worker costs)
+  - pss:     proportional set size (shared pages split between processes)
+
+Linux only.
+
+usage:
+python benchmarks/worker_memory.py [--workers 1 2 4] [--genres 500] [--bands 50000]
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+PORT = 5091
+
+
+def populate(genre_count, band_count):
+    """Fill the database named by DATABASE_URL with a synthetic catalog"""
+    from database import create_db_app
+    from models import db, Genre, Band, genre_parents, band_genres
+
+    app = create_db_app()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Genre), [{'id': 'root', 'name': 'Root', 'type': 'root'}] + [
+            {'id': f'g{i}', 'name': f'Genre {i}', 'type': 'leaf', 'parent_id': 'root'}
+            for i in range(genre_count)])
+        db.session.execute(genre_parents.insert(), [
+            {'genre_id': f'g{i}', 'parent_genre_id': 'root'} for i in range(genre_count)])
+        db.session.execute(db.insert(Band), [
+            {'id': f'b{i}', 'name': f'Band {i}', 'primary_genre_id': f'g{i % genre_count}'}
+            for i in range(band_count)])
+        db.session.execute(band_genres.insert(), [
+            {'band_id': f'b{i}', 'genre_id': f'g{(i + k) % genre_count}'}
+            for i in range(band_count) for k in range(2)])
+        db.session.commit()
+
+
+def memory_kib(pid):
+    """(private, pss) in KiB from smaps_rollup"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields['Private_Clean'] + fields['Private_Dirty'], fields['Pss']
+
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def measure(workers, env):
+    """Average (private, pss) KiB per worker for a Gunicorn with `workers` workers"""
+    env = dict(env, GUNICORN_WORKERS=str(workers), PORT=str(PORT))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{PORT}/api/graph').read()
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError('Gunicorn did not start')
+                time.sleep(0.2)
+        # Enough requests that every worker has served the graph at least once
+        for _ in range(workers * 4):
+            urllib.request.urlopen(f'http://127.0.0.1:{PORT}/api/graph').read()
+
+        samples = [memory_kib(pid) for pid in worker_pids(server.pid)]
+        return (sum(s[0] for s in samples) / len(samples),
+                sum(s[1] for s in samples) / len(samples))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--genres', type=int, default=500)
+    parser.add_argument('--bands', type=int, default=50000)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', GRAPH_STREAM_ENABLED='')
+    os.environ['DATABASE_URL'] = env['DATABASE_URL']
+    try:
+        populate(args.genres, args.bands)
+        print(f'{args.genres} genres, {args.bands} bands')
+        print(f'{"workers":>8} {"private/worker":>16} {"pss/worker":>12}')
+        for workers in args.workers:
+            private, pss = measure(workers, env)
+            print(f'{workers:>8} {private / 1024:>13.1f} MiB {pss / 1024:>8.1f} MiB')
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Container startup check: wait for the database, then make sure the schema
+is there before Gunicorn starts: an empty database is initialized, and
+tables added since an existing database was initialized are created.
+
+Replaces the two inline Python snippets entrypoint.sh used to run (a
+`SELECT 1` loop and a full `from app import app` just to query the genres
+table). This script only imports SQLAlchemy, so it costs a fraction of an
+app import - the app itself is imported once, by `gunicorn --preload`.
+
+usage:
+# Wait for the database, initialize it if it's empty, create missing tables
+python bootstrap.py
+# Only wait and report the schema status (never initializes)
+python bootstrap.py --check
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import DBAPIError
+
+from config import Config
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Every table in models.py, checked by name so this check doesn't import
+# the models (tests/test_bootstrap.py keeps the list in sync)
+APP_TABLES = ('genres', 'genre_parents', 'bands', 'band_genres', 'users', 'data_version',
+              'change_log', 'genre_stats', 'jobs', 'backfill_progress', 'graph_analytics',
+              'similarity_panels')
+
+
+def wait_for_database(engine, timeout=60, initial_delay=0.25, max_delay=5):
+    """Retry `SELECT 1` with exponential backoff until it works.
+
+    Returns the number of attempts it took; re-raises the last error once
+    `timeout` seconds have passed.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+            return attempt
+        except DBAPIError as e:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise
+            print(f"Waiting for database connection (attempt {attempt}, "
+                  f"retrying in {min(delay, remaining):.1f}s): {e.orig}")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+
+def migration_heads(migrations_dir):
+    """Head revisions of the Alembic migration scripts.
+
+    Parses `revision`/`down_revision` out of the files instead of importing
+    Alembic, which keeps this check cheap.
+    """
+    revisions = set()
+    parents = set()
+    for path in glob.glob(os.path.join(migrations_dir, 'versions', '*.py')):
+        with open(path) as f:
+            source = f.read()
+        revision = re.search(r"^revision\s*=\s*['\"]([^'\"]+)['\"]", source, re.M)
+        down_revision = re.search(r"^down_revision\s*=\s*(.+)$", source, re.M)
+        if revision:
+            revisions.add(revision.group(1))
+        if down_revision:
+            parents.update(re.findall(r"['\"]([^'\"]+)['\"]", down_revision.group(1)))
+    return revisions - parents
+
+
+def missing_tables(inspector):
+    """App tables the database doesn't have"""
+    return [name for name in APP_TABLES if not inspector.has_table(name)]
+
+
+def create_missing_tables(engine, names):
+    """Create the app tables in `names` on a database initialized before
+    they existed, and fill the ones derived from existing rows"""
+    # Only imported when there's something to create
+    from models import compute_genre_stats, db, write_genre_stats
+
+    with engine.begin() as conn:
+        db.metadata.create_all(conn, tables=[db.metadata.tables[name] for name in names])
+        if 'genre_stats' in names:
+            write_genre_stats(conn, compute_genre_stats(conn))
+
+
+def check_schema(engine, migrations_dir=None):
+    """Work out whether the database schema is ready.
+
+    Returns (status, detail) where status is one of:
+      'missing'     - no application tables, database needs initializing
+      'incomplete'  - some app tables are missing (added after it was initialized)
+      'unversioned' - tables exist but Flask-Migrate has never stamped them
+      'outdated'    - alembic_version doesn't match the migration scripts
+      'current'     - tables exist and alembic_version is at head
+    """
+    migrations_dir = migrations_dir or os.path.join(basedir, 'migrations')
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        if not inspector.has_table('genres'):
+            return 'missing', 'genres table not found'
+        missing = missing_tables(inspector)
+        if missing:
+            return 'incomplete', f'missing {", ".join(missing)}'
+        if not inspector.has_table('alembic_version'):
+            return 'unversioned', 'no alembic_version table'
+        versions = set(conn.execute(text('SELECT version_num FROM alembic_version')).scalars())
+
+    heads = migration_heads(migrations_dir)
+    if not heads:
+        return 'current', f'at {", ".join(sorted(versions))} (no migration scripts to compare)'
+    if versions != heads:
+        return 'outdated', f'database at {", ".join(sorted(versions)) or "nothing"}, scripts at {", ".join(sorted(heads))}'
+    return 'current', f'at {", ".join(sorted(versions))}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Wait for the database and check the schema.')
+    parser.add_argument('--check', action='store_true', help='only report, never initialize')
+    parser.add_argument('--timeout', type=float, default=float(os.environ.get('DB_WAIT_TIMEOUT', 60)),
+                        help='seconds to wait for the database (default 60)')
+    args = parser.parse_args(argv)
+
+    start = time.monotonic()
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+    try:
+        try:
+            attempts = wait_for_database(engine, timeout=args.timeout)
+        except DBAPIError as e:
+            print(f"ERROR: Database not reachable after {args.timeout:.0f}s: {e.orig}")
+            return 1
+        print(f"Database ready after {attempts} attempt(s)")
+
+        status, detail = check_schema(engine)
+        print(f"Schema {status}: {detail}")
+        if status == 'incomplete' and not args.check:
+            with engine.connect() as conn:
+                missing = missing_tables(inspect(conn))
+            print(f"Creating missing tables: {', '.join(missing)}")
+            create_missing_tables(engine, missing)
+            status, detail = check_schema(engine)
+            print(f"Schema {status}: {detail}")
+    finally:
+        engine.dispose()
+
+    if status == 'missing' and not args.check:
+        print("Initializing database...")
+        # Only imported on first run
+        from init_db import init_database
+        init_database()
+    elif status == 'outdated':
+        print("WARNING: Run 'flask db upgrade' to apply pending migrations")
+
+    print(f"Bootstrap finished in {time.monotonic() - start:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
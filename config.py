@@ -11,4 +11,82 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'music_graph.db')
 
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Optional read replica (see db_routing.py): read-only pages and JSON
+    # endpoints query it; writes, and a browser's reads for
+    # REPLICA_READ_AFTER_WRITE_SECONDS after it wrote, use the primary
+    SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_REPLICA_URL']} \
+        if os.environ.get('DATABASE_REPLICA_URL') else {}
+    REPLICA_READ_AFTER_WRITE_SECONDS = int(os.environ.get('REPLICA_READ_AFTER_WRITE_SECONDS', 10))
+
+    # Live graph updates: open pages poll /api/graph/changes every
+    # GRAPH_POLL_INTERVAL seconds. Set GRAPH_STREAM_ENABLED to push change
+    # notifications over Server-Sent Events instead (each open stream keeps
+    # a worker busy, so only enable it with threaded/async workers).
+    GRAPH_POLL_INTERVAL = int(os.environ.get('GRAPH_POLL_INTERVAL', 30))
+    GRAPH_STREAM_ENABLED = os.environ.get('GRAPH_STREAM_ENABLED', '').lower() in ('1', 'true', 'yes')
+    GRAPH_STREAM_CHECK_INTERVAL = 2  # Seconds between data version checks per stream
+    GRAPH_CHANGES_LIMIT = 1000  # Bigger patches tell the client to reload instead
+    # The worker prunes the change log to this many versions; pages further
+    # behind than that reload the whole graph
+    CHANGE_LOG_KEEP_VERSIONS = int(os.environ.get('CHANGE_LOG_KEEP_VERSIONS', 10000))
+
+    # Catalogs with more genres + bands than this start the page as a
+    # clustered level-of-detail view (see graph_lod.py) that never holds more
+    # nodes than this. 0 always draws the whole graph.
+    GRAPH_NODE_BUDGET = int(os.environ.get('GRAPH_NODE_BUDGET', 2000))
+
+    # Binary graph snapshot (see graph_snapshot.py): when set, the graph
+    # index is written here after each data change (by the background
+    # worker) and memory-mapped by every process. Empty disables it. Delete
+    # the file after restoring a database backup. Until the worker's new
+    # snapshot appears, processes keep serving the previous graph for up to
+    # GRAPH_SNAPSHOT_WAIT seconds, then build it themselves (e.g. no worker)
+    GRAPH_SNAPSHOT_PATH = os.environ.get('GRAPH_SNAPSHOT_PATH', '')
+    GRAPH_SNAPSHOT_WAIT = float(os.environ.get('GRAPH_SNAPSHOT_WAIT', 30))
+
+    # Memoized read queries (see query_cache.py): results kept per data
+    # version, at most this many in each process. 0 disables the cache.
+    QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', 256))
+
+    # Static export of the public graph page (see static_site.py): when set,
+    # `flask graph freeze` writes here by default and the worker rewrites it
+    # after each data change. Empty disables the automatic rewrite.
+    STATIC_SITE_DIR = os.environ.get('STATIC_SITE_DIR', '')
+
+    # Background jobs (see jobs.py; run `python worker.py`): queued jobs wait
+    # JOB_COALESCE_SECONDS so bursts of edits share one run, failures retry
+    # after JOB_RETRY_DELAY seconds (doubling) up to JOB_MAX_ATTEMPTS times,
+    # and a job running longer than JOB_TIMEOUT seconds is assumed lost
+    JOB_COALESCE_SECONDS = float(os.environ.get('JOB_COALESCE_SECONDS', 2))
+    JOB_RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', 10))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 600))
+
+    # Graph analytics (/api/analytics/*): betweenness on the band-genre graph
+    # is estimated from this many source nodes (0 = exact, slow on big catalogs)
+    ANALYTICS_BETWEENNESS_SAMPLES = int(os.environ.get('ANALYTICS_BETWEENNESS_SAMPLES', 50))
+
+    # "Similar genres" / "Related bands" shown in the detail panel
+    SIMILARITY_TOP_K = int(os.environ.get('SIMILARITY_TOP_K', 5))
+
+    # /api/path: longest connection searched for (in edges)
+    PATH_MAX_DEPTH = int(os.environ.get('PATH_MAX_DEPTH', 8))
+
+    # Performance instrumentation, off by default since anyone can read it:
+    # Server-Timing header on every response and Prometheus metrics at
+    # /metrics (set METRICS_TOKEN to require "Authorization: Bearer <token>"
+    # for scrapes - do, unless only your network can reach the app)
+    SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', '').lower() in ('1', 'true', 'yes')
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Opt-in profiling for dev/staging (see profiling.py): N+1 and slow query
+    # warnings with EXPLAIN plans, plus cProfile dumps of slow requests
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PROFILE_N_PLUS_ONE_THRESHOLD = int(os.environ.get('PROFILE_N_PLUS_ONE_THRESHOLD', 5))
+    PROFILE_SLOW_QUERY_MS = float(os.environ.get('PROFILE_SLOW_QUERY_MS', 100))
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 1.0))
+    PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', 500))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(basedir, 'profiles')
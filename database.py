@@ -0,0 +1,39 @@
+"""
+Lightweight database-only entry point for CLI scripts and workers.
+
+`from app import app` builds the whole web application (routes, login,
+rate limiting, migrations, metrics) just to reach `db`. Scripts like
+init_db.py only need an app context for Flask-SQLAlchemy, so they use
+create_db_app() and never import the web-only extensions.
+
+usage:
+from database import create_db_app
+with create_db_app().app_context():
+    ...
+
+Migrations can run with the same small app (Flask-Migrate only, no web
+extensions):
+flask --app database:create_migrate_app db upgrade
+"""
+
+from flask import Flask
+
+from config import Config
+from models import db
+
+
+def create_db_app(config_class=Config):
+    """Minimal Flask app with just the database configured"""
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    db.init_app(app)
+    return app
+
+
+def create_migrate_app(config_class=Config):
+    """Database app plus Flask-Migrate, for `flask db ...` commands"""
+    from flask_migrate import Migrate  # Pulls in Alembic - only needed here
+
+    app = create_db_app(config_class)
+    Migrate(app, db)
+    return app
@@ -0,0 +1,78 @@
+"""
+Read-replica routing.
+
+When DATABASE_REPLICA_URL is set, the replica is registered as the
+'replica' bind and GET/HEAD requests to views marked with @replica_reads
+(the graph page, the JSON read endpoints, the admin listings) run their
+queries against it. Everything else uses the primary:
+  - writes: any flush goes to the primary, and once a request has flushed
+    the rest of it reads from the primary too
+  - read-after-write: a request that wrote sets a short-lived cookie, and
+    while it's there that browser reads from the primary, so the redirect
+    after add_band() shows the new band even if the replica lags. Keep
+    REPLICA_READ_AFTER_WRITE_SECONDS above the replica's usual lag.
+  - scripts, workers and background threads (no request context)
+
+Without a replica URL nothing changes: every query goes to the primary.
+
+Local testing with two SQLite files (copy the primary to fake a replica,
+edit one of them to see which is read):
+  cp music_graph.db replica.db
+  DATABASE_REPLICA_URL=sqlite:///$PWD/replica.db python app.py
+"""
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+READ_PRIMARY_COOKIE = 'read_primary'
+
+
+def replica_reads(view):
+    """Mark a view whose GET/HEAD requests may read from the replica"""
+    view.replica_reads = True
+    return view
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends reads to the replica when the
+    current request was routed there"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _reading_from_replica():
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _reading_from_replica():
+    return has_request_context() and g.get('_db_replica', False)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _wrote(session, flush_context):
+    if has_request_context():
+        g._db_wrote = True
+        g._db_replica = False  # Read our own writes for the rest of the request
+
+
+def _choose_database(app):
+    view = app.view_functions.get(request.endpoint)
+    g._db_replica = (getattr(view, 'replica_reads', False)
+                     and request.method in ('GET', 'HEAD')
+                     and READ_PRIMARY_COOKIE not in request.cookies)
+
+
+def _stick_to_primary(app, response):
+    if g.get('_db_wrote'):
+        response.set_cookie(READ_PRIMARY_COOKIE, '1', httponly=True, samesite='Lax',
+                            max_age=app.config['REPLICA_READ_AFTER_WRITE_SECONDS'])
+    return response
+
+
+def init_routing(app):
+    """Route marked read-only requests to the replica, if one is configured"""
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+    app.before_request(lambda: _choose_database(app))
+    app.after_request(lambda response: _stick_to_primary(app, response))
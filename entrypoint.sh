@@ -52,51 +52,45 @@ fi
 # Wait for PostgreSQL and start application
 # =============================================================================
 
-echo "Waiting for PostgreSQL..."
 echo "DATABASE_URL format: $(echo $DATABASE_URL | sed 's/:.*@/:***@/')"  # Mask password
-until python3 -c "
-from sqlalchemy import create_engine, text
-import os
-engine = create_engine(os.environ['DATABASE_URL'])
-with engine.connect() as conn:
-    conn.execute(text('SELECT 1'))
-"; do
-  echo "Waiting for database connection..."
-  sleep 2
-done
 
-echo "PostgreSQL ready!"
-
-# Check if database is already initialized
-echo "Checking if database needs initialization..."
-set +e  # Temporarily disable exit on error
-python -c "
-from app import app
-from models import db, Genre
-with app.app_context():
-    try:
-        # Try to query a table - if it works, DB is initialized
-        Genre.query.first()
-        print('Database tables exist')
-        exit(0)
-    except Exception as e:
-        print(f'Database needs initialization: {e}')
-        exit(1)
-"
-DB_CHECK_EXIT=$?
-set -e  # Re-enable exit on error
-
-# If previous command failed (exit code 1), initialize database
-if [ $DB_CHECK_EXIT -eq 1 ]; then
-    echo "Initializing database..."
-    python init_db.py || {
-        echo "ERROR: Database initialization failed!"
-        exit 1
-    }
-else
-    echo "Skipping database initialization (already exists)"
-fi
+# Wait for the database (exponential backoff) and initialize it if empty.
+# bootstrap.py only imports SQLAlchemy, not the whole app.
+python bootstrap.py || {
+    echo "ERROR: Database bootstrap failed!"
+    exit 1
+}
+
+# Graph snapshot shared by all workers (memory-mapped). Start from a clean
+# file so a snapshot never outlives the database it was built from.
+export GRAPH_SNAPSHOT_PATH="${GRAPH_SNAPSHOT_PATH:-/tmp/music-graph/graph.snapshot}"
+rm -f "$GRAPH_SNAPSHOT_PATH"
+
+# Background job worker (jobs.py): rebuilds after admin edits run here, not
+# in requests. Started after the snapshot path is set - it writes the file.
+# Restarted whenever it exits, so jobs never pile up behind a dead worker.
+. "$(dirname "$0")/supervise.sh"
+supervise_worker python worker.py &
+WORKER_PID=$!
 
 # Start application with Gunicorn (production WSGI server)
+# gunicorn.conf.py preloads the app and the graph index in the master
+# process; workers are forked from it and share that memory
 echo "Starting application with Gunicorn..."
-exec gunicorn --bind 0.0.0.0:5000 --workers 2 app:app
\ No newline at end of file
+gunicorn --config gunicorn.conf.py app:app &
+GUNICORN_PID=$!
+
+# This shell stays PID 1: pass SIGTERM/SIGINT on to Gunicorn and the worker
+# (both shut down gracefully), and stop the container when Gunicorn exits
+stop_children() {
+    kill -TERM "$GUNICORN_PID" "$WORKER_PID" 2>/dev/null || true
+}
+trap stop_children TERM INT
+
+status=0
+while kill -0 "$GUNICORN_PID" 2>/dev/null; do
+    wait "$GUNICORN_PID" && status=0 || status=$?  # Returns early on a trapped signal
+done
+stop_children
+wait "$WORKER_PID" 2>/dev/null || true
+exit "$status"
@@ -0,0 +1,297 @@
+"""
+Graph data serializer for the main page.
+
+Builds everything index.html needs (vis.js nodes and edges plus the detail
+panel data) as one plain dict. The template embeds it with the `tojson`
+filter, so names like "Guns N' Roses" or "</script>" can never break the
+page, and the whole payload is escaped once instead of field by field.
+
+The same builder produces the small patches served by /api/graph/changes,
+so open pages can update in place after an edit instead of reloading.
+
+Full builds read from the per-process graph index (graph_index.py) instead
+of querying every table again, so they cost one version check while the
+data hasn't changed.
+"""
+
+import math
+
+from graph_index import get_graph_index
+from models import db, Genre, Band, GenreStats, genre_parents, band_genres, get_changed_entities, get_data_version
+from read_models import GenreRow, BandRow
+
+# Node size by hierarchy level (root=large, intermediate=medium, leaf=small)
+GENRE_SIZES = {'root': 40, 'intermediate': 25, 'leaf': 15}
+# Plus up to this much for the bands in the genre's subtree (log scale)
+GENRE_SIZE_MAX_BONUS = 20
+
+
+def genre_edge_id(genre_id):
+    """Edge id for the genre -> primary parent connection (one per genre)"""
+    return f'parent:{genre_id}'
+
+
+def band_edge_id(band_id):
+    """Edge id for the band -> primary genre connection (one per band)"""
+    return f'primary:{band_id}'
+
+
+def genre_size(genre_type, subtree_bands=0):
+    """Node size: the level's base size, grown by the genre's band count"""
+    bonus = min(GENRE_SIZE_MAX_BONUS, round(3 * math.log2(1 + subtree_bands)))
+    return GENRE_SIZES.get(genre_type, GENRE_SIZES['leaf']) + bonus
+
+
+def genre_node(genre_id, name, genre_type, subtree_bands=0):
+    return {
+        'id': genre_id,
+        'label': name,
+        'shape': 'dot',
+        'size': genre_size(genre_type, subtree_bands),
+        'color': '#4CAF50',
+        'group': 'genre',
+        'bandCount': subtree_bands,
+    }
+
+
+def band_node(band_id, name, primary_genre_id):
+    # Bands are hidden by default and shown when their genre is expanded
+    return {
+        'id': band_id,
+        'label': name,
+        'shape': 'text',
+        'font': {'color': '#ffffff', 'size': 14},
+        'hidden': True,
+        'group': 'band',
+        'parentGenre': primary_genre_id,
+    }
+
+
+def _genre_columns():
+    """Select for GenreRow columns (the counter comes from genre_stats)"""
+    return (db.select(Genre.id, Genre.name, Genre.parent_id, Genre.type,
+                      db.func.coalesce(GenreStats.subtree_bands, 0))
+            .outerjoin(GenreStats, GenreStats.genre_id == Genre.id))
+
+
+def load_graph_rows(genre_ids=None, band_ids=None):
+    """Load the raw rows behind the graph with column-only queries.
+
+    A handful of queries no matter how big the catalog is - no ORM objects,
+    no lazy loads while the template renders. Pass genre_ids/band_ids to
+    load just those genres and bands (plus what their panels reference).
+    """
+    if genre_ids is None and band_ids is None:
+        genres = [GenreRow._make(row) for row in db.session.execute(
+            _genre_columns())]
+        bands = [BandRow._make(row) for row in db.session.execute(
+            db.select(Band.id, Band.name, Band.primary_genre_id))]
+        return {
+            'genres': genres,
+            'bands': bands,
+            'genre_parents': db.session.execute(
+                db.select(genre_parents.c.genre_id, genre_parents.c.parent_genre_id)).all(),
+            'band_genres': db.session.execute(
+                db.select(band_genres.c.band_id, band_genres.c.genre_id)).all(),
+            'children': [(g.id, g.parent_id) for g in genres if g.parent_id],
+            'genre_names': {g.id: g.name for g in genres},
+            'band_names': {b.id: b.name for b in bands},
+        }
+
+    genre_ids = list(genre_ids or [])
+    band_ids = list(band_ids or [])
+    genres = [GenreRow._make(row) for row in db.session.execute(
+        _genre_columns().where(Genre.id.in_(genre_ids)))]
+    bands = [BandRow._make(row) for row in db.session.execute(
+        db.select(Band.id, Band.name, Band.primary_genre_id)
+        .where(Band.id.in_(band_ids)))]
+    parent_rows = db.session.execute(
+        db.select(genre_parents.c.genre_id, genre_parents.c.parent_genre_id)
+        .where(genre_parents.c.genre_id.in_(genre_ids))).all()
+    membership_rows = db.session.execute(
+        db.select(band_genres.c.band_id, band_genres.c.genre_id)
+        .where(db.or_(band_genres.c.band_id.in_(band_ids),
+                      band_genres.c.genre_id.in_(genre_ids)))).all()
+    children = db.session.execute(
+        db.select(Genre.id, Genre.parent_id).where(Genre.parent_id.in_(genre_ids))).all()
+
+    # Names of everything the panels link to
+    linked_genres = set(genre_ids) | {b.primary_genre_id for b in bands}
+    linked_genres |= {g.parent_id for g in genres if g.parent_id}
+    linked_genres |= {parent_id for _, parent_id in parent_rows}
+    linked_genres |= {genre_id for _, genre_id in membership_rows}
+    linked_genres |= {child_id for child_id, _ in children}
+    linked_bands = set(band_ids) | {band_id for band_id, _ in membership_rows}
+
+    return {
+        'genres': genres,
+        'bands': bands,
+        'genre_parents': parent_rows,
+        'band_genres': membership_rows,
+        'children': children,
+        'genre_names': dict(db.session.execute(
+            db.select(Genre.id, Genre.name).where(Genre.id.in_(linked_genres))).all()),
+        'band_names': dict(db.session.execute(
+            db.select(Band.id, Band.name).where(Band.id.in_(linked_bands))).all()),
+    }
+
+
+def build_graph_data(genre_ids=None, band_ids=None, version=None):
+    """Build the nodes, edges and entity (detail panel) data for the graph.
+
+    Returns a dict with 'version', 'nodes', 'edges' and 'entities' keys that
+    can be passed straight to the `tojson` filter or jsonify(). With
+    genre_ids/band_ids only those genres and bands are included. Pass
+    `version` if the caller has just read the data version.
+    """
+    # Read the version first: if a write sneaks in while we build, the
+    # client just fetches it again as a change
+    if version is None:
+        version = get_data_version()
+    if genre_ids is None and band_ids is None:
+        index = get_graph_index(version)
+        version = index.version  # Label the rows with what they are
+        rows = index.rows()
+    else:
+        rows = load_graph_rows(genre_ids, band_ids)
+    return build_graph_payload(rows, version)
+
+
+def build_graph_payload(rows, version):
+    """Nodes, edges and entities for rows from load_graph_rows() or the
+    graph index (GraphIndex.rows()/rows_for()). Lists the rows cut short
+    ('band_totals', 'child_totals') say how many were left out ('more')."""
+    genre_names = rows['genre_names']
+    band_names = rows['band_names']
+
+    # Build the lookup tables once instead of lazy loading per genre/band
+    parents_of = {}
+    for genre_id, parent_id in rows['genre_parents']:
+        parents_of.setdefault(genre_id, []).append(parent_id)
+    genres_of = {}
+    bands_of = {}
+    for band_id, genre_id in rows['band_genres']:
+        genres_of.setdefault(band_id, []).append(genre_id)
+        bands_of.setdefault(genre_id, []).append(band_id)
+    children_of = {}
+    for genre_id, parent_id in rows['children']:
+        children_of.setdefault(parent_id, []).append(genre_id)
+
+    nodes = []
+    edges = []
+    genre_entities = {}
+    band_entities = {}
+
+    for genre in rows['genres']:
+        nodes.append(genre_node(genre.id, genre.name, genre.type, genre.subtree_bands))
+        if genre.parent_id:
+            edges.append({'id': genre_edge_id(genre.id), 'from': genre.id, 'to': genre.parent_id})
+
+        fields = [
+            {'label': 'Type', 'value': genre.type, 'badge': True},
+            {'label': 'Bands (incl. subgenres)', 'value': genre.subtree_bands},
+        ]
+        if genre.parent_id in genre_names:
+            fields.append({
+                'label': 'Primary Parent',
+                'value': genre_names[genre.parent_id],
+                'link': genre.parent_id,
+            })
+        parent_ids = [p for p in parents_of.get(genre.id, []) if p in genre_names]
+        if parent_ids:
+            fields.append({
+                'label': 'All Parents',
+                'values': [genre_names[p] for p in parent_ids],
+                'links': parent_ids,
+            })
+        child_ids = children_of.get(genre.id, [])
+        fields.append(_list_field('Child Genres', child_ids, genre_names,
+                                  rows.get('child_totals', {}).get(genre.id)))
+        member_ids = [b for b in bands_of.get(genre.id, []) if b in band_names]
+        fields.append(_list_field('Bands', member_ids, band_names,
+                                  rows.get('band_totals', {}).get(genre.id)))
+        genre_entities[genre.id] = {'type': 'genre', 'name': genre.name, 'fields': fields}
+
+    for band in rows['bands']:
+        nodes.append(band_node(band.id, band.name, band.primary_genre_id))
+        edges.append({'id': band_edge_id(band.id), 'from': band.id, 'to': band.primary_genre_id})
+
+        member_genre_ids = [g for g in genres_of.get(band.id, []) if g in genre_names]
+        band_entities[band.id] = {
+            'type': 'band',
+            'name': band.name,
+            'fields': [
+                {
+                    'label': 'Primary Genre',
+                    'value': genre_names.get(band.primary_genre_id, band.primary_genre_id),
+                    'link': band.primary_genre_id,
+                },
+                {
+                    'label': 'All Genres',
+                    'values': [genre_names[g] for g in member_genre_ids],
+                    'links': member_genre_ids,
+                },
+            ],
+        }
+
+    return {
+        'version': version,
+        'nodes': nodes,
+        'edges': edges,
+        'entities': {'bands': band_entities, 'genres': genre_entities},
+    }
+
+
+def _list_field(label, ids, names, total=None):
+    """Panel field linking to `ids`; `total` if that's only the first of them"""
+    field = {'label': label, 'values': [names[i] for i in ids], 'links': ids}
+    if total is not None and total > len(ids):
+        field['more'] = total - len(ids)
+    return field
+
+
+def build_graph_changes(since, limit=1000):
+    """Build the patch that brings a client at version `since` up to date.
+
+    Only the changed genres and bands are loaded and returned:
+
+        nodes/edges: {'upsert': [...], 'remove': [ids]} for vis DataSet.update()/remove()
+        entities:    detail panel data for the upserted genres and bands
+
+    'reset' is True (and nothing else is filled in) when the change log
+    can't bring the client up to date, or the patch would be bigger than
+    `limit` entities - the client should fetch the whole graph instead.
+    """
+    current, changes = get_changed_entities(since, ('genre', 'band'), limit)
+    patch = {
+        'version': current,
+        'reset': False,
+        'nodes': {'upsert': [], 'remove': []},
+        'edges': {'upsert': [], 'remove': []},
+        'entities': {'bands': {}, 'genres': {}},
+    }
+    if changes is None:
+        patch['reset'] = True
+        return patch
+
+    genre_ids = {entity_id for entity_type, entity_id in changes if entity_type == 'genre'}
+    band_ids = {entity_id for entity_type, entity_id in changes if entity_type == 'band'}
+    if not genre_ids and not band_ids:
+        return patch  # Only user changes - nothing to redraw
+
+    data = build_graph_data(genre_ids, band_ids)
+    patch['nodes']['upsert'] = data['nodes']
+    patch['edges']['upsert'] = data['edges']
+    patch['entities'] = data['entities']
+
+    # Anything that changed but no longer exists was deleted
+    present_genres = set(data['entities']['genres'])
+    present_bands = set(data['entities']['bands'])
+    patch['nodes']['remove'] = sorted((genre_ids - present_genres) | (band_ids - present_bands))
+
+    # Each genre/band owns at most one edge, so any owned edge id that wasn't
+    # rebuilt (deleted entity, or a genre that lost its parent) goes away
+    upserted_edges = {edge['id'] for edge in data['edges']}
+    owned_edges = {genre_edge_id(g) for g in genre_ids} | {band_edge_id(b) for b in band_ids}
+    patch['edges']['remove'] = sorted(owned_edges - upserted_edges)
+    return patch
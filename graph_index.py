@@ -0,0 +1,421 @@
+"""
+Read-only, array-backed index of the genre DAG and band memberships.
+
+The whole graph is held in a handful of flat buffers instead of millions of
+small Python objects:
+  - StringTable: every id/name packed into one UTF-8 blob plus an offsets
+    array (ids are sorted, so lookups are a binary search - no dict)
+  - CSR adjacency (offsets + indices arrays) for genre parents/children,
+    band -> genres and genre -> bands
+
+A few big objects means a few refcounts, so when Gunicorn forks workers
+from a master that already built the index (see gunicorn.conf.py), the
+pages stay shared copy-on-write instead of being copied into every worker.
+Each process rebuilds its own copy only when the data version changes.
+
+With GRAPH_SNAPSHOT_PATH set, every process memory-maps a binary snapshot
+of the index (graph_snapshot.py) instead of building its own copy. After a
+write the background worker's 'graph_snapshot' job (jobs.py) writes the
+new one; until it appears, processes keep serving the index they have for
+up to GRAPH_SNAPSHOT_WAIT seconds, then build and write it themselves (no
+worker running). Anything cached per index should be keyed by the index's
+own version, which can be older than the one asked for.
+"""
+
+import gc
+import os
+import threading
+import time
+from array import array
+
+from flask import current_app
+
+from models import db, Genre, Band, GenreStats, genre_parents, band_genres, get_data_version
+from read_models import GenreRow, BandRow
+
+GENRE_TYPES = ('root', 'intermediate', 'leaf')
+NO_PARENT = -1
+
+
+class StringTable:
+    """Strings packed into one UTF-8 blob, addressed by position"""
+
+    __slots__ = ('blob', 'offsets')
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets  # len(strings) + 1 entries
+
+    @classmethod
+    def from_strings(cls, strings):
+        offsets = array('I', [0])
+        chunks = []
+        position = 0
+        for string in strings:
+            encoded = string.encode('utf-8')
+            chunks.append(encoded)
+            position += len(encoded)
+            offsets.append(position)
+        return cls(b''.join(chunks), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.raw(i).decode('utf-8')
+
+    def raw(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def find(self, string):
+        """Position of `string` in a sorted table, or -1.
+
+        UTF-8 byte order matches code point order, so comparing the raw
+        bytes agrees with Python's sorted() on the original strings.
+        """
+        target = string.encode('utf-8')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.raw(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self.raw(lo) == target:
+            return lo
+        return -1
+
+
+def build_csr(pairs, size):
+    """Compressed sparse rows from (row, column) pairs.
+
+    Returns (offsets, indices): the columns of row i are
+    indices[offsets[i]:offsets[i + 1]].
+    """
+    counts = [0] * (size + 1)
+    for row, _ in pairs:
+        counts[row + 1] += 1
+    for i in range(size):
+        counts[i + 1] += counts[i]
+    offsets = array('I', counts)
+    indices = array('I', bytes(4 * len(pairs)))
+    fill = list(counts[:size])
+    for row, column in pairs:
+        indices[fill[row]] = column
+        fill[row] += 1
+    return offsets, indices
+
+
+class GraphIndex:
+    """Genres, bands and their relationships as positions into flat arrays.
+
+    Genres and bands are numbered by their position in sorted id order;
+    use genre_index()/band_index() to go from an id to a position.
+    """
+
+    __slots__ = (
+        'version',
+        'genre_ids', 'genre_names', 'genre_types', 'genre_primary_parent', 'genre_subtree_bands',
+        'parent_offsets', 'parent_indices', 'child_offsets', 'child_indices',
+        'band_ids', 'band_names', 'band_primary_genre',
+        'band_genre_offsets', 'band_genre_indices', 'genre_band_offsets', 'genre_band_indices',
+    )
+
+    def __init__(self, **buffers):
+        for name in self.__slots__:
+            setattr(self, name, buffers[name])
+
+    @classmethod
+    def from_rows(cls, version, genres, bands, parent_pairs, membership_pairs):
+        """Build from (id, name, parent_id, type[, subtree_bands]) genre rows,
+        (id, name, primary_genre_id) band rows and id pairs from the
+        association tables."""
+        genres = sorted(genres, key=lambda g: g[0])
+        bands = sorted(bands, key=lambda b: b[0])
+        genre_pos = {g[0]: i for i, g in enumerate(genres)}
+        band_pos = {b[0]: i for i, b in enumerate(bands)}
+
+        parents = [(genre_pos[child], genre_pos[parent]) for child, parent in parent_pairs
+                   if child in genre_pos and parent in genre_pos]
+        memberships = [(band_pos[band], genre_pos[genre]) for band, genre in membership_pairs
+                       if band in band_pos and genre in genre_pos]
+
+        parent_offsets, parent_indices = build_csr(parents, len(genres))
+        child_offsets, child_indices = build_csr([(p, c) for c, p in parents], len(genres))
+        band_genre_offsets, band_genre_indices = build_csr(memberships, len(bands))
+        genre_band_offsets, genre_band_indices = build_csr([(g, b) for b, g in memberships], len(genres))
+
+        return cls(
+            version=version,
+            genre_ids=StringTable.from_strings(g[0] for g in genres),
+            genre_names=StringTable.from_strings(g[1] for g in genres),
+            genre_types=array('B', [GENRE_TYPES.index(g[3]) if g[3] in GENRE_TYPES else 2 for g in genres]),
+            genre_primary_parent=array('i', [genre_pos.get(g[2], NO_PARENT) for g in genres]),
+            genre_subtree_bands=array('I', [g[4] if len(g) > 4 else 0 for g in genres]),
+            parent_offsets=parent_offsets, parent_indices=parent_indices,
+            child_offsets=child_offsets, child_indices=child_indices,
+            band_ids=StringTable.from_strings(b[0] for b in bands),
+            band_names=StringTable.from_strings(b[1] for b in bands),
+            band_primary_genre=array('i', [genre_pos.get(b[2], NO_PARENT) for b in bands]),
+            band_genre_offsets=band_genre_offsets, band_genre_indices=band_genre_indices,
+            genre_band_offsets=genre_band_offsets, genre_band_indices=genre_band_indices,
+        )
+
+    @classmethod
+    def from_database(cls, version):
+        """Build from four column-only queries, labelled with `version`"""
+        return cls.from_rows(
+            version,
+            db.session.execute(
+                db.select(Genre.id, Genre.name, Genre.parent_id, Genre.type,
+                          db.func.coalesce(GenreStats.subtree_bands, 0))
+                .outerjoin(GenreStats, GenreStats.genre_id == Genre.id)).all(),
+            db.session.execute(db.select(Band.id, Band.name, Band.primary_genre_id)).all(),
+            db.session.execute(db.select(genre_parents.c.genre_id, genre_parents.c.parent_genre_id)).all(),
+            db.session.execute(db.select(band_genres.c.band_id, band_genres.c.genre_id)).all(),
+        )
+
+    @property
+    def genre_count(self):
+        return len(self.genre_ids)
+
+    @property
+    def band_count(self):
+        return len(self.band_ids)
+
+    def genre_index(self, genre_id):
+        return self.genre_ids.find(genre_id)
+
+    def band_index(self, band_id):
+        return self.band_ids.find(band_id)
+
+    def genre_parents(self, i):
+        return self.parent_indices[self.parent_offsets[i]:self.parent_offsets[i + 1]]
+
+    def genre_children(self, i):
+        return self.child_indices[self.child_offsets[i]:self.child_offsets[i + 1]]
+
+    def band_genres(self, i):
+        return self.band_genre_indices[self.band_genre_offsets[i]:self.band_genre_offsets[i + 1]]
+
+    def genre_bands(self, i):
+        return self.genre_band_indices[self.genre_band_offsets[i]:self.genre_band_offsets[i + 1]]
+
+    def rows(self):
+        """The same rows graph_data.load_graph_rows() gets from the database"""
+        genre_ids = list(self.genre_ids)
+        band_ids = list(self.band_ids)
+        genres = [
+            GenreRow(genre_ids[i], self.genre_names[i],
+                     genre_ids[p] if (p := self.genre_primary_parent[i]) != NO_PARENT else None,
+                     GENRE_TYPES[self.genre_types[i]], self.genre_subtree_bands[i])
+            for i in range(len(genre_ids))
+        ]
+        bands = [
+            BandRow(band_ids[i], self.band_names[i],
+                    genre_ids[g] if (g := self.band_primary_genre[i]) != NO_PARENT else None)
+            for i in range(len(band_ids))
+        ]
+        return {
+            'genres': genres,
+            'bands': bands,
+            'genre_parents': [(genre_ids[i], genre_ids[p])
+                              for i in range(len(genre_ids)) for p in self.genre_parents(i)],
+            'band_genres': [(band_ids[i], genre_ids[g])
+                            for i in range(len(band_ids)) for g in self.band_genres(i)],
+            'children': [(g.id, g.parent_id) for g in genres if g.parent_id],
+            'genre_names': {g.id: g.name for g in genres},
+            'band_names': {b.id: b.name for b in bands},
+        }
+
+    def rows_for(self, genres, bands, list_limit):
+        """Rows for some genres and bands (positions), like
+        graph_data.load_graph_rows(genre_ids, band_ids) but from memory.
+
+        A genre's members and children are cut to their first `list_limit`;
+        'band_totals'/'child_totals' hold the full counts of the cut lists.
+        """
+        genre_ids, band_ids = self.genre_ids, self.band_ids
+        genres = list(genres)
+        bands = list(bands)
+        wanted = set(genres)
+
+        children_of = {}
+        for child in range(self.genre_count):
+            if self.genre_primary_parent[child] in wanted:
+                children_of.setdefault(self.genre_primary_parent[child], []).append(child)
+        children, child_totals = [], {}
+        for genre, child_positions in children_of.items():
+            if len(child_positions) > list_limit:
+                child_totals[genre_ids[genre]] = len(child_positions)
+            children += [(genre_ids[c], genre_ids[genre]) for c in child_positions[:list_limit]]
+
+        memberships, band_totals = set(), {}
+        for band in bands:
+            memberships |= {(band, g) for g in self.band_genres(band)}
+        for genre in genres:
+            members = self.genre_bands(genre)
+            if len(members) > list_limit:
+                band_totals[genre_ids[genre]] = len(members)
+            memberships |= {(b, genre) for b in members[:list_limit]}
+        parent_pairs = [(g, p) for g in genres for p in self.genre_parents(g)]
+
+        linked_genres = wanted | {g for _, g in memberships} | {p for _, p in parent_pairs}
+        linked_genres |= {p for g in genres if (p := self.genre_primary_parent[g]) != NO_PARENT}
+        linked_genres |= {p for b in bands if (p := self.band_primary_genre[b]) != NO_PARENT}
+        linked_genres |= {c for child_positions in children_of.values() for c in child_positions[:list_limit]}
+        linked_bands = set(bands) | {b for b, _ in memberships}
+
+        return {
+            'genres': [
+                GenreRow(genre_ids[g], self.genre_names[g],
+                         genre_ids[p] if (p := self.genre_primary_parent[g]) != NO_PARENT else None,
+                         GENRE_TYPES[self.genre_types[g]], self.genre_subtree_bands[g])
+                for g in genres
+            ],
+            'bands': [
+                BandRow(band_ids[b], self.band_names[b],
+                        genre_ids[g] if (g := self.band_primary_genre[b]) != NO_PARENT else None)
+                for b in bands
+            ],
+            'genre_parents': [(genre_ids[g], genre_ids[p]) for g, p in parent_pairs],
+            'band_genres': [(band_ids[b], genre_ids[g]) for b, g in sorted(memberships)],
+            'children': children,
+            'genre_names': {genre_ids[g]: self.genre_names[g] for g in linked_genres},
+            'band_names': {band_ids[b]: self.band_names[b] for b in linked_bands},
+            'band_totals': band_totals,
+            'child_totals': child_totals,
+        }
+
+    @property
+    def nbytes(self):
+        """Approximate size of the buffers in bytes"""
+        total = 0
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, StringTable):
+                total += memoryview(value.blob).nbytes + memoryview(value.offsets).nbytes
+            elif name != 'version':
+                total += memoryview(value).nbytes
+        return total
+
+
+# =============================================================================
+# Per-process cache
+# =============================================================================
+
+_current_index = None
+_index_lock = threading.Lock()
+_mapped_snapshot = None  # (file signature, index) of the snapshot opened last
+_waiting = None          # (version, time.monotonic()) since which a snapshot is awaited
+
+
+def get_graph_index(version=None, fresh=False):
+    """The graph index for the current data version.
+
+    Pass `version` if you already read it. It must be read before the index
+    is built: if a write lands in between, the index is labelled with the
+    older version and simply rebuilt on the next call.
+
+    With GRAPH_SNAPSHOT_PATH set the result can be an older version while
+    the worker writes the new snapshot (see above), or a newer one if a
+    write has landed since; fresh=True never returns an older one.
+    """
+    global _current_index
+    if version is None:
+        version = get_data_version()
+    index = _current_index
+    if index is None or index.version != version:
+        with _index_lock:
+            index = _current_index
+            if index is None or index.version != version:
+                index = _load_graph_index(version, index, fresh)
+                _current_index = index
+    return index
+
+
+def _open_snapshot(path):
+    """The snapshot at `path`, only opened again once the file was replaced"""
+    global _mapped_snapshot
+    # Imported here: graph_snapshot imports this module
+    from graph_snapshot import open_snapshot
+
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _mapped_snapshot is None or _mapped_snapshot[0] != signature:
+        _mapped_snapshot = (signature, open_snapshot(path))
+    return _mapped_snapshot[1]
+
+
+def _waited_for(version):
+    """Seconds since this process first waited for a snapshot of `version`"""
+    global _waiting
+    if _waiting is None or _waiting[0] != version:
+        _waiting = (version, time.monotonic())
+    return time.monotonic() - _waiting[1]
+
+
+def _load_graph_index(version, current, fresh):
+    """Open the snapshot for `version`, keep serving an older index while
+    the worker writes it, or build the index (and snapshot it)"""
+    config = current_app.config
+    path = config['GRAPH_SNAPSHOT_PATH']
+    if not path:
+        return GraphIndex.from_database(version)
+
+    from graph_snapshot import SnapshotError, write_snapshot
+    snapshot = None
+    try:
+        snapshot = _open_snapshot(path)
+        if snapshot.version >= version:
+            return snapshot  # Versions only go up: newer is just as good
+    except FileNotFoundError:
+        pass
+    except (OSError, SnapshotError) as e:
+        current_app.logger.warning('Ignoring unreadable graph snapshot: %s', e)
+
+    if current is not None and current.version > version:
+        return current
+    if not fresh:
+        previous = current or snapshot
+        if previous is not None and previous.version < version \
+                and _waited_for(version) < config['GRAPH_SNAPSHOT_WAIT']:
+            return previous
+
+    index = GraphIndex.from_database(version)
+    try:
+        write_snapshot(index, path)
+        # Map the file we just wrote so this process shares it too (unless
+        # another process already replaced it with a different version)
+        mapped = _open_snapshot(path)
+        if mapped.version == version:
+            return mapped
+    except (OSError, SnapshotError) as e:
+        current_app.logger.warning('Could not write graph snapshot %s: %s', path, e)
+    return index
+
+
+def clear_graph_index():
+    """Forget the cached index (tests recreate the database between runs)"""
+    global _current_index, _mapped_snapshot, _waiting
+    _current_index = None
+    _mapped_snapshot = None
+    _waiting = None
+
+
+def preload_graph_index(app):
+    """Build the index in the Gunicorn master before workers are forked.
+
+    Closes the master's database connections afterwards (forked workers
+    must not share sockets) and freezes the garbage collector so it never
+    touches - and un-shares - the pages holding the index.
+    """
+    with app.app_context():
+        index = get_graph_index(fresh=True)
+        db.engine.dispose()
+    gc.freeze()
+    return index
@@ -0,0 +1,188 @@
+"""
+Level-of-detail views for catalogs too big to draw in full.
+
+vis-network slows to a crawl past a few thousand nodes, so when there are
+more than GRAPH_NODE_BUDGET genres and bands the page starts from a
+clustered view instead of the whole graph:
+
+  - Genres are arranged in levels by depth in the primary-parent tree
+    (genres without a primary parent fall back to their first
+    genre_parents entry). Levels, subtree sizes and each genre's bands
+    are precomputed once per data version from the graph index.
+  - The initial view shows every genre down to the deepest level that fits
+    the budget. Genres on that level that have children are collapsed
+    clusters standing in for their whole subtree, with genre and band
+    counts.
+  - Expanding a genre (click, or zooming in on a cluster) loads its direct
+    children - clusters again if they have children - and its bands.
+
+No view holds more than the budget on its own; the page collapses its
+oldest expansions again whenever it would hold more. Views are built from
+the graph index in memory, and their panels list at most PANEL_LIST_LIMIT
+of a genre's bands and child genres, so no view grows with the catalog.
+"""
+
+import threading
+from array import array
+
+from graph_data import build_graph_data, build_graph_payload
+from graph_index import NO_PARENT, build_csr, get_graph_index
+from models import get_data_version
+
+# Most bands/child genres listed in a genre's panel in clustered views: the
+# rest are counted, and appear when the genre is expanded
+PANEL_LIST_LIMIT = 50
+
+
+class LevelIndex:
+    """Primary-parent tree over the genres of one graph index"""
+
+    def __init__(self, index):
+        self.index = index
+        genre_count = index.genre_count
+
+        parent = array('i', [NO_PARENT]) * genre_count
+        for genre in range(genre_count):
+            primary = index.genre_primary_parent[genre]
+            if primary == NO_PARENT:
+                others = index.genre_parents(genre)
+                primary = others[0] if len(others) else NO_PARENT
+            if primary != genre:
+                parent[genre] = primary
+        children = [[] for _ in range(genre_count)]
+        for genre in range(genre_count):
+            if parent[genre] != NO_PARENT:
+                children[parent[genre]].append(genre)
+
+        # Breadth first from the roots; genres only reachable through a
+        # cycle start a tree of their own
+        depth = array('i', [-1]) * genre_count
+        self.children = [[] for _ in range(genre_count)]
+        order = []
+        starts = [g for g in range(genre_count) if parent[g] == NO_PARENT] + list(range(genre_count))
+        for start in starts:
+            if depth[start] >= 0:
+                continue
+            depth[start] = 0
+            order.append(start)
+            position = len(order) - 1
+            while position < len(order):
+                genre = order[position]
+                position += 1
+                for child in children[genre]:
+                    if depth[child] < 0:
+                        depth[child] = depth[genre] + 1
+                        self.children[genre].append(child)
+                        order.append(child)
+        self.depth = depth
+        for genre_children in self.children:
+            genre_children.sort(key=lambda g: index.genre_names[g])
+
+        # Genres below each genre in the tree
+        self.descendants = array('i', [0]) * genre_count
+        for genre in reversed(order):
+            for child in self.children[genre]:
+                self.descendants[genre] += self.descendants[child] + 1
+
+        # Genres at each depth or above
+        self.level_sizes = []
+        for genre_depth in depth:
+            while len(self.level_sizes) <= genre_depth:
+                self.level_sizes.append(0)
+            self.level_sizes[genre_depth] += 1
+        for level in range(1, len(self.level_sizes)):
+            self.level_sizes[level] += self.level_sizes[level - 1]
+
+        # Bands by primary genre (what a genre node shows when expanded)
+        self.band_offsets, self.band_indices = build_csr(
+            [(genre, band) for band, genre in enumerate(index.band_primary_genre) if genre != NO_PARENT],
+            genre_count)
+
+    def level_for(self, budget):
+        """Deepest level whose genres all fit in `budget` (0 at least)"""
+        level = 0
+        while level + 1 < len(self.level_sizes) and self.level_sizes[level + 1] <= budget:
+            level += 1
+        return level
+
+    def view(self, budget):
+        """(level, genre positions) of the initial view"""
+        level = self.level_for(budget)
+        return level, [g for g in range(self.index.genre_count) if self.depth[g] <= level]
+
+    def bands(self, genre):
+        return self.band_indices[self.band_offsets[genre]:self.band_offsets[genre + 1]]
+
+
+_levels = None
+_levels_lock = threading.Lock()
+
+
+def get_level_index(version):
+    """The LevelIndex for the graph index of `version` (built once per
+    index per process)"""
+    global _levels
+    index = get_graph_index(version)
+    levels = _levels
+    if levels is None or levels.index.version != index.version:
+        with _levels_lock:
+            levels = _levels
+            if levels is None or levels.index.version != index.version:
+                levels = _levels = LevelIndex(index)
+    return levels
+
+
+def clear_levels():
+    """Forget the cached level index (tests recreate the database between runs)"""
+    global _levels
+    _levels = None
+
+
+def _build(levels, genres, bands, collapsed):
+    index = levels.index
+    # From the index in memory, with the panels' lists cut short: a view's
+    # size follows the budget, not the catalog
+    data = build_graph_payload(index.rows_for(genres, bands, PANEL_LIST_LIMIT), index.version)
+    clusters = {index.genre_ids[g]: levels.descendants[g] for g in collapsed}
+    for node in data['nodes']:
+        if node['id'] in clusters and node['group'] == 'genre':
+            node['collapsed'] = True
+            node['clusterGenres'] = clusters[node['id']]
+    return data
+
+
+def build_graph_view(budget):
+    """The graph for the main page: everything if it fits in `budget`
+    nodes, otherwise the clustered initial view.
+
+    Clustered views carry a 'lod' dict (budget, level, total nodes);
+    it's None for the full graph.
+    """
+    index = get_graph_index(get_data_version())
+    version = index.version  # Older while the worker writes the new snapshot
+    if not budget or index.genre_count + index.band_count <= budget:
+        return dict(build_graph_data(version=version), lod=None)
+
+    levels = get_level_index(version)
+    level, genres = levels.view(budget)
+    collapsed = [g for g in genres if levels.depth[g] == level and levels.children[g]]
+    data = _build(levels, genres, [], collapsed)
+    data['lod'] = {'budget': budget, 'level': level, 'total_nodes': index.genre_count + index.band_count}
+    return data
+
+
+def build_graph_expansion(genre_id, budget):
+    """One genre opened up: the genre, its direct children and its bands
+    (the first `budget` of them, all if it's 0). None if the genre
+    doesn't exist."""
+    levels = get_level_index(get_data_version())
+    genre = levels.index.genre_index(genre_id)
+    if genre < 0:
+        return None
+
+    children = levels.children[genre]
+    bands = levels.bands(genre)
+    budget = budget or len(bands)
+    data = _build(levels, [genre] + children, bands[:budget], [c for c in children if levels.children[c]])
+    data['lod'] = {'budget': budget, 'genre': genre_id, 'hidden_bands': max(0, len(bands) - budget)}
+    return data
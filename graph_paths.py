@@ -0,0 +1,209 @@
+"""
+"How is X connected to Y": shortest paths between genres and bands.
+
+Edges are genre -> parent links (primary parent and genre_parents, both
+directions) and band <-> genre memberships (primary genre and
+band_genres). The search runs straight over the graph index's CSR arrays;
+the only extra structure is a small list of primary links that aren't
+also in the association tables, built once per data version.
+
+Bidirectional BFS grows a frontier from each end, always expanding the
+side whose frontier has fewer edges to follow, and stops once the two
+meet or the path would exceed PATH_MAX_DEPTH edges. Results are kept in a
+small LRU cache keyed by data version and endpoints.
+"""
+
+import threading
+from collections import OrderedDict
+
+from graph_index import NO_PARENT, get_graph_index
+
+
+class PathIndex:
+    """Adjacency over genres (nodes 0..G-1) and bands (G..G+B-1)"""
+
+    def __init__(self, index):
+        self.index = index
+        genre_count = index.genre_count
+        self.genre_count = genre_count
+
+        # Primary links that the association tables don't already cover
+        extra = {}
+
+        def link(a, b):
+            extra.setdefault(a, []).append(b)
+            extra.setdefault(b, []).append(a)
+
+        for genre in range(genre_count):
+            parent = index.genre_primary_parent[genre]
+            if parent != NO_PARENT and parent not in index.genre_parents(genre):
+                link(genre, parent)
+        for band in range(index.band_count):
+            genre = index.band_primary_genre[band]
+            if genre != NO_PARENT and genre not in index.band_genres(band):
+                link(genre_count + band, genre)
+        self.extra = extra
+
+    def node(self, entity_id):
+        """Node number for a genre or band id, or -1"""
+        position = self.index.genre_index(entity_id)
+        if position >= 0:
+            return position
+        position = self.index.band_index(entity_id)
+        return self.genre_count + position if position >= 0 else -1
+
+    def describe(self, node):
+        index = self.index
+        if node < self.genre_count:
+            return {'id': index.genre_ids[node], 'name': index.genre_names[node], 'type': 'genre'}
+        band = node - self.genre_count
+        return {'id': index.band_ids[band], 'name': index.band_names[band], 'type': 'band'}
+
+    def degree(self, node):
+        index = self.index
+        if node < self.genre_count:
+            return (index.parent_offsets[node + 1] - index.parent_offsets[node]
+                    + index.child_offsets[node + 1] - index.child_offsets[node]
+                    + index.genre_band_offsets[node + 1] - index.genre_band_offsets[node])
+        band = node - self.genre_count
+        return index.band_genre_offsets[band + 1] - index.band_genre_offsets[band]
+
+    def neighbours(self, node):
+        index = self.index
+        genre_count = self.genre_count
+        if node < genre_count:
+            yield from index.genre_parents(node)
+            yield from index.genre_children(node)
+            for band in index.genre_bands(node):
+                yield genre_count + band
+        else:
+            yield from index.band_genres(node - genre_count)
+        yield from self.extra.get(node, ())
+
+    def shortest_path(self, source, target, max_depth):
+        """Node numbers from source to target, or None if they're further
+        apart than max_depth edges (or not connected at all)"""
+        if source == target:
+            return [source]
+        # node -> (previous node, distance) for each side
+        seen = ({source: (None, 0)}, {target: (None, 0)})
+        frontiers = ([source], [target])
+        depth = 0
+        while frontiers[0] and frontiers[1] and depth < max_depth:
+            side = 0 if sum(map(self.degree, frontiers[0])) <= sum(map(self.degree, frontiers[1])) else 1
+            mine, other = seen[side], seen[1 - side]
+            next_frontier = []
+            best = None
+            for v in frontiers[side]:
+                distance = mine[v][1] + 1
+                for w in self.neighbours(v):
+                    if w in mine:
+                        continue
+                    mine[w] = (v, distance)
+                    next_frontier.append(w)
+                    if w in other:
+                        # Finish the level: a later meeting point may be closer to the other end
+                        total = distance + other[w][1]
+                        if best is None or total < best[0]:
+                            best = (total, w)
+            if best is not None:
+                return self._join(best[1], seen)
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+            depth += 1
+        return None
+
+    @staticmethod
+    def _join(meeting, seen):
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = seen[0][node][0]
+        path.reverse()
+        node = seen[1][meeting][0]
+        while node is not None:
+            path.append(node)
+            node = seen[1][node][0]
+        return path
+
+
+class PathCache:
+    """Bounded LRU of path results"""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_path_index = None
+_path_index_lock = threading.Lock()
+_results = PathCache(1024)
+
+
+def get_path_index(version):
+    """The PathIndex for the graph index of `version` (built once per
+    index per process)"""
+    global _path_index
+    index = get_graph_index(version)
+    path_index = _path_index
+    if path_index is None or path_index.index.version != index.version:
+        with _path_index_lock:
+            path_index = _path_index
+            if path_index is None or path_index.index.version != index.version:
+                path_index = _path_index = PathIndex(index)
+    return path_index
+
+
+def find_path(version, from_id, to_id, max_depth):
+    """Shortest path between two genre/band ids.
+
+    Returns None if either id doesn't exist, otherwise a dict with 'found'
+    and 'path' (a list of {'id', 'name', 'type'} from `from_id` to `to_id`).
+    """
+    path_index = get_path_index(version)
+    version = path_index.index.version  # Results are for the index searched
+    key = (version, from_id, to_id, max_depth)
+    result = _results.get(key)
+    if result is not None:
+        return result
+    reverse = _results.get((version, to_id, from_id, max_depth))
+    if reverse is not None:
+        return dict(reverse, path=reverse['path'][::-1])
+
+    source, target = path_index.node(from_id), path_index.node(to_id)
+    if source < 0 or target < 0:
+        return None
+    nodes = path_index.shortest_path(source, target, max_depth)
+    result = {
+        'found': nodes is not None,
+        'length': len(nodes) - 1 if nodes else None,
+        'path': [path_index.describe(node) for node in nodes or ()],
+    }
+    _results.put(key, result)
+    return result
+
+
+def clear_paths():
+    """Forget cached indexes and results (tests recreate the database between runs)"""
+    global _path_index
+    _path_index = None
+    _results.clear()
@@ -0,0 +1,146 @@
+"""
+Memory-mapped binary snapshot of the graph index.
+
+File layout (all header fields little-endian):
+
+    header   magic 'MGGRAPH\\0', format version, section count,
+             data version, byte order of the arrays ('l' or 'b')
+    sections one entry per buffer: name, array typecode, item size,
+             byte offset, item count
+    data     the raw buffers, each aligned to 8 bytes
+
+Every GraphIndex array is a section; each string table is two
+('<name>.blob' and '<name>.offsets'). open_snapshot() maps the file
+read-only and wraps each section in a memoryview, so nothing is copied:
+workers that open the same file share its pages through the OS page cache.
+
+write_snapshot() writes to a temporary file in the same directory and
+os.replace()s it into place, so readers see either the old or the new
+snapshot, never half of one. Processes that still have the old file mapped
+keep reading it until they re-open.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from graph_index import GraphIndex, StringTable
+
+MAGIC = b'MGGRAPH\0'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sIIQc7x')       # magic, format, section count, data version, byte order
+SECTION = struct.Struct('<24scB6xQQ')     # name, typecode, item size, offset, item count
+ALIGNMENT = 8
+BYTE_ORDER = b'l' if sys.byteorder == 'little' else b'b'
+
+
+class SnapshotError(Exception):
+    """The file isn't a snapshot this code can read"""
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _sections(index):
+    """(name, typecode, buffer) for every buffer in the index"""
+    for name in GraphIndex.__slots__:
+        value = getattr(index, name)
+        if isinstance(value, StringTable):
+            yield f'{name}.blob', 'B', value.blob
+            yield f'{name}.offsets', 'I', value.offsets
+        elif name != 'version':
+            yield name, value.typecode if isinstance(value, array) else value.format, value
+
+
+def write_snapshot(index, path):
+    """Atomically write `index` to `path`"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    sections = []
+    offset = HEADER.size
+    entries = list(_sections(index))
+    offset += SECTION.size * len(entries)
+    for name, typecode, buffer in entries:
+        view = memoryview(buffer)
+        offset = _align(offset)
+        sections.append((name, typecode, view, offset))
+        offset += view.nbytes
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.graph-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), index.version, BYTE_ORDER))
+            for name, typecode, view, offset in sections:
+                f.write(SECTION.pack(name.encode(), typecode.encode(), view.itemsize, offset, len(view)))
+            for name, typecode, view, offset in sections:
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(view.cast('B') if view.nbytes else b'')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def snapshot_version(path):
+    """Data version of the snapshot at `path`, read from its header alone
+    (None if there's no readable snapshot there)"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, format_version, _, version, byte_order = HEADER.unpack(header)
+    if magic != MAGIC or format_version != FORMAT_VERSION or byte_order != BYTE_ORDER:
+        return None
+    return version
+
+
+def open_snapshot(path):
+    """Map the snapshot at `path` and return a GraphIndex backed by it.
+
+    Raises OSError if the file can't be read and SnapshotError if it isn't
+    a compatible snapshot.
+    """
+    with open(path, 'rb') as f:
+        # Checked before mapping: mmap refuses empty files with ValueError
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise SnapshotError(f'{path}: file too short')
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, format_version, count, version, byte_order = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise SnapshotError(f'{path}: not a graph snapshot')
+    if format_version != FORMAT_VERSION or byte_order != BYTE_ORDER:
+        raise SnapshotError(f'{path}: format {format_version}/{byte_order!r} not supported')
+
+    view = memoryview(mapped)
+    buffers = {}
+    for i in range(count):
+        name, typecode, itemsize, offset, length = SECTION.unpack_from(mapped, HEADER.size + i * SECTION.size)
+        name = name.rstrip(b'\0').decode()
+        typecode = typecode.decode()
+        if array(typecode).itemsize != itemsize or offset + length * itemsize > len(mapped):
+            raise SnapshotError(f'{path}: section {name} is corrupt')
+        buffers[name] = view[offset:offset + length * itemsize].cast(typecode)
+
+    fields = {'version': version}
+    try:
+        for name in GraphIndex.__slots__:
+            if name == 'version':
+                continue
+            if f'{name}.blob' in buffers:
+                fields[name] = StringTable(buffers[f'{name}.blob'], buffers[f'{name}.offsets'])
+            else:
+                fields[name] = buffers[name]
+    except KeyError as e:
+        raise SnapshotError(f'{path}: missing section {e}')
+    return GraphIndex(**fields)
@@ -0,0 +1,49 @@
+"""
+Gunicorn settings (entrypoint.sh runs `gunicorn -c gunicorn.conf.py app:app`).
+
+The app is imported once in the master (preload_app), which also builds the
+read-only graph index before any worker is forked. Workers share those
+pages copy-on-write, so adding workers adds little memory each. A worker
+rebuilds its own copy only after the data version changes.
+
+Environment overrides:
+  GUNICORN_WORKERS       number of worker processes (default: one per CPU, at least 2)
+  GUNICORN_THREADS       threads per worker (default 1)
+  GUNICORN_WORKER_CLASS  worker class (default 'sync', 'gthread' when threads > 1)
+  PORT                   port to listen on (default 5000)
+
+Compare settings under mixed read/write traffic with
+`python benchmarks/load_test.py --workers N --threads N --worker-class ...`.
+"""
+
+import os
+
+
+def _cpu_count():
+    # Respects container CPU limits set through affinity (Linux only)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('GUNICORN_WORKERS') or max(2, _cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS') or 1)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or ('gthread' if threads > 1 else 'sync')
+preload_app = True
+
+
+def when_ready(server):
+    """Runs in the master after the app is loaded, before workers fork"""
+    from app import app
+    from graph_index import preload_graph_index
+
+    try:
+        index = preload_graph_index(app)
+    except Exception as e:
+        # Not fatal: each worker builds the index on its first request instead
+        server.log.warning('Graph index preload failed: %s', e)
+        return
+    server.log.info('Graph index preloaded: version %s, %d genres, %d bands, %.1f KiB',
+                    index.version, index.genre_count, index.band_count, index.nbytes / 1024)
@@ -1,13 +1,25 @@
-from app import app
-from models import db, Genre, Band, User
+from database import create_db_app
+from models import db, Genre, Band, User, get_data_version, reset_data_version
+
+# Database-only app: scripts don't need the web stack
+app = create_db_app()
 
 def init_database():
     """Initialize the database and load initial data"""
     
     with app.app_context():
+        # Remember the data version so it keeps counting up after the rebuild
+        # (caches compare versions, so it must never go backwards)
+        try:
+            start_version = get_data_version()
+        except Exception:
+            start_version = 0  # First run - no data_version table yet
+        db.session.close()
+
         # Drop all tables and recreate (careful - this deletes everything!)
         db.drop_all()
         db.create_all()
+        reset_data_version(start_version)
         
         print("Creating genres...")
         
@@ -69,6 +81,7 @@ def init_database():
         print(f"Genres: {Genre.query.count()}")
         print(f"Bands: {Band.query.count()}")
         print(f"Users: {User.query.count()}")
+        print(f"Data version: {get_data_version()}")
         print("\nAdmin user created:")
         print("  Username: admin")
         print("  Password: admin123")
@@ -0,0 +1,248 @@
+"""
+Per-request performance instrumentation.
+
+Hooks SQLAlchemy cursor events and Flask's request/template signals to
+measure, for every request:
+  - number of SQL queries and total time spent in the database
+  - template render time
+  - total request time and response size
+
+Each response gets a `Server-Timing` header (shows up in the browser dev
+tools Network tab) and the numbers are aggregated into histograms per
+endpoint, exposed at /metrics in the Prometheus text format.
+
+Note: metrics live in process memory, so with several Gunicorn workers each
+scrape of /metrics sees one worker's numbers.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram bucket upper bounds (Prometheus adds +Inf)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus style (thread safe)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """(cumulative bucket counts, sum, count)"""
+        with self._lock:
+            cumulative = []
+            total = 0
+            for count in self.counts:
+                total += count
+                cumulative.append(total)
+            return cumulative, self.sum, self.count
+
+
+class MetricsRegistry:
+    """Named histograms and counters, each split by a set of labels"""
+
+    def __init__(self):
+        self._metrics = {}  # name -> (type, help, buckets, {labels: value})
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets):
+        self._metrics.setdefault(name, ('histogram', help_text, buckets, {}))
+
+    def counter(self, name, help_text):
+        self._metrics.setdefault(name, ('counter', help_text, None, {}))
+
+    def observe(self, metric, value, **labels):
+        _, _, buckets, series = self._metrics[metric]
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = series.setdefault(key, Histogram(buckets))
+        histogram.observe(value)
+
+    def inc(self, metric, amount=1, **labels):
+        _, _, _, series = self._metrics[metric]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series[key] = series.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            for _, _, _, series in self._metrics.values():
+                series.clear()
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for name, (kind, help_text, buckets, series) in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, value in sorted(series.items()):
+                if kind == 'counter':
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+                    continue
+                cumulative, total, count = value.snapshot()
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], cumulative):
+                    le = bound if bound == '+Inf' else _format_number(bound)
+                    lines.append(f'{name}_bucket{_format_labels(key + (("le", le),))} {bucket_count}')
+                lines.append(f'{name}_sum{_format_labels(key)} {_format_number(total)}')
+                lines.append(f'{name}_count{_format_labels(key)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+metrics = MetricsRegistry()
+metrics.counter('http_requests_total', 'Requests by endpoint, method and status')
+metrics.histogram('http_request_duration_seconds', 'Total request time', DURATION_BUCKETS)
+metrics.histogram('db_queries_per_request', 'SQL queries issued per request', QUERY_COUNT_BUCKETS)
+metrics.histogram('db_time_seconds', 'Time spent in SQL queries per request', DURATION_BUCKETS)
+metrics.histogram('template_render_seconds', 'Template render time per request', DURATION_BUCKETS)
+metrics.histogram('response_size_bytes', 'Response body size', SIZE_BUCKETS)
+
+
+class RequestStats:
+    """Counters for the current request (stored on flask.g)"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self._render_starts = []
+
+
+def get_request_stats():
+    """Stats for the current request, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+
+# =============================================================================
+# SQLAlchemy hooks (registered once on the Engine class, so they cover every
+# engine Flask-SQLAlchemy creates)
+# =============================================================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append((context, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()[1]
+    stats = get_request_stats()
+    if stats is not None:
+        stats.query_count += 1
+        stats.db_time += elapsed
+
+
+def _handle_error(context):
+    # A statement that raised never reaches after_cursor_execute: drop its
+    # start time, or the pooled connection's stack pairs later ones wrongly
+    if context.connection is not None:
+        starts = context.connection.info.get('query_start_time')
+        if starts and starts[-1][0] is context.execution_context:
+            starts.pop()
+
+
+def _register_engine_listeners():
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+
+# =============================================================================
+# Flask hooks
+# =============================================================================
+
+def _before_render(sender, template, context, **extra):
+    stats = get_request_stats()
+    if stats is not None:
+        stats._render_starts.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = get_request_stats()
+    if stats is not None and stats._render_starts:
+        stats.render_time += time.perf_counter() - stats._render_starts.pop()
+
+
+def _start_request():
+    g._request_stats = RequestStats()
+
+
+def _finish_request(app, response):
+    stats = get_request_stats()
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats.start
+    endpoint = request.endpoint or '<unmatched>'
+
+    metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.observe('http_request_duration_seconds', total, endpoint=endpoint)
+    metrics.observe('db_queries_per_request', stats.query_count, endpoint=endpoint)
+    metrics.observe('db_time_seconds', stats.db_time, endpoint=endpoint)
+    if stats.render_time:
+        metrics.observe('template_render_seconds', stats.render_time, endpoint=endpoint)
+    # Streamed responses have no known size until they're sent
+    if not response.is_streamed:
+        metrics.observe('response_size_bytes', response.calculate_content_length() or 0, endpoint=endpoint)
+
+    if app.config['SERVER_TIMING_ENABLED']:
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries"',
+            f'render;dur={stats.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+    return response
+
+
+def metrics_view(app):
+    """/metrics endpoint (optionally protected by a bearer token)"""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_instrumentation(app):
+    """Install the request/query/template hooks and the /metrics endpoint"""
+    _register_engine_listeners()
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(lambda response: _finish_request(app, response))
+
+    if app.config['METRICS_ENABLED']:
+        app.add_url_rule('/metrics', 'metrics', lambda: metrics_view(app))
@@ -0,0 +1,353 @@
+"""
+Persistent background jobs, with the database as the queue.
+
+Expensive rebuilds that follow an admin edit run in a separate worker
+process (worker.py) instead of in the request, or in whichever request
+happens to come next. There is no broker: a job is a row in the `jobs`
+table, and every process already has the database.
+
+  - enqueue() adds a job in the caller's transaction, so it exists exactly
+    when the write that needed it was committed. Route handlers call
+    enqueue_rebuilds() before their commit and return straight away.
+  - Deduplication: while a job of the same kind and dedup key is still
+    queued, enqueue() returns that job instead of adding another. Jobs wait
+    JOB_COALESCE_SECONDS before they run, so ten quick edits make one
+    rebuild; a worker that claims a job also retires any other queued copy
+    of it (the run reads the data as it is now, which covers them all).
+  - Retries: a job that raises is queued again after JOB_RETRY_DELAY
+    seconds, doubling each time, until it has been tried max_attempts
+    times; then it's 'failed' with the error kept. A job still 'running'
+    after JOB_TIMEOUT seconds (its worker died) is queued again.
+  - Status: job_status() (also `python worker.py --status` and /api/jobs)
+    counts jobs per status and lists the latest ones.
+
+Claiming is a conditional UPDATE (... WHERE status = 'queued'), which works
+on SQLite and PostgreSQL alike and lets several workers share the queue.
+
+Add a new kind of job with @job_handler('kind'); the handler gets the
+decoded payload and runs in an app context.
+"""
+
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from models import db, Job, get_data_version, prune_change_log
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+MAINTENANCE_INTERVAL = 60  # Seconds between stale-job/rebuild checks and pruning in the worker
+
+# kind -> handler(payload)
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register the function that runs jobs of `kind`"""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def utcnow():
+    """Naive UTC timestamp (what the DateTime columns store)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# =============================================================================
+# Jobs
+# =============================================================================
+
+@job_handler('graph_snapshot')
+def rebuild_graph_snapshot(payload):
+    """Build the graph index and write the shared snapshot, so web workers
+    memory-map the new version instead of each building it on a request
+    (they keep serving the previous one until it's there)"""
+    # Imported here: the graph modules aren't needed to enqueue jobs
+    from graph_index import get_graph_index
+
+    if not current_app.config['GRAPH_SNAPSHOT_PATH']:
+        return
+    # Opens the snapshot if it's already current, else builds and writes it
+    index = get_graph_index(get_data_version(), fresh=True)
+    current_app.logger.info('Graph snapshot at version %s', index.version)
+
+
+@job_handler('graph_analytics')
+def refresh_graph_analytics(payload):
+    """Compute the graph analytics for the current data version and store
+    them for the web workers (see analytics.py)"""
+    from analytics import compute_analytics, store_analytics, stored_analytics_version
+    from graph_index import get_graph_index
+
+    version = get_data_version()
+    if stored_analytics_version() == version:
+        return
+    index = get_graph_index(version, fresh=True)
+    data = compute_analytics(index, current_app.config['ANALYTICS_BETWEENNESS_SAMPLES'])
+    store_analytics(index.version, data)
+    db.session.commit()
+    current_app.logger.info('Graph analytics computed for version %s', index.version)
+
+
+@job_handler('similarity')
+def refresh_similarity(payload):
+    """Compute the detail panels' similar genres and related bands for the
+    current data version and store them for the web workers (see
+    similarity.py)"""
+    from graph_index import get_graph_index
+    from similarity import stored_similarity_version, update_similarity
+
+    version = get_data_version()
+    if stored_similarity_version() == version:
+        return
+    index = get_graph_index(version, fresh=True)
+    written = update_similarity(index, current_app.config['SIMILARITY_TOP_K'])
+    db.session.commit()
+    current_app.logger.info('Similarity panels for version %s (%s written)', index.version, written)
+
+
+_static_site_app = None
+
+
+@job_handler('static_site')
+def refresh_static_site(payload):
+    """Re-freeze the static export in STATIC_SITE_DIR (see static_site.py)
+    at the current data version"""
+    global _static_site_app
+    output_dir = current_app.config['STATIC_SITE_DIR']
+    if not output_dir:
+        return
+    from static_site import freeze
+    if _static_site_app is None:
+        # The export renders the page, so it needs the web app, not the worker's
+        from app import create_app
+        _static_site_app = create_app()
+    with _static_site_app.app_context():
+        version = freeze(output_dir)
+    if version is not None:
+        current_app.logger.info('Static site written for version %s', version)
+
+
+def enqueue_rebuilds():
+    """Queue the rebuilds a change to genres or bands calls for.
+
+    Call before committing the change; the jobs are committed with it.
+    """
+    # Snapshot first: web workers wait for it, and the other jobs reuse it
+    if current_app.config['GRAPH_SNAPSHOT_PATH']:
+        enqueue('graph_snapshot')
+    enqueue('graph_analytics')
+    enqueue('similarity')
+    if current_app.config['STATIC_SITE_DIR']:
+        enqueue('static_site')
+
+
+def enqueue_stale_rebuilds():
+    """Queue the rebuilds whose output is behind the data version and
+    return their kinds. The worker checks this periodically, which catches
+    a fresh start and writes that never called enqueue_rebuilds() (bulk
+    loads, scripts run elsewhere)."""
+    from analytics import stored_analytics_version
+    from graph_snapshot import snapshot_version
+    from similarity import stored_similarity_version
+    from static_site import frozen_version
+
+    config = current_app.config
+    version = get_data_version()
+    kinds = []
+    if config['GRAPH_SNAPSHOT_PATH'] and snapshot_version(config['GRAPH_SNAPSHOT_PATH']) != version:
+        kinds.append('graph_snapshot')
+    if stored_analytics_version() != version:
+        kinds.append('graph_analytics')
+    if stored_similarity_version() != version:
+        kinds.append('similarity')
+    if config['STATIC_SITE_DIR'] and frozen_version(config['STATIC_SITE_DIR']) != version:
+        kinds.append('static_site')
+    for kind in kinds:
+        enqueue(kind)
+    db.session.commit()
+    return kinds
+
+
+# =============================================================================
+# Queue
+# =============================================================================
+
+def enqueue(kind, payload=None, dedup_key='', delay=None, max_attempts=None):
+    """Add a job to the session (the caller commits), or return the queued
+    job of the same kind and key if there is one"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    config = current_app.config
+    with db.session.no_autoflush:
+        job = Job.query.filter_by(kind=kind, dedup_key=dedup_key, status='queued').first()
+    if job is not None:
+        return job
+
+    if delay is None:
+        delay = config['JOB_COALESCE_SECONDS']
+    job = Job(kind=kind, dedup_key=dedup_key,
+              payload=None if payload is None else json.dumps(payload),
+              status='queued', attempts=0,
+              max_attempts=max_attempts or config['JOB_MAX_ATTEMPTS'],
+              run_at=utcnow() + timedelta(seconds=delay))
+    db.session.add(job)
+    return job
+
+
+def requeue_stale(now=None):
+    """Queue jobs again whose worker stopped reporting (or fail them if
+    they're out of attempts); returns how many"""
+    now = now or utcnow()
+    jobs = Job.__table__
+    cutoff = now - timedelta(seconds=current_app.config['JOB_TIMEOUT'])
+    stale = (jobs.c.status == 'running', jobs.c.started_at < cutoff)
+    failed = db.session.execute(
+        jobs.update()
+        .where(*stale, jobs.c.attempts >= jobs.c.max_attempts)
+        .values(status='failed', finished_at=now, error='Timed out')).rowcount
+    requeued = db.session.execute(
+        jobs.update()
+        .where(*stale)
+        .values(status='queued', run_at=now, worker=None, error='Timed out')).rowcount
+    db.session.commit()
+    return failed + requeued
+
+
+def claim_next_job(worker=None, now=None):
+    """Mark the next due job as running by this worker and return it (None
+    if nothing is due). Other queued copies of it are retired."""
+    now = now or utcnow()
+    worker = worker or worker_name()
+    jobs = Job.__table__
+    while True:
+        job_id = db.session.execute(
+            db.select(jobs.c.id)
+            .where(jobs.c.status == 'queued', jobs.c.run_at <= now)
+            .order_by(jobs.c.run_at, jobs.c.id)
+            .limit(1)).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        claimed = db.session.execute(
+            jobs.update()
+            .where(jobs.c.id == job_id, jobs.c.status == 'queued')
+            .values(status='running', attempts=jobs.c.attempts + 1,
+                    started_at=now, finished_at=None, worker=worker)).rowcount
+        if not claimed:
+            db.session.rollback()  # Another worker got it first
+            continue
+        job = db.session.get(Job, job_id)
+        db.session.execute(
+            jobs.update()
+            .where(jobs.c.kind == job.kind, jobs.c.dedup_key == job.dedup_key,
+                   jobs.c.status == 'queued', jobs.c.id != job_id)
+            .values(status='done', finished_at=now, error=f'Coalesced into job {job_id}'))
+        db.session.commit()
+        return job
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns True on success"""
+    config = current_app.config
+    try:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f"No handler for job kind '{job.kind}'")
+        handler(None if job.payload is None else json.loads(job.payload))
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = utcnow() + timedelta(seconds=config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = utcnow()
+        current_app.logger.warning('Job %s (%s) failed, attempt %s of %s: %s',
+                                   job.id, job.kind, job.attempts, job.max_attempts, job.error)
+        db.session.commit()
+        return False
+
+    db.session.rollback()  # Handlers commit what they write; start the bookkeeping clean
+    job = db.session.get(Job, job.id)
+    job.status = 'done'
+    job.finished_at = utcnow()
+    job.error = None
+    db.session.commit()
+    return True
+
+
+def run_next_job(worker=None, now=None):
+    """Claim and run one due job; returns it, or None if the queue is idle"""
+    job = claim_next_job(worker, now)
+    if job is not None:
+        run_job(job)
+    return job
+
+
+def prune_jobs(days, now=None):
+    """Delete finished jobs older than `days`; returns how many"""
+    jobs = Job.__table__
+    cutoff = (now or utcnow()) - timedelta(days=days)
+    result = db.session.execute(
+        jobs.delete().where(jobs.c.status.in_(('done', 'failed')), jobs.c.finished_at < cutoff))
+    db.session.commit()
+    return result.rowcount
+
+
+def job_status(limit=20):
+    """Job counts per status and the latest jobs, newest first"""
+    jobs = Job.__table__
+    counts = dict.fromkeys(JOB_STATUSES, 0)
+    counts.update(db.session.execute(
+        db.select(jobs.c.status, db.func.count()).group_by(jobs.c.status)).all())
+    recent = [{
+        'id': job.id,
+        'kind': job.kind,
+        'dedup_key': job.dedup_key,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_at': job.run_at.isoformat() if job.run_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error,
+    } for job in Job.query.order_by(Job.id.desc()).limit(limit)]
+    return {'counts': counts, 'recent': recent}
+
+
+def run_worker(app, poll_interval=1.0, once=False, prune_days=7, stop=None):
+    """Process jobs until interrupted or `stop` (a threading.Event) is set -
+    the job in progress is finished first - or, with `once`, until none
+    are due"""
+    worker = worker_name()
+    last_maintenance = None
+    while stop is None or not stop.is_set():
+        with app.app_context():
+            if last_maintenance is None or time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                requeue_stale()
+                prune_jobs(prune_days)
+                prune_change_log(app.config['CHANGE_LOG_KEEP_VERSIONS'])
+                enqueue_stale_rebuilds()
+                last_maintenance = time.monotonic()
+            job = run_next_job(worker)
+            db.session.remove()
+        if job is None:
+            if once:
+                return
+            if stop is None:
+                time.sleep(poll_interval)
+            else:
+                stop.wait(poll_interval)
@@ -10,9 +10,12 @@ python make_admin.py --remove someusername
 """
 
 import sys
-from app import app
+from database import create_db_app
 from models import db, User
 
+# Database-only app: scripts don't need the web stack
+app = create_db_app()
+
 def make_admin(username):
     with app.app_context():
         user = User.query.filter_by(username=username).first()
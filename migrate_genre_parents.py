@@ -1,59 +1,72 @@
 """
 Migration script to populate genre_parents table with existing parent_id relationships.
 Run this ONCE after updating models.py and before using the new multi-parent feature.
+
+Runs the 'genre_parents' backfill (see backfill.py): one
+INSERT ... SELECT ... WHERE NOT EXISTS per batch of genres, resumable if
+interrupted, and safe to run again.
+
+usage:
+python migrate_genre_parents.py [--dry-run] [--batch-size N] [--restart] [--yes]
 """
 
-from app import app
-from models import db, Genre
+import argparse
+import sys
+
+from backfill import GenreParentsBackfill, run_backfill
+from database import create_db_app
+from models import db, Genre, genre_parents
+
+# Database-only app: scripts don't need the web stack
+app = create_db_app()
+
 
-def migrate_genre_parents():
+def verify_genre_parents():
+    """(missing, orphaned): genres whose parent_id isn't in genre_parents,
+    and genres whose parent_id points at a genre that doesn't exist"""
+    genres = Genre.__table__
+    parents = genres.alias('parent')
+    missing = db.session.execute(
+        db.select(db.func.count()).select_from(GenreParentsBackfill().pending().subquery())).scalar_one()
+    orphaned = db.session.execute(
+        db.select(genres.c.id, genres.c.parent_id)
+        .outerjoin(parents, parents.c.id == genres.c.parent_id)
+        .where(genres.c.parent_id.isnot(None), parents.c.id.is_(None))).all()
+    return missing, orphaned
+
+
+def migrate_genre_parents(batch_size=1000, dry_run=False, restart=False):
     """Populate genre_parents table with existing parent_id values"""
-    
+
     with app.app_context():
         print("Starting migration: populating genre_parents table...")
-        
-        # Get all genres that have a parent_id
-        genres_with_parents = Genre.query.filter(Genre.parent_id.isnot(None)).all()
-        
-        print(f"Found {len(genres_with_parents)} genres with parent_id set")
-        
-        migrated = 0
-        for genre in genres_with_parents:
-            # Get the parent genre object
-            parent = Genre.query.get(genre.parent_id)
-            
-            if parent:
-                # Check if relationship already exists
-                if parent not in genre.parent_genres:
-                    # Add parent to parent_genres relationship
-                    genre.parent_genres.append(parent)
-                    print(f"  ✓ Added {parent.name} as parent of {genre.name}")
-                    migrated += 1
-                else:
-                    print(f"  - {parent.name} already in parent_genres for {genre.name}")
-            else:
-                print(f"  ✗ Warning: Parent '{genre.parent_id}' not found for genre '{genre.name}'")
-        
-        # Commit all changes
-        if migrated > 0:
-            db.session.commit()
-            print(f"\n✓ Migration complete! Migrated {migrated} parent relationships.")
-        else:
-            print("\n- No changes needed. All parent relationships already exist in genre_parents.")
-        
-        # Verify migration
+        migrated = run_backfill(GenreParentsBackfill(), batch_size=batch_size,
+                                dry_run=dry_run, restart=restart)
+        if dry_run:
+            return migrated
+
+        # Verify migration (two set-based queries, not one per genre)
         print("\nVerifying migration...")
-        for genre in genres_with_parents:
-            parent_count = len(genre.parent_genres)
-            if parent_count == 0:
-                print(f"  ✗ {genre.name} has parent_id but no parent_genres!")
-            elif parent_count == 1:
-                print(f"  ✓ {genre.name} → {genre.parent_genres[0].name}")
-            else:
-                parent_names = ", ".join([p.name for p in genre.parent_genres])
-                print(f"  ✓ {genre.name} → [{parent_names}]")
+        missing, orphaned = verify_genre_parents()
+        linked = db.session.execute(
+            db.select(db.func.count(db.distinct(genre_parents.c.genre_id)))).scalar_one()
+        for genre_id, parent_id in orphaned:
+            print(f"  ✗ Warning: Parent '{parent_id}' not found for genre '{genre_id}'")
+        if missing:
+            print(f"  ✗ {missing} genre(s) have a parent_id but no matching genre_parents row!")
+        else:
+            print(f"  ✓ Every parent_id is in genre_parents ({linked} genre(s) with parents)")
+        return migrated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Copy genres.parent_id into genre_parents.')
+    parser.add_argument('--dry-run', action='store_true', help='only count the rows it would add')
+    parser.add_argument('--batch-size', type=int, default=1000, help='genres per transaction (default 1000)')
+    parser.add_argument('--restart', action='store_true', help='forget saved progress and start over')
+    parser.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+    args = parser.parse_args(argv)
 
-if __name__ == '__main__':
     print("=" * 60)
     print("Genre Parents Migration Script")
     print("=" * 60)
@@ -62,10 +75,16 @@ if __name__ == '__main__':
     print("2. Add that parent to the genre_parents many-to-many relationship")
     print("3. Preserve all existing data")
     print("\n" + "=" * 60)
-    
-    response = input("\nProceed with migration? (yes/no): ")
-    
-    if response.lower() in ['yes', 'y']:
-        migrate_genre_parents()
-    else:
-        print("Migration cancelled.")
\ No newline at end of file
+
+    if not args.dry_run and not args.yes:
+        response = input("\nProceed with migration? (yes/no): ")
+        if response.lower() not in ['yes', 'y']:
+            print("Migration cancelled.")
+            return 0
+
+    migrate_genre_parents(batch_size=max(1, args.batch_size), dry_run=args.dry_run, restart=args.restart)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import attributes
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Association table for many-to-many genre parent relationships
 genre_parents = db.Table('genre_parents',
@@ -72,4 +76,539 @@ class User(UserMixin, db.Model):
     
     def check_password(self, password):
         """Verify password against hash"""
-        return check_password_hash(self.password_hash, password)
\ No newline at end of file
+        return check_password_hash(self.password_hash, password)
+
+
+class DataVersion(db.Model):
+    """Single-row counter bumped every time tracked data changes.
+
+    Caches (in any process) remember the version they were built from and
+    only need `get_data_version()` to know whether they are stale.
+    """
+    __tablename__ = 'data_version'
+
+    id = db.Column(db.Integer, primary_key=True)  # always 1
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DataVersion {self.version}>'
+
+
+class ChangeLog(db.Model):
+    """Append-only log of what changed in each data version (the worker
+    prunes old versions, see prune_change_log())"""
+    __tablename__ = 'change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, index=True)
+    entity_type = db.Column(db.String(20), nullable=False)  # 'genre', 'band', 'user' or 'all'
+    entity_id = db.Column(db.String(50), nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # 'insert', 'update', 'delete' or 'reset'
+    created_at = db.Column(db.DateTime, default=db.func.now())
+
+    def __repr__(self):
+        return f'<ChangeLog v{self.version} {self.action} {self.entity_type}:{self.entity_id}>'
+
+
+class GenreStats(db.Model):
+    """Denormalized per-genre counters, kept up to date on every flush.
+
+    Pages read these instead of counting: see refresh_genre_stats() for how
+    they're maintained and rebuild_genre_stats.py to verify/repair them.
+    """
+    __tablename__ = 'genre_stats'
+
+    genre_id = db.Column(db.String(50), db.ForeignKey('genres.id', ondelete='CASCADE'), primary_key=True)
+    direct_bands = db.Column(db.Integer, nullable=False, default=0)       # Bands in this genre (primary or listed)
+    subtree_bands = db.Column(db.Integer, nullable=False, default=0)      # Distinct bands in it or any descendant
+    descendant_genres = db.Column(db.Integer, nullable=False, default=0)  # Distinct genres below it
+
+    def __repr__(self):
+        return f'<GenreStats {self.genre_id} {self.direct_bands}/{self.subtree_bands}/{self.descendant_genres}>'
+
+
+class Job(db.Model):
+    """A background job: this table is the queue (see jobs.py and worker.py)"""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    dedup_key = db.Column(db.String(100), nullable=False, default='')  # One queued job per (kind, dedup_key)
+    payload = db.Column(db.Text)  # JSON
+    status = db.Column(db.String(10), nullable=False, default='queued')  # 'queued', 'running', 'done' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False)  # Not before this (UTC)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    worker = db.Column(db.String(100))
+    error = db.Column(db.Text)
+
+    __table_args__ = (db.Index('ix_jobs_queue', 'status', 'run_at'),)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind}:{self.dedup_key} {self.status}>'
+
+
+class BackfillProgress(db.Model):
+    """How far a data backfill got (see backfill.py), so it can resume"""
+    __tablename__ = 'backfill_progress'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_key = db.Column(db.Text)  # JSON-encoded key of the last batch committed
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    batches = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=db.func.now())
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<BackfillProgress {self.name} {self.batches} batch(es)>'
+
+
+class GraphAnalytics(db.Model):
+    """Newest graph analytics results (see analytics.py), written by the worker"""
+    __tablename__ = 'graph_analytics'
+
+    id = db.Column(db.Integer, primary_key=True)  # always 1
+    version = db.Column(db.BigInteger, nullable=False)  # Data version they were computed from
+    data = db.Column(db.Text, nullable=False)  # JSON
+    computed_at = db.Column(db.DateTime, default=db.func.now())
+
+    def __repr__(self):
+        return f'<GraphAnalytics v{self.version}>'
+
+
+class SimilarityPanel(db.Model):
+    """Precomputed "similar genres / related bands" of one genre or band
+    (see similarity.py), written by the worker. The ('all', '*') row records
+    the data version the whole set is for."""
+    __tablename__ = 'similarity_panels'
+
+    entity_type = db.Column(db.String(20), primary_key=True)  # 'genre', 'band' or 'all'
+    entity_id = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)  # Data version it was computed from
+    data = db.Column(db.Text, nullable=False)  # JSON
+
+    def __repr__(self):
+        return f'<SimilarityPanel {self.entity_type}:{self.entity_id} v{self.version}>'
+
+
+# =============================================================================
+# Data version tracking
+# Every flush that touches a tracked model bumps the version and logs the
+# changed entities - including the ones on the other end of a changed
+# relationship (e.g. the old and new genres of an edited band), since their
+# detail panels change too.
+# =============================================================================
+
+# Model -> (entity type, [(attribute, related entity type), ...])
+TRACKED_MODELS = {
+    Genre: ('genre', [('parent_id', 'genre'), ('parent_genres', 'genre')]),
+    Band: ('band', [('primary_genre_id', 'genre'), ('genres', 'genre')]),
+    User: ('user', []),
+}
+
+# When one flush touches an entity several ways, the strongest action wins
+ACTION_PRIORITY = {'update': 0, 'insert': 1, 'delete': 2}
+
+
+def _related_ids(obj, attribute, whole_value):
+    """Ids referenced by a relationship/foreign key attribute.
+
+    For updates only the added and removed values matter; for inserts and
+    deletes every current value is affected.
+    """
+    history = attributes.get_history(obj, attribute)
+    values = list(history.added) + list(history.deleted)
+    if whole_value:
+        values += list(history.unchanged)
+    ids = set()
+    for value in values:
+        if value is None:
+            continue
+        ids.add(str(getattr(value, 'id', value)))
+    return ids
+
+
+def _collect_changes(session):
+    """Map (entity type, entity id) -> action for everything in this flush"""
+    changes = {}
+
+    def add(entity_type, entity_id, action):
+        key = (entity_type, str(entity_id))
+        current = changes.get(key)
+        if current is None or ACTION_PRIORITY[action] > ACTION_PRIORITY[current]:
+            changes[key] = action
+
+    touched = [(obj, 'insert') for obj in session.new]
+    touched += [(obj, 'update') for obj in session.dirty if session.is_modified(obj)]
+    touched += [(obj, 'delete') for obj in session.deleted]
+
+    for obj, action in touched:
+        tracked = TRACKED_MODELS.get(type(obj))
+        if tracked is None:
+            continue
+        entity_type, related = tracked
+        add(entity_type, obj.id, action)
+        for attribute, related_type in related:
+            for related_id in _related_ids(obj, attribute, action != 'update'):
+                add(related_type, related_id, 'update')
+    return changes
+
+
+def bump_data_version(connection, changes):
+    """Increment the data version and log the changes; returns the new version.
+
+    `changes` maps (entity type, entity id) -> action. Use this directly for
+    writes that bypass the ORM (bulk inserts, raw SQL); ORM flushes call it
+    automatically.
+    """
+    table = DataVersion.__table__
+    result = connection.execute(
+        table.update().where(table.c.id == 1).values(version=table.c.version + 1))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=1, version=1))
+        version = 1
+    else:
+        version = connection.execute(
+            db.select(table.c.version).where(table.c.id == 1)).scalar_one()
+
+    if changes:
+        connection.execute(ChangeLog.__table__.insert(), [
+            {'version': version, 'entity_type': entity_type, 'entity_id': entity_id, 'action': action}
+            for (entity_type, entity_id), action in sorted(changes.items())
+        ])
+    return version
+
+
+@event.listens_for(db.session, 'after_flush')
+def _record_data_changes(session, flush_context):
+    changes = _collect_changes(session)
+    if changes:
+        connection = session.connection()
+        # Genres whose counters moved are logged too: their node sizes changed
+        for genre_id in _update_genre_stats(session, connection, changes):
+            changes.setdefault(('genre', genre_id), 'update')
+        bump_data_version(connection, changes)
+
+
+# =============================================================================
+# Genre counters
+# genre_stats is maintained in the same transaction as the write that
+# changes it. Band-only flushes (the common case) apply exact +1/-1 deltas
+# to the band's old and new genres and their ancestors; anything that
+# touches genres themselves (new, deleted or reparented genres) recounts
+# the affected genres and their ancestors from the tables.
+# =============================================================================
+
+def _genre_parent_map(connection):
+    """genre id -> set of parent ids (primary parent and genre_parents)"""
+    genres = Genre.__table__
+    parents = {}
+    for genre_id, parent_id in connection.execute(db.select(genres.c.id, genres.c.parent_id)):
+        parents[genre_id] = {parent_id} if parent_id else set()
+    for genre_id, parent_id in connection.execute(
+            db.select(genre_parents.c.genre_id, genre_parents.c.parent_genre_id)):
+        if genre_id in parents:
+            parents[genre_id].add(parent_id)
+    # Links to genres that no longer exist don't count
+    for genre_id in parents:
+        parents[genre_id] &= parents.keys()
+    return parents
+
+
+def _reachable(start_ids, links):
+    """start_ids plus everything reachable through `links` (id -> set of ids)"""
+    result = set(start_ids)
+    stack = list(result)
+    while stack:
+        for other in links.get(stack.pop(), ()):
+            if other not in result:
+                result.add(other)
+                stack.append(other)
+    return result
+
+
+def _invert(parents):
+    children = {genre_id: set() for genre_id in parents}
+    for genre_id, parent_ids in parents.items():
+        for parent_id in parent_ids:
+            children[parent_id].add(genre_id)
+    return children
+
+
+def _memberships():
+    """(band_id, genre_id) for every membership, primary genres included"""
+    bands = Band.__table__
+    return db.union(
+        db.select(band_genres.c.band_id, band_genres.c.genre_id),
+        db.select(bands.c.id.label('band_id'), bands.c.primary_genre_id.label('genre_id')),
+    ).subquery()
+
+
+def count_genre_stats(connection, genre_ids, parents=None):
+    """Recount {genre id: (direct, subtree, descendants)} for some genres"""
+    parents = parents if parents is not None else _genre_parent_map(connection)
+    children = _invert(parents)
+    genre_ids = set(genre_ids) & parents.keys()
+    if not genre_ids:
+        return {}
+    memberships = _memberships()
+    direct = dict(connection.execute(
+        db.select(memberships.c.genre_id, db.func.count(memberships.c.band_id.distinct()))
+        .where(memberships.c.genre_id.in_(genre_ids))
+        .group_by(memberships.c.genre_id)).all())
+    stats = {}
+    for genre_id in genre_ids:
+        subtree = _reachable([genre_id], children)
+        subtree_bands = connection.execute(
+            db.select(db.func.count(memberships.c.band_id.distinct()))
+            .where(memberships.c.genre_id.in_(subtree))).scalar()
+        stats[genre_id] = (direct.get(genre_id, 0), subtree_bands, len(subtree) - 1)
+    return stats
+
+
+def compute_genre_stats(connection):
+    """Every genre's counters from scratch, with one pass over the memberships"""
+    parents = _genre_parent_map(connection)
+    children = _invert(parents)
+    bands_of = {genre_id: set() for genre_id in parents}
+    for band_id, genre_id in connection.execute(db.select(_memberships())):
+        if genre_id in bands_of:
+            bands_of[genre_id].add(band_id)
+
+    stats = {}
+    for genre_id in parents:
+        subtree = _reachable([genre_id], children)
+        if len(subtree) == 1:
+            subtree_bands = len(bands_of[genre_id])
+        else:
+            subtree_bands = len(set().union(*(bands_of[g] for g in subtree)))
+        stats[genre_id] = (len(bands_of[genre_id]), subtree_bands, len(subtree) - 1)
+    return stats
+
+
+def write_genre_stats(connection, stats, remove=()):
+    """Replace the stored counters of the genres in `stats` (and drop `remove`)"""
+    table = GenreStats.__table__
+    stale = set(stats) | set(remove)
+    if stale:
+        connection.execute(table.delete().where(table.c.genre_id.in_(stale)))
+    if stats:
+        connection.execute(table.insert(), [
+            {'genre_id': genre_id, 'direct_bands': direct, 'subtree_bands': subtree,
+             'descendant_genres': descendants}
+            for genre_id, (direct, subtree, descendants) in sorted(stats.items())
+        ])
+
+
+def verify_genre_stats(repair=False):
+    """Compare stored counters with a full recount.
+
+    Returns [(genre id, stored, expected)] for every genre whose row is
+    wrong, missing or left over, as (direct, subtree, descendants) tuples
+    (None for a missing/left over row). With repair=True the wrong rows are
+    rewritten and committed as one data version.
+    """
+    connection = db.session.connection()
+    expected = compute_genre_stats(connection)
+    table = GenreStats.__table__
+    stored = {row[0]: tuple(row[1:]) for row in connection.execute(db.select(
+        table.c.genre_id, table.c.direct_bands, table.c.subtree_bands, table.c.descendant_genres))}
+
+    mismatches = [(genre_id, stored.get(genre_id), expected.get(genre_id))
+                  for genre_id in sorted(stored.keys() | expected.keys())
+                  if stored.get(genre_id) != expected.get(genre_id)]
+    if repair and mismatches:
+        write_genre_stats(
+            connection,
+            {genre_id: counts for genre_id, _, counts in mismatches if counts is not None},
+            remove=[genre_id for genre_id, _, counts in mismatches if counts is None])
+        bump_data_version(connection, {('genre', genre_id): 'update'
+                                       for genre_id, _, counts in mismatches if counts is not None})
+        db.session.commit()
+    return mismatches
+
+
+def _band_genre_sets(connection, obj, action):
+    """A band's (old, new) genre ids, primary genre included.
+
+    The genres collection may not be loaded for an update that only set
+    primary_genre_id, so updates read the new memberships back from the
+    table and undo this flush's changes to get the old ones.
+    """
+    primary = attributes.get_history(obj, 'primary_genre_id')
+    listed = attributes.get_history(obj, 'genres')
+    ids = lambda values: {str(getattr(v, 'id', v)) for v in values if v is not None}  # noqa: E731
+
+    if action == 'insert':
+        return set(), ids(primary.sum()) | ids(listed.sum())
+    if action == 'delete':
+        return ids(primary.unchanged) | ids(primary.deleted) | ids(listed.unchanged) | ids(listed.deleted), set()
+
+    now_listed = set(connection.execute(
+        db.select(band_genres.c.genre_id).where(band_genres.c.band_id == obj.id)).scalars())
+    old_listed = (now_listed - ids(listed.added)) | ids(listed.deleted)
+    new_primary = ids(primary.added or primary.unchanged)
+    old_primary = ids(primary.deleted) if primary.deleted else new_primary
+    return old_primary | old_listed, new_primary | now_listed
+
+
+def _update_genre_stats(session, connection, changes):
+    """Bring genre_stats up to date with this flush; returns the genre ids
+    whose subtree band count (the one pages show) changed"""
+    genres_changed = any(isinstance(obj, Genre) for obj in
+                         list(session.new) + list(session.dirty) + list(session.deleted))
+    if genres_changed:
+        parents = _genre_parent_map(connection)
+        touched = {entity_id for entity_type, entity_id in changes if entity_type == 'genre'}
+        stats = count_genre_stats(connection, _reachable(touched & parents.keys(), parents), parents)
+        table = GenreStats.__table__
+        shown_before = dict(connection.execute(
+            db.select(table.c.genre_id, table.c.subtree_bands).where(table.c.genre_id.in_(stats))).all())
+        write_genre_stats(connection, stats, remove=touched - parents.keys())
+        return {genre_id for genre_id, (_, subtree, _) in stats.items() if shown_before.get(genre_id) != subtree}
+
+    band_sets = []
+    for obj in session.new:
+        if isinstance(obj, Band):
+            band_sets.append(_band_genre_sets(connection, obj, 'insert'))
+    for obj in session.dirty:
+        if isinstance(obj, Band) and session.is_modified(obj):
+            band_sets.append(_band_genre_sets(connection, obj, 'update'))
+    for obj in session.deleted:
+        if isinstance(obj, Band):
+            band_sets.append(_band_genre_sets(connection, obj, 'delete'))
+    band_sets = [(old, new) for old, new in band_sets if old != new]
+    if not band_sets:
+        return set()
+
+    parents = _genre_parent_map(connection)
+    deltas = {}  # genre id -> [direct delta, subtree delta]
+    for old, new in band_sets:
+        old_tree, new_tree = _reachable(old & parents.keys(), parents), _reachable(new & parents.keys(), parents)
+        for genre_id, sign in [(g, 1) for g in new - old] + [(g, -1) for g in old - new]:
+            deltas.setdefault(genre_id, [0, 0])[0] += sign
+        for genre_id, sign in [(g, 1) for g in new_tree - old_tree] + [(g, -1) for g in old_tree - new_tree]:
+            deltas.setdefault(genre_id, [0, 0])[1] += sign
+    deltas = {genre_id: delta for genre_id, delta in deltas.items() if genre_id in parents and delta != [0, 0]}
+    if not deltas:
+        return set()
+
+    table = GenreStats.__table__
+    stored = set(connection.execute(
+        db.select(table.c.genre_id).where(table.c.genre_id.in_(deltas))).scalars())
+    by_delta = {}
+    for genre_id in stored:
+        by_delta.setdefault(tuple(deltas[genre_id]), []).append(genre_id)
+    for (direct, subtree), genre_ids in by_delta.items():
+        connection.execute(table.update().where(table.c.genre_id.in_(genre_ids)).values(
+            direct_bands=table.c.direct_bands + direct, subtree_bands=table.c.subtree_bands + subtree))
+    # Genres without a row yet (e.g. counters never built): count them properly
+    missing = deltas.keys() - stored
+    if missing:
+        write_genre_stats(connection, count_genre_stats(connection, missing, parents))
+    return {genre_id for genre_id, (_, subtree) in deltas.items() if subtree} | missing
+
+
+def get_data_version():
+    """Current data version (0 if nothing has ever been written)"""
+    version = db.session.execute(
+        db.select(DataVersion.version).where(DataVersion.id == 1)).scalar()
+    return version or 0
+
+
+def _log_reset_since(version):
+    """Whether a 'reset' was logged after `version` (pruning logs one too)"""
+    table = ChangeLog.__table__
+    return db.session.execute(db.select(db.exists().where(
+        table.c.version > version, table.c.action == 'reset'))).scalar()
+
+
+def get_changes_since(version, limit=None):
+    """Changes made after `version`.
+
+    Returns (current version, changes) where changes is a list of ChangeLog
+    rows in version order, or None when the caller can't catch up from the
+    log (the data was reset, the log was pruned past `version`, `version` is
+    from the future, or there are more than `limit` rows) and has to reload
+    everything.
+    """
+    current = get_data_version()
+    if version > current:
+        return current, None
+    if version == current:
+        return current, []
+    if _log_reset_since(version):
+        return current, None
+
+    query = ChangeLog.query.filter(ChangeLog.version > version).order_by(ChangeLog.version, ChangeLog.id)
+    rows = query.all() if limit is None else query.limit(limit + 1).all()
+    if limit is not None and len(rows) > limit:
+        return current, None
+    return current, rows
+
+
+def get_changed_entities(version, entity_types, limit):
+    """Distinct (entity type, entity id) pairs of `entity_types` changed
+    after `version`, without reading the log rows themselves.
+
+    Returns (current version, pairs), with None instead of the pairs when
+    the caller has to reload everything (as for get_changes_since(), or
+    more than `limit` entities changed). At most limit + 1 pairs are read.
+    """
+    current = get_data_version()
+    if version > current:
+        return current, None
+    if version == current:
+        return current, []
+    if _log_reset_since(version):
+        return current, None
+
+    table = ChangeLog.__table__
+    pairs = db.session.execute(
+        db.select(table.c.entity_type, table.c.entity_id)
+        .where(table.c.version > version, table.c.entity_type.in_(entity_types))
+        .distinct()
+        .limit(limit + 1)).all()
+    if len(pairs) > limit:
+        return current, None
+    return current, [tuple(pair) for pair in pairs]
+
+
+def prune_change_log(keep_versions):
+    """Delete change log entries more than `keep_versions` versions old;
+    returns how many.
+
+    A 'reset' entry is left at the cutoff, so anyone catching up from before
+    it reloads everything instead of missing the pruned changes.
+    """
+    current = get_data_version()
+    cutoff = current - keep_versions
+    if cutoff <= 0:
+        return 0
+    table = ChangeLog.__table__
+    connection = db.session.connection()
+    deleted = connection.execute(table.delete().where(table.c.version <= cutoff)).rowcount
+    if deleted:
+        connection.execute(table.insert().values(version=cutoff, entity_type='all', entity_id='*',
+                                                 action='reset'))
+    db.session.commit()
+    return deleted
+
+
+def reset_data_version(start_version):
+    """Record a full data reset (e.g. init_db.py recreating every table).
+
+    Carries the counter on from `start_version` so it stays monotonic across
+    the rebuild, and logs a 'reset' entry telling caches to reload.
+    """
+    connection = db.session.connection()
+    table = DataVersion.__table__
+    connection.execute(table.delete())
+    connection.execute(table.insert().values(id=1, version=start_version))
+    version = bump_data_version(connection, {('all', '*'): 'reset'})
+    db.session.commit()
+    return version
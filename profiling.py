@@ -0,0 +1,184 @@
+"""
+Opt-in profiling for development and staging (PROFILING_ENABLED=true).
+
+Three checks run on every request while enabled:
+  - N+1 detector: the same SQL statement run PROFILE_N_PLUS_ONE_THRESHOLD
+    times in one request is logged once, with the template line or code
+    location that triggered it (typically a lazy load such as
+    `genre.all_bands` inside a loop)
+  - Slow queries: statements slower than PROFILE_SLOW_QUERY_MS are logged
+    with their EXPLAIN plan
+  - Sampling profiler: PROFILE_SAMPLE_RATE of requests run under cProfile;
+    the ones slower than PROFILE_THRESHOLD_MS are saved to PROFILE_DIR
+    (open them with `python -m pstats` or snakeviz)
+
+Everything is logged through app.logger at WARNING level.
+"""
+
+import cProfile
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# EXPLAIN syntax per database dialect
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+_this_file = os.path.abspath(__file__)
+
+
+class QueryProfile:
+    """Per-request state (stored on flask.g)"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statement_counts = {}
+        self.reported = set()
+        self.profiler = None
+
+
+def _query_profile():
+    if not has_request_context():
+        return None
+    return g.get('_query_profile')
+
+
+def find_trigger_location():
+    """Where in our code (or templates) the current query came from.
+
+    Walks the stack from the innermost frame and returns the first frame
+    that is a Jinja template ('templates/index.html:57') or a file in the
+    app directory ('app.py:210 in admin'). Returns None if nothing matches.
+    """
+    root = current_app.root_path
+    frame = sys._getframe(1)
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            lineno = template.get_corresponding_lineno(frame.f_lineno)
+            filename = template.filename or '<template>'
+            if os.path.isabs(filename):
+                filename = os.path.relpath(filename, root)
+            return f'{filename}:{lineno}'
+
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (filename.startswith(root + os.sep) and filename != _this_file
+                and 'site-packages' not in filename and os.sep + '.venv' not in filename):
+            return f'{os.path.relpath(filename, root)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def _explain(conn, statement, parameters):
+    """EXPLAIN plan for a SELECT as text, or None if not supported"""
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith('SELECT'):
+        return None
+    conn.info['profiling_explain'] = True  # Don't profile the EXPLAIN itself
+    try:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    except Exception as e:
+        return f'(EXPLAIN failed: {e})'
+    finally:
+        conn.info['profiling_explain'] = False
+    return '\n'.join('  ' + ' | '.join(str(value) for value in row) for row in rows)
+
+
+# =============================================================================
+# SQLAlchemy hooks
+# =============================================================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profiling_start_time', []).append((context, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['profiling_start_time'].pop()[1]
+    profile = _query_profile()
+    if profile is None or conn.info.get('profiling_explain'):
+        return
+    config = current_app.config
+
+    # N+1: the same statement (different parameters) over and over
+    count = profile.statement_counts.get(statement, 0) + 1
+    profile.statement_counts[statement] = count
+    if count >= config['PROFILE_N_PLUS_ONE_THRESHOLD'] and statement not in profile.reported:
+        profile.reported.add(statement)
+        current_app.logger.warning(
+            'Possible N+1 in %s %s: statement repeated %d times, triggered at %s\n  %s',
+            request.method, request.path, count, find_trigger_location() or 'unknown location',
+            ' '.join(statement.split()))
+
+    if elapsed * 1000 >= config['PROFILE_SLOW_QUERY_MS'] and not executemany:
+        plan = _explain(conn, statement, parameters)
+        current_app.logger.warning(
+            'Slow query (%.1f ms) in %s %s at %s\n  %s\n  params: %r%s',
+            elapsed * 1000, request.method, request.path, find_trigger_location() or 'unknown location',
+            ' '.join(statement.split()), parameters,
+            f'\n  plan:\n{plan}' if plan else '')
+
+
+# =============================================================================
+# Flask hooks
+# =============================================================================
+
+def _start_request():
+    profile = g._query_profile = QueryProfile()
+    if random.random() < current_app.config['PROFILE_SAMPLE_RATE']:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # Another profiler is already running (e.g. another thread)
+        profile.profiler = profiler
+
+
+def _finish_request(response):
+    profile = _query_profile()
+    if profile is None:
+        return response
+
+    profile.statement_counts.clear()
+    if profile.profiler is None:
+        return response
+    profile.profiler.disable()
+
+    elapsed_ms = (time.perf_counter() - profile.start) * 1000
+    config = current_app.config
+    if elapsed_ms >= config['PROFILE_THRESHOLD_MS']:
+        os.makedirs(config['PROFILE_DIR'], exist_ok=True)
+        endpoint = (request.endpoint or 'unmatched').replace('.', '-')
+        filename = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{endpoint}-{elapsed_ms:.0f}ms.prof'
+        path = os.path.join(config['PROFILE_DIR'], filename)
+        profile.profiler.dump_stats(path)
+        current_app.logger.warning('Slow request %s %s (%.0f ms) profiled to %s',
+                                   request.method, request.path, elapsed_ms, path)
+    return response
+
+
+def _handle_error(context):
+    # Failed statements skip after_cursor_execute; forget their start time
+    if context.connection is not None:
+        starts = context.connection.info.get('profiling_start_time')
+        if starts and starts[-1][0] is context.execution_context:
+            starts.pop()
+
+
+def init_profiling(app):
+    """Install the profiling hooks if PROFILING_ENABLED is set"""
+    if not app.config['PROFILING_ENABLED']:
+        return
+    if not event.contains(Engine, 'after_cursor_execute', _after_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
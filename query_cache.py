@@ -0,0 +1,140 @@
+"""
+Memoized read queries, keyed by their arguments and the data version.
+
+The genre forms list the same genres on every load and on every
+validation-error re-render. A read function decorated with
+@memoized_query keeps its results in a bounded LRU (QUERY_CACHE_SIZE
+entries shared by every memoized function in the process) under
+(function, data version, arguments). Every write bumps the data version,
+so an entry is never read again once the data changes and just ages out;
+a lookup costs one primary-key read of the version instead of the query.
+
+Results are shared between requests and threads: return immutable values
+detached from the session (tuples of read models, not ORM objects).
+
+The cache is skipped - neither read nor filled - when:
+  - the session has flushed writes it hasn't committed yet (its reads
+    can include those rows, and the version it sees isn't final)
+  - the request asks for it: a `Cache-Control: no-cache` header (what a
+    hard reload sends) or bypass_query_cache() in the view
+  - QUERY_CACHE_SIZE is 0
+
+query_cache_stats() counts hits, misses and bypasses per function, plus
+evictions and the current size (admins: /api/query-cache).
+"""
+
+import threading
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from db_routing import RoutingSession
+from models import db, get_data_version
+
+_MISSING = object()
+
+
+class QueryCache:
+    """Bounded LRU of query results with hit/miss counters (thread safe)"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = Counter()  # (function, 'hits'|'misses'|'bypasses') -> count
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, size):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def count(self, name, outcome):
+        with self._lock:
+            self._counts[name, outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            functions = {}
+            for (name, outcome), count in self._counts.items():
+                functions.setdefault(name, {'hits': 0, 'misses': 0, 'bypasses': 0})[outcome] = count
+            return {'size': len(self._entries), 'evictions': self.evictions, 'functions': functions}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counts.clear()
+            self.evictions = 0
+
+
+_cache = QueryCache()
+
+
+def bypass_query_cache():
+    """Run every memoized query in the rest of this request against the database"""
+    g._query_cache_bypass = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['uncommitted_writes'] = True
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _transaction_ended(session, transaction):
+    if transaction.parent is None:  # Committed or rolled back, not a savepoint
+        session.info.pop('uncommitted_writes', None)
+
+
+def _bypassed():
+    if db.session.info.get('uncommitted_writes'):
+        return True
+    if not has_request_context():
+        return False
+    return bool(g.get('_query_cache_bypass') or request.cache_control.no_cache)
+
+
+def memoized_query(func):
+    """Cache `func`'s results per data version; its arguments must be hashable"""
+    name = func.__qualname__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        size = current_app.config['QUERY_CACHE_SIZE']
+        if not size or _bypassed():
+            _cache.count(name, 'bypasses')
+            return func(*args, **kwargs)
+        # Version first: a write landing between the two reads files newer
+        # rows under the older version, never older rows under the newer one
+        key = (name, get_data_version(), args, tuple(sorted(kwargs.items())))
+        value = _cache.get(key)
+        if value is not _MISSING:
+            _cache.count(name, 'hits')
+            return value
+        _cache.count(name, 'misses')
+        value = func(*args, **kwargs)
+        _cache.put(key, value, size)
+        return value
+
+    wrapper.uncached = func
+    return wrapper
+
+
+def query_cache_stats():
+    return _cache.stats()
+
+
+def clear_query_cache():
+    """Forget cached results and counters (tests recreate the database between runs)"""
+    _cache.clear()
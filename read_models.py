@@ -0,0 +1,106 @@
+"""
+Lightweight read models for pages that only display data.
+
+Templates used to receive full SQLAlchemy Genre/Band objects. Each of those
+carries instance state and an identity map entry, and every relationship a
+template touches (`genre.parent.name`, `band.genres`) can fire another
+query while the page renders.
+
+The types here are plain immutable namedtuples filled from column-only
+queries: a fixed number of queries per page, nothing to lazy load, and a
+fraction of the memory. Write paths (forms, edits) still use the models.
+
+The iter_* versions stream: rows arrive in batches (yield_per) and are
+handed on one at a time, so a streamed page or export holds one batch
+however big the catalog is.
+"""
+
+from collections import namedtuple
+from itertools import groupby
+
+from sqlalchemy.orm import aliased
+
+from models import db, Genre, Band, GenreStats, band_genres
+from query_cache import memoized_query
+
+# Rows behind the graph (graph_data.py / graph_index.py)
+GenreRow = namedtuple('GenreRow', 'id name parent_id type subtree_bands', defaults=(0,))
+BandRow = namedtuple('BandRow', 'id name primary_genre_id')
+
+# Rows for the admin tables
+GenreListing = namedtuple('GenreListing', 'id name type parent_id parent_name '
+                          'direct_bands subtree_bands descendant_genres', defaults=(0, 0, 0))
+BandListing = namedtuple('BandListing', 'id name primary_genre_id primary_genre_name genre_names')
+
+# Rows for the genre pickers in the add/edit forms
+GenreOption = namedtuple('GenreOption', 'id name')
+
+
+# Rows fetched per round trip when streaming (server-side cursor on PostgreSQL)
+STREAM_BATCH_SIZE = 500
+
+
+def iter_genres(batch_size=STREAM_BATCH_SIZE):
+    """All genres ordered by name, with their primary parent's name and
+    counters, fetched `batch_size` rows at a time"""
+    parent = aliased(Genre)
+    rows = db.session.execute(
+        db.select(Genre.id, Genre.name, Genre.type, Genre.parent_id, parent.name,
+                  db.func.coalesce(GenreStats.direct_bands, 0),
+                  db.func.coalesce(GenreStats.subtree_bands, 0),
+                  db.func.coalesce(GenreStats.descendant_genres, 0))
+        .outerjoin(parent, Genre.parent_id == parent.id)
+        .outerjoin(GenreStats, GenreStats.genre_id == Genre.id)
+        .order_by(Genre.name)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in rows:
+        yield GenreListing._make(row)
+
+
+def iter_bands(batch_size=STREAM_BATCH_SIZE):
+    """All bands ordered by name, with their primary genre and all genre
+    names, fetched `batch_size` rows at a time: one row per band and genre,
+    grouped back into one listing per band as they arrive"""
+    primary = aliased(Genre)
+    genre = aliased(Genre)
+    rows = db.session.execute(
+        db.select(Band.id, Band.name, Band.primary_genre_id, primary.name, genre.name)
+        .outerjoin(primary, Band.primary_genre_id == primary.id)
+        .outerjoin(band_genres, band_genres.c.band_id == Band.id)
+        .outerjoin(genre, genre.id == band_genres.c.genre_id)
+        .order_by(Band.name, Band.id, genre.name)
+        .execution_options(yield_per=batch_size)
+    )
+    for band, band_rows in groupby(rows, key=lambda row: row[:4]):
+        yield BandListing(*band, tuple(row[4] for row in band_rows if row[4] is not None))
+
+
+def count_genres():
+    return db.session.execute(db.select(db.func.count(Genre.id))).scalar_one()
+
+
+def count_bands():
+    return db.session.execute(db.select(db.func.count(Band.id))).scalar_one()
+
+
+def list_genres():
+    """All genres ordered by name, with their primary parent's name and counters"""
+    return list(iter_genres())
+
+
+def list_bands():
+    """All bands ordered by name, with their primary genre and all genre names"""
+    return list(iter_bands())
+
+
+@memoized_query
+def genre_options(leaf_only=False, exclude=None):
+    """Genres for a form's picker, ordered by name: only leaves (what bands
+    can belong to) with `leaf_only`, all but `exclude` if given"""
+    query = db.select(Genre.id, Genre.name).order_by(Genre.name)
+    if leaf_only:
+        query = query.where(Genre.type == 'leaf')
+    if exclude is not None:
+        query = query.where(Genre.id != exclude)
+    return tuple(GenreOption._make(row) for row in db.session.execute(query))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Verify the denormalized genre counters (genre_stats) against a full
+recount, and rewrite any that are wrong.
+
+The counters are maintained on every write through the ORM, so this is
+only needed after bulk loads that bypass it (raw SQL, Core inserts).
+bootstrap.py creates and fills the table on databases that predate it.
+
+usage:
+# Report and repair
+python rebuild_genre_stats.py
+# Only report; exits 1 if anything is wrong
+python rebuild_genre_stats.py --check
+"""
+
+import argparse
+import sys
+
+from database import create_db_app
+from jobs import enqueue_rebuilds
+from models import db, verify_genre_stats
+
+# Database-only app: scripts don't need the web stack
+app = create_db_app()
+
+
+def format_counts(counts):
+    if counts is None:
+        return 'no row'
+    return 'direct={} subtree={} descendants={}'.format(*counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Verify and rebuild the genre counters.')
+    parser.add_argument('--check', action='store_true', help='only report, never write')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        mismatches = verify_genre_stats(repair=not args.check)
+        if mismatches and not args.check:
+            enqueue_rebuilds()
+            db.session.commit()
+
+    for genre_id, stored, expected in mismatches:
+        print(f"  ✗ {genre_id}: stored {format_counts(stored)}, expected {format_counts(expected)}")
+    if not mismatches:
+        print("✓ All genre counters are correct")
+        return 0
+    if args.check:
+        print(f"\n{len(mismatches)} genre counter(s) wrong - run without --check to repair")
+        return 1
+    print(f"\n✓ Repaired {len(mismatches)} genre counter(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+"Similar genres" and "related bands" for the detail panel.
+
+Built on the band x genre incidence matrix the graph index already holds
+in CSR form (band -> genres and genre -> bands, plus primary genres), and
+on each genre's ancestry in the genre DAG:
+
+  - genres: cosine similarity of their band columns, blended with the
+    Jaccard overlap of their ancestor sets (shared ancestry)
+  - bands: Jaccard overlap of their genre rows, blended with the overlap
+    of those genres plus all their ancestors
+
+Candidates are only the genres/bands that actually share something (a
+band, a genre, a parent), so nothing is compared all-against-all.
+
+Every entity's panel (its SIMILARITY_TOP_K neighbours, and the genres or
+bands those suggest) is computed by the background worker ('similarity' in
+jobs.py) and stored in the similarity_panels table, so panel requests are
+one primary key lookup. When the data changes, the change log says which
+genres and bands were touched: only their panels (and those of bands
+sharing a touched genre) are recomputed. A reset in the log, or a very
+large change set, starts over. While a newer version is being computed,
+web workers serve the stored panels, marked stale.
+"""
+
+import heapq
+import json
+import math
+
+from analytics import genre_edges, membership_edges
+from graph_index import get_graph_index
+from graph_paths import PathCache
+from models import db, SimilarityPanel, get_changes_since
+
+ANCESTRY_WEIGHT = 0.3         # Share of the score that comes from shared ancestry
+MAX_CANDIDATES = 500          # Most bands compared against any one band
+INCREMENTAL_LIMIT = 1000      # More changed entities than this: rebuild from scratch
+PANEL_CACHE_SIZE = 1024       # Most recently requested panels kept per process
+WRITE_BATCH_SIZE = 1000       # Panels per INSERT when storing them
+
+
+class SimilarityModel:
+    """Sparse vectors for one graph index, and the scores between them"""
+
+    def __init__(self, index):
+        self.index = index
+        genre_count, band_count = index.genre_count, index.band_count
+        self.band_genres = [set() for _ in range(band_count)]
+        self.genre_bands = [set() for _ in range(genre_count)]
+        for band, genre in membership_edges(index):
+            self.band_genres[band].add(genre)
+            self.genre_bands[genre].add(band)
+
+        self.parents = [set() for _ in range(genre_count)]
+        self.children = [set() for _ in range(genre_count)]
+        for child, parent in genre_edges(index):
+            if child != parent:
+                self.parents[child].add(parent)
+                self.children[parent].add(child)
+        self._ancestry = {}
+        self._expanded = {}
+
+    def ancestry(self, genre):
+        """The genre and all of its ancestors (the DAG may have several paths)"""
+        result = self._ancestry.get(genre)
+        if result is None:
+            result = {genre}
+            stack = [genre]
+            while stack:
+                for parent in self.parents[stack.pop()]:
+                    if parent not in result:
+                        result.add(parent)
+                        stack.append(parent)
+            result = self._ancestry[genre] = frozenset(result)
+        return result
+
+    def expanded_genres(self, band):
+        """A band's genres plus all their ancestors"""
+        result = self._expanded.get(band)
+        if result is None:
+            result = set()
+            for genre in self.band_genres[band]:
+                result |= self.ancestry(genre)
+            result = self._expanded[band] = frozenset(result)
+        return result
+
+    def similar_genres(self, genre, k):
+        """[(genre position, score)] of the k most similar genres"""
+        bands = self.genre_bands[genre]
+        candidates = set()
+        for band in list(bands)[:MAX_CANDIDATES]:
+            candidates |= self.band_genres[band]
+        for parent in self.parents[genre]:
+            candidates.add(parent)
+            candidates |= self.children[parent]  # Siblings
+        candidates |= self.children[genre]
+        candidates.discard(genre)
+
+        ancestry = self.ancestry(genre)
+        scored = []
+        for other in candidates:
+            other_bands = self.genre_bands[other]
+            cosine = (len(bands & other_bands) / math.sqrt(len(bands) * len(other_bands))
+                      if bands and other_bands else 0.0)
+            other_ancestry = self.ancestry(other)
+            shared_ancestry = len(ancestry & other_ancestry) / len(ancestry | other_ancestry)
+            score = (1 - ANCESTRY_WEIGHT) * cosine + ANCESTRY_WEIGHT * shared_ancestry
+            if score > 0:
+                scored.append((score, other))
+        return _top(scored, k, self.index.genre_ids)
+
+    def related_bands(self, band, k):
+        """[(band position, score)] of the k most related bands"""
+        genres = self.band_genres[band]
+        # Smallest genres first: their members are the most telling candidates
+        candidates = set()
+        for genre in sorted(genres, key=lambda g: len(self.genre_bands[g])):
+            for other in self.genre_bands[genre]:
+                candidates.add(other)
+                if len(candidates) > MAX_CANDIDATES:
+                    break
+            if len(candidates) > MAX_CANDIDATES:
+                break
+        candidates.discard(band)
+
+        expanded = self.expanded_genres(band)
+        scored = []
+        for other in candidates:
+            other_genres = self.band_genres[other]
+            direct = len(genres & other_genres) / len(genres | other_genres)
+            other_expanded = self.expanded_genres(other)
+            shared_ancestry = len(expanded & other_expanded) / len(expanded | other_expanded)
+            scored.append(((1 - ANCESTRY_WEIGHT) * direct + ANCESTRY_WEIGHT * shared_ancestry, other))
+        return _top(scored, k, self.index.band_ids)
+
+
+def _top(scored, k, ids):
+    """Best k (position, score) pairs; ties broken by id so results are stable"""
+    best = heapq.nsmallest(k, scored, key=lambda pair: (-pair[0], ids.raw(pair[1])))
+    return [(position, round(score, 4)) for score, position in best]
+
+
+def genre_panel(model, genre, k):
+    """Similar genres of a genre (position) and the bands of those genres
+    it doesn't have yet, as [[id, score]] lists"""
+    index = model.index
+    similar = model.similar_genres(genre, k)
+    own_bands = model.genre_bands[genre]
+    band_scores = {}
+    for other, score in similar:
+        for band in model.genre_bands[other] - own_bands:
+            band_scores[band] = max(band_scores.get(band, 0), score)
+    related = _top([(score, band) for band, score in band_scores.items()], k, index.band_ids)
+    return {
+        'similar_genres': [[index.genre_ids[g], score] for g, score in similar],
+        'related_bands': [[index.band_ids[b], score] for b, score in related],
+    }
+
+
+def band_panel(model, band, k):
+    """Related bands of a band (position) and the genres those share that it
+    isn't in yet, as [[id, score]] lists"""
+    index = model.index
+    related = model.related_bands(band, k)
+    own_genres = model.band_genres[band]
+    genre_scores = {}
+    for other, score in related:
+        for genre in model.band_genres[other] - own_genres:
+            genre_scores[genre] = genre_scores.get(genre, 0) + score
+    similar = _top([(score, genre) for genre, score in genre_scores.items()], k, index.genre_ids)
+    return {
+        'similar_genres': [[index.genre_ids[g], score] for g, score in similar],
+        'related_bands': [[index.band_ids[b], score] for b, score in related],
+    }
+
+
+# =============================================================================
+# Stored panels: written by the worker, read by web workers
+# =============================================================================
+
+def _stored_state():
+    """(version, k) of the stored panels, or None before the first run"""
+    table = SimilarityPanel.__table__
+    row = db.session.execute(db.select(table.c.version, table.c.data).where(
+        table.c.entity_type == 'all', table.c.entity_id == '*')).one_or_none()
+    return None if row is None else (row.version, json.loads(row.data)['k'])
+
+
+def stored_similarity_version():
+    """Data version of the stored panels (None before the first run)"""
+    state = _stored_state()
+    return None if state is None else state[0]
+
+
+def _affected(index, model, changes):
+    """Genre and band positions whose panels `changes` can affect, and the
+    ids of changed entities that no longer exist"""
+    changed_genres = {c.entity_id for c in changes if c.entity_type == 'genre'}
+    changed_bands = {c.entity_id for c in changes if c.entity_type == 'band'}
+    if not changed_genres and not changed_bands:
+        return [], [], []
+
+    # Genre scores depend on band columns and ancestry across the whole
+    # DAG; there are few genres, so they're always recomputed
+    genres = list(range(index.genre_count))
+    # Band lists depend on the members of their genres: recompute every
+    # band in a touched genre. Bands that left one are touched themselves.
+    bands = set()
+    for band_id in changed_bands:
+        position = index.band_index(band_id)
+        if position >= 0:
+            bands.add(position)
+    for genre_id in changed_genres:
+        position = index.genre_index(genre_id)
+        if position >= 0:
+            bands |= model.genre_bands[position]
+    gone = [('genre', genre_id) for genre_id in changed_genres if index.genre_index(genre_id) < 0]
+    gone += [('band', band_id) for band_id in changed_bands if index.band_index(band_id) < 0]
+    return genres, sorted(bands), gone
+
+
+def update_similarity(index, k):
+    """Store the panels for `index`'s version, recomputing only the ones the
+    change log says may have changed since the stored version (or all of
+    them). The caller commits. Returns how many panels were written."""
+    table = SimilarityPanel.__table__
+    state = _stored_state()
+    if state is not None and state[0] >= index.version and state[1] == k:
+        return 0
+
+    model = SimilarityModel(index)
+    changes = None
+    if state is not None and state[1] == k:
+        _, changes = get_changes_since(state[0], INCREMENTAL_LIMIT)
+    if changes is None:
+        db.session.execute(table.delete())
+        state = None
+        genres, bands = range(index.genre_count), range(index.band_count)
+    else:
+        genres, bands, gone = _affected(index, model, [c for c in changes if c.version <= index.version])
+        stale = [('genre', index.genre_ids[g]) for g in genres] + [('band', index.band_ids[b]) for b in bands]
+        for start in range(0, len(stale) + len(gone), WRITE_BATCH_SIZE):
+            keys = (stale + gone)[start:start + WRITE_BATCH_SIZE]
+            db.session.execute(table.delete().where(db.tuple_(table.c.entity_type, table.c.entity_id).in_(keys)))
+
+    def panels():
+        for genre in genres:
+            yield 'genre', index.genre_ids[genre], genre_panel(model, genre, k)
+        for band in bands:
+            yield 'band', index.band_ids[band], band_panel(model, band, k)
+
+    written = 0
+    batch = []
+    for entity_type, entity_id, panel in panels():
+        batch.append({'entity_type': entity_type, 'entity_id': entity_id, 'version': index.version,
+                      'data': json.dumps(panel, separators=(',', ':'))})
+        if len(batch) >= WRITE_BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        written += len(batch)
+
+    marker = {'version': index.version, 'data': json.dumps({'k': k})}
+    if state is None:
+        db.session.execute(table.insert().values(entity_type='all', entity_id='*', **marker))
+    else:
+        db.session.execute(table.update().where(
+            table.c.entity_type == 'all', table.c.entity_id == '*').values(**marker))
+    return written
+
+
+_stored_version = None  # Version of the stored panels last seen
+_panels = PathCache(PANEL_CACHE_SIZE)  # (stored version, entity type, id) -> panel
+
+
+def get_similar(version, entity_type, entity_id):
+    """Similar genres and related bands for a detail panel, as the worker
+    last stored them.
+
+    Returns (panel, stored version): the stored version is None until the
+    worker's first run has finished, and older than `version` while it
+    computes a newer one. The panel is None if the entity doesn't exist.
+    """
+    global _stored_version
+    stored = _stored_version
+    if stored != version:
+        stored = _stored_version = stored_similarity_version()
+    if stored is None:
+        return None, None
+
+    index = get_graph_index(version)
+    exists = index.genre_index(entity_id) if entity_type == 'genre' else index.band_index(entity_id)
+    if exists < 0:
+        return None, stored  # Not cached: ids come from anonymous requests
+
+    key = (stored, entity_type, entity_id)
+    panel = _panels.get(key)
+    if panel is None:
+        table = SimilarityPanel.__table__
+        data = db.session.execute(db.select(table.c.data).where(
+            table.c.entity_type == entity_type, table.c.entity_id == entity_id)).scalar()
+        # No row yet: added since the stored version
+        data = json.loads(data) if data is not None else {'similar_genres': [], 'related_bands': []}
+        panel = {
+            'similar_genres': _named(data['similar_genres'], index.genre_ids, index.genre_names),
+            'related_bands': _named(data['related_bands'], index.band_ids, index.band_names),
+        }
+        _panels.put(key, panel)
+    return panel, stored
+
+
+def _named(pairs, ids, names):
+    """[{'id', 'name', 'score'}] for stored [id, score] pairs, without
+    entities that no longer exist"""
+    result = []
+    for entity_id, score in pairs:
+        position = ids.find(entity_id)
+        if position >= 0:
+            result.append({'id': entity_id, 'name': names[position], 'score': score})
+    return result
+
+
+def clear_similarity():
+    """Forget cached panels (tests recreate the database between runs)"""
+    global _stored_version
+    _stored_version = None
+    _panels.clear()
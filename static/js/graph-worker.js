@@ -0,0 +1,180 @@
+/*
+ * Graph loading off the main thread, with an IndexedDB cache.
+ *
+ * The page keeps the last graph payload it rendered in IndexedDB and tells
+ * the server its version (graph_cache cookie). The server then sends only
+ * what changed since, and this worker patches the cached payload - the
+ * whole graph is downloaded and parsed once, not on every visit.
+ *
+ * Messages in (all answered with {id, data, stored} or {id, error}):
+ *   {type: 'embedded', text, budget}       parse a payload embedded in the page
+ *   {type: 'cached', version, patch, budget, url}
+ *                                          cached payload at `version` plus a patch
+ *                                          (fetches `url` if the cache can't serve it)
+ *   {type: 'fetch', url, budget}           download a fresh payload
+ *   {type: 'patch', since, patch}          apply a live update to the cache
+ *
+ * `stored` is the version now in the cache, or null if it was dropped.
+ */
+
+var DB_NAME = 'music-graph';
+var STORE = 'graph';
+var KEY = 'current';
+
+function openDatabase() {
+    return new Promise(function (resolve, reject) {
+        var request = indexedDB.open(DB_NAME, 1);
+        request.onupgradeneeded = function () {
+            request.result.createObjectStore(STORE);
+        };
+        request.onsuccess = function () { resolve(request.result); };
+        request.onerror = function () { reject(request.error); };
+    });
+}
+
+function transact(mode, action) {
+    return openDatabase().then(function (db) {
+        return new Promise(function (resolve, reject) {
+            var transaction = db.transaction(STORE, mode);
+            var request = action(transaction.objectStore(STORE));
+            transaction.oncomplete = function () {
+                db.close();
+                resolve(request.result);
+            };
+            transaction.onerror = function () {
+                db.close();
+                reject(transaction.error);
+            };
+        });
+    });
+}
+
+function readCache() {
+    return transact('readonly', function (store) { return store.get(KEY); });
+}
+
+// A failed write (quota, private browsing) just means no cache next time
+function writeCache(record) {
+    return transact('readwrite', function (store) { return store.put(record, KEY); })
+        .then(function () { return record.data.version; })
+        .catch(function () { return null; });
+}
+
+function dropCache() {
+    return transact('readwrite', function (store) { return store.delete(KEY); })
+        .catch(function () {})
+        .then(function () { return null; });
+}
+
+function fetchGraph(url) {
+    return fetch(url, { credentials: 'same-origin' }).then(function (response) {
+        if (!response.ok) {
+            throw new Error('Graph request failed: ' + response.status);
+        }
+        return response.json();
+    });
+}
+
+// Same merge semantics as DataSet.update()/remove() on the page. Returns
+// false when a clustered payload would need nodes it doesn't hold.
+function applyPatch(data, patch) {
+    var nodeIndex = new Map();
+    data.nodes.forEach(function (node, i) { nodeIndex.set(node.id, i); });
+    if (data.lod && patch.nodes.upsert.some(function (node) { return !nodeIndex.has(node.id); })) {
+        return false;
+    }
+
+    var removedNodes = new Set(patch.nodes.remove);
+    removedNodes.forEach(function (nodeId) {
+        if (nodeIndex.has(nodeId)) {
+            delete data.entities[data.nodes[nodeIndex.get(nodeId)].group + 's'][nodeId];
+        }
+    });
+    patch.nodes.upsert.forEach(function (node) {
+        if (nodeIndex.has(node.id)) {
+            var i = nodeIndex.get(node.id);
+            data.nodes[i] = Object.assign({}, data.nodes[i], node);
+        } else {
+            nodeIndex.set(node.id, data.nodes.length);
+            data.nodes.push(node);
+        }
+    });
+    data.nodes = data.nodes.filter(function (node) { return !removedNodes.has(node.id); });
+
+    var removedEdges = new Set(patch.edges.remove);
+    var edgeIndex = new Map();
+    data.edges.forEach(function (edge, i) { edgeIndex.set(edge.id, i); });
+    patch.edges.upsert.forEach(function (edge) {
+        if (edgeIndex.has(edge.id)) {
+            data.edges[edgeIndex.get(edge.id)] = edge;
+        } else {
+            edgeIndex.set(edge.id, data.edges.length);
+            data.edges.push(edge);
+        }
+    });
+    data.edges = data.edges.filter(function (edge) { return !removedEdges.has(edge.id); });
+
+    ['bands', 'genres'].forEach(function (kind) {
+        Object.keys(patch.entities[kind]).forEach(function (entityId) {
+            if (nodeIndex.has(entityId)) {
+                data.entities[kind][entityId] = patch.entities[kind][entityId];
+            }
+        });
+    });
+    data.version = patch.version;
+    return true;
+}
+
+// Store first: the page mutates its copy of the nodes as it renders them
+function storeAndReturn(data, budget) {
+    return writeCache({ data: data, budget: budget }).then(function (stored) {
+        return { data: data, stored: stored };
+    });
+}
+
+function fresh(url, budget) {
+    return fetchGraph(url).then(function (data) { return storeAndReturn(data, budget); });
+}
+
+function handle(message) {
+    switch (message.type) {
+    case 'embedded':
+        return storeAndReturn(JSON.parse(message.text), message.budget);
+    case 'fetch':
+        return fresh(message.url, message.budget);
+    case 'cached':
+        return readCache().catch(function () { return null; }).then(function (record) {
+            if (!record || record.budget !== message.budget || record.data.version !== message.version) {
+                return fresh(message.url, message.budget);
+            }
+            if (message.patch && message.patch.version !== record.data.version) {
+                if (!applyPatch(record.data, message.patch)) {
+                    return fresh(message.url, message.budget);
+                }
+                return storeAndReturn(record.data, message.budget);
+            }
+            return { data: record.data, stored: record.data.version };
+        });
+    case 'patch':
+        return readCache().then(function (record) {
+            if (!record || record.data.version !== message.since) {
+                return { data: null, stored: record ? record.data.version : null };
+            }
+            if (!applyPatch(record.data, message.patch)) {
+                return dropCache().then(function () { return { data: null, stored: null }; });
+            }
+            return writeCache(record).then(function (stored) { return { data: null, stored: stored }; });
+        });
+    default:
+        return Promise.reject(new Error('Unknown message ' + message.type));
+    }
+}
+
+self.onmessage = function (event) {
+    var message = event.data;
+    handle(message).then(function (result) {
+        self.postMessage({ id: message.id, data: result.data, stored: result.stored });
+    }).catch(function (error) {
+        self.postMessage({ id: message.id, error: String(error) });
+    });
+};
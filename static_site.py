@@ -0,0 +1,228 @@
+"""
+Static export of the public graph page, for serving from a bucket or CDN.
+
+`flask graph freeze` (or the 'static_site' background job in jobs.py,
+queued after every data change when STATIC_SITE_DIR is set) writes:
+
+  index.html                     the graph page as anonymous visitors see it,
+                                 with no graph embedded
+  version.json                   {"version": N, "graph": ".../graph.json", ...}:
+                                 open pages poll it and reload when it changes
+  graph/<N>/graph.json           the graph payload for data version N, with
+                                 precomputed node positions (the page turns
+                                 physics off, so nothing is laid out in the browser)
+  graph/<N>/expand/<genre>.json  clustered catalogs only: every genre's expansion
+  static/                        stylesheet, scripts and fingerprinted copies
+
+graph/<N>/ never changes once written, so it can be cached forever; serve
+index.html and version.json with a short max-age (or no-cache). The last
+KEEP_VERSIONS payloads are kept so pages still on an older version can
+finish loading. The export is meant for the root of a domain (static
+URLs are root-relative) - route /login and the admin pages to Flask.
+
+The path finder and the similar genres/bands lists need the server and
+are left out of the static page. A freeze is skipped when the output is
+already at the current data version (--force rewrites it).
+"""
+
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import click
+from flask import current_app, render_template
+from flask.cli import AppGroup, with_appcontext
+
+from graph_index import NO_PARENT, get_graph_index
+from graph_lod import build_graph_expansion, build_graph_view, get_level_index
+
+KEEP_VERSIONS = 3
+VERSION_FILE = 'version.json'
+
+# Layout: genres on rings by depth, bands on a circle around their primary genre
+GENRE_RING = 300
+BAND_RADIUS = 60
+BAND_SPACING = 12
+
+
+# =============================================================================
+# Layout
+# =============================================================================
+
+def compute_layout(levels):
+    """(genre positions, band positions) as lists of (x, y), indexed like
+    the graph index: a radial tree where each subtree gets an angle in
+    proportion to its size"""
+    index = levels.index
+    genre_count = index.genre_count
+    order = sorted(range(genre_count), key=lambda g: levels.depth[g])
+    weight = [1.0] * genre_count
+    for genre in reversed(order):
+        if levels.children[genre]:
+            weight[genre] = sum(weight[child] for child in levels.children[genre])
+
+    roots = sorted((g for g in range(genre_count) if levels.depth[g] == 0), key=lambda g: index.genre_names[g])
+    ring_offset = 0 if len(roots) == 1 else 1  # A single root sits in the middle
+    spans = {}
+    start = 0.0
+    total = sum(weight[root] for root in roots) or 1.0
+    for root in roots:
+        spans[root] = (start, 2 * math.pi * weight[root] / total)
+        start += spans[root][1]
+
+    genre_xy = [(0, 0)] * genre_count
+    for genre in order:
+        start, width = spans[genre]
+        radius = GENRE_RING * (levels.depth[genre] + ring_offset)
+        angle = start + width / 2
+        genre_xy[genre] = (round(radius * math.cos(angle)), round(radius * math.sin(angle)))
+        child_start = start
+        for child in levels.children[genre]:
+            spans[child] = (child_start, width * weight[child] / weight[genre])
+            child_start += spans[child][1]
+
+    band_xy = [(0, 0)] * index.band_count
+    for genre in range(genre_count):
+        bands = levels.bands(genre)
+        if not len(bands):
+            continue
+        gx, gy = genre_xy[genre]
+        radius = max(BAND_RADIUS, BAND_SPACING * len(bands) / (2 * math.pi))
+        for k, band in enumerate(bands):
+            angle = 2 * math.pi * k / len(bands)
+            band_xy[band] = (round(gx + radius * math.cos(angle)), round(gy + radius * math.sin(angle)))
+    # Bands without a primary genre: a spiral around the middle
+    homeless = [b for b in range(index.band_count) if index.band_primary_genre[b] == NO_PARENT]
+    for k, band in enumerate(homeless):
+        angle = k * 2.4
+        radius = BAND_SPACING * math.sqrt(k + 1)
+        band_xy[band] = (round(radius * math.cos(angle)), round(radius * math.sin(angle)))
+    return genre_xy, band_xy
+
+
+def apply_layout(data, levels, layout):
+    """Give every node in a graph payload its precomputed position"""
+    index = levels.index
+    genre_xy, band_xy = layout
+    for node in data['nodes']:
+        if node['group'] == 'genre':
+            position = index.genre_index(node['id'])
+            x, y = genre_xy[position] if position >= 0 else (0, 0)
+        else:
+            position = index.band_index(node['id'])
+            x, y = band_xy[position] if position >= 0 else (0, 0)
+        node['x'] = x
+        node['y'] = y
+    data['layout'] = True
+    return data
+
+
+# =============================================================================
+# Export
+# =============================================================================
+
+def _write(path, text):
+    """Write atomically: readers see the old file or the new one"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.freeze-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _dump(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+def frozen_version(output_dir):
+    """Data version of the export in `output_dir` (None if there isn't one)"""
+    try:
+        with open(os.path.join(output_dir, VERSION_FILE)) as f:
+            return json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def freeze(output_dir, force=False):
+    """Write the static site for the current data version into
+    `output_dir`; returns the version written, or None if it was already
+    there. Needs an app context of the web app (for the templates)."""
+    app = current_app._get_current_object()
+    budget = app.config['GRAPH_NODE_BUDGET']
+    get_graph_index(fresh=True)  # The current version, not one still being snapshotted
+    data = build_graph_view(budget)
+    version = data['version']
+    if not force and frozen_version(output_dir) == version \
+            and os.path.exists(os.path.join(output_dir, 'index.html')):
+        return None
+
+    levels = get_level_index(version)
+    layout = compute_layout(levels)
+    version_dir = os.path.join(output_dir, 'graph', str(version))
+    _write(os.path.join(version_dir, 'graph.json'), _dump(apply_layout(data, levels, layout)))
+    if data['lod']:
+        index = levels.index
+        for genre in range(index.genre_count):
+            if levels.children[genre] or len(levels.bands(genre)):
+                genre_id = index.genre_ids[genre]
+                expansion = build_graph_expansion(genre_id, budget)
+                _write(os.path.join(version_dir, 'expand', f'{genre_id}.json'),
+                       _dump(apply_layout(expansion, levels, layout)))
+
+    # Static files as the app serves them (fingerprinted copies included)
+    shutil.copytree(app.static_folder, os.path.join(output_dir, 'static'), dirs_exist_ok=True)
+
+    graph_url = f'graph/{version}/graph.json'
+    site = {'version': version, 'graph': graph_url, 'expand': f'graph/{version}/expand/__id__.json'}
+    graph_boot = {'budget': budget, 'cached': version, 'patch': None, 'version': version, 'static': site}
+    with app.test_request_context('/'):
+        page = render_template('index.html', graph_data=None, graph_boot=graph_boot)
+    _write(os.path.join(output_dir, 'index.html'), page)
+    _write(os.path.join(output_dir, VERSION_FILE), _dump(site))  # Last: pages switch once it's all there
+
+    _prune(output_dir, version)
+    return version
+
+
+def _prune(output_dir, current):
+    """Delete all but the newest KEEP_VERSIONS graph payloads"""
+    graph_dir = os.path.join(output_dir, 'graph')
+    versions = sorted((int(name) for name in os.listdir(graph_dir) if name.isdigit()), reverse=True)
+    for version in versions[KEEP_VERSIONS:]:
+        if version != current:
+            shutil.rmtree(os.path.join(graph_dir, str(version)), ignore_errors=True)
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+graph_cli = AppGroup('graph', help='Graph exports.')
+
+
+@graph_cli.command('freeze')
+@click.option('--output', '-o', default=None, help='Directory to write (default: STATIC_SITE_DIR).')
+@click.option('--force', is_flag=True, help='Rewrite even if the output is at the current version.')
+@with_appcontext
+def freeze_command(output, force):
+    """Write the public graph page as a static site."""
+    output = output or current_app.config['STATIC_SITE_DIR']
+    if not output:
+        raise click.UsageError('Pass --output or set STATIC_SITE_DIR.')
+    version = freeze(output, force=force)
+    if version is None:
+        click.echo(f'✓ {output} is already at data version {frozen_version(output)}')
+    else:
+        click.echo(f'✓ Static site for data version {version} written to {output}')
+
+
+def init_static_site(app):
+    """Register `flask graph freeze`"""
+    app.cli.add_command(graph_cli)
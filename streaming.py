@@ -0,0 +1,85 @@
+"""
+Streamed responses for pages and dumps that grow with the catalog.
+
+render_template() builds the whole page before the first byte goes out, so
+time to first byte and memory both grow with the number of rows. Here the
+template is rendered with stream_template() while it loops over the read
+models' iter_* generators (read_models.py), which fetch rows in batches
+with yield_per: the response starts as soon as the first rows are read
+and never holds more than a batch of them. Output is sent in pieces of
+about STREAM_CHUNK_BYTES rather than one per template statement.
+
+The request context (and with it the database session) stays open until
+the last piece is sent. The session cookie is written before the body, so
+anything a streamed template does to the session is lost - stream_page()
+takes the flashed messages out first for that reason.
+"""
+
+import csv
+import io
+import json
+
+from flask import Response, get_flashed_messages, stream_template, stream_with_context
+
+STREAM_CHUNK_BYTES = 16 * 1024
+
+# Proxies (nginx) would otherwise collect the whole body before passing it on
+STREAM_HEADERS = {'X-Accel-Buffering': 'no'}
+
+
+def buffered(chunks, size=STREAM_CHUNK_BYTES):
+    """Join small chunks into pieces of about `size` characters"""
+    pending = []
+    length = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(pending)
+            pending = []
+            length = 0
+    if pending:
+        yield ''.join(pending)
+
+
+def stream_page(template_name, **context):
+    """Stream a rendered template; pass generators for the long lists"""
+    get_flashed_messages()  # Pops them from the session while it can still be saved
+    return Response(buffered(stream_template(template_name, **context)),
+                    mimetype='text/html', headers=STREAM_HEADERS)
+
+
+def _attachment(filename):
+    return {**STREAM_HEADERS, 'Content-Disposition': f'attachment; filename="{filename}"'}
+
+
+def stream_csv(filename, header, rows):
+    """Stream `rows` (sequences) as a CSV download"""
+    def generate():
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if out.tell() >= STREAM_CHUNK_BYTES:
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+        yield out.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers=_attachment(filename))
+
+
+def stream_json(filename, items):
+    """Stream `items` (JSON-serializable) as a JSON array download"""
+    def generate():
+        yield '['
+        separator = '\n'
+        for item in items:
+            yield separator + json.dumps(item)
+            separator = ',\n'
+        yield '\n]\n'
+
+    return Response(buffered(stream_with_context(generate())), mimetype='application/json',
+                    headers=_attachment(filename))
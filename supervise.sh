@@ -0,0 +1,18 @@
+# Sourced by entrypoint.sh (which runs under `set -e`).
+#
+# supervise_worker CMD [ARGS...]: run CMD, restart it whenever it exits
+# (after WORKER_RESTART_DELAY seconds, default 5), and on SIGTERM pass the
+# signal on to it and exit once it has stopped.
+supervise_worker() {
+    local child status
+    # jobs -p rather than $child: a TERM can land before `child=$!` has run
+    trap 'kill -TERM $(jobs -p) 2>/dev/null || true; wait || true; exit 0' TERM
+    while true; do
+        "$@" &
+        child=$!
+        # A bare `wait` returning non-zero would end this shell under set -e
+        wait "$child" && status=0 || status=$?
+        echo "WARNING: Job worker exited with status $status, restarting in ${WORKER_RESTART_DELAY:-5}s"
+        sleep "${WORKER_RESTART_DELAY:-5}"
+    done
+}
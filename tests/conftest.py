@@ -1,23 +1,117 @@
-"""Pytest configuration and fixtures for Music Graph tests."""
+"""Pytest configuration and fixtures for Music Graph tests.
+
+The schema is created once per test run, and every test runs inside a
+transaction that's rolled back when it ends (see the `app` fixture), so
+adding tests or tables doesn't make each test slower.
+
+Test database:
+  - default: in-memory SQLite on one shared connection (Flask-SQLAlchemy
+    gives in-memory databases a single static connection). pytest-xdist
+    workers are separate processes with a database each: `pytest -n auto`
+  - TEST_DATABASE_URL=postgresql://...: an existing PostgreSQL database
+    (opt in, closer to production). Each xdist worker creates and drops
+    its own schema in it (test_main, test_gw0, ...).
+"""
 import pytest
 import os
-import tempfile
+from functools import cache
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
 
 # Set test database BEFORE importing app - this is critical!
 # The app reads DATABASE_URL from environment on import
-_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
-os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+from app import create_app, limiter
+from config import Config
+from models import db, Genre, Band, User, get_data_version
+from graph_index import clear_graph_index
+from analytics import clear_analytics
+from similarity import clear_similarity
+from graph_paths import clear_paths
+from graph_lod import clear_levels
+from query_cache import clear_query_cache
+
+TEST_SCHEMA = 'test_' + os.environ.get('PYTEST_XDIST_WORKER', 'main')
 
-from app import app as flask_app, limiter
-from models import db, Genre, Band, User
+
+class TestingConfig(Config):
+    SQLALCHEMY_DATABASE_URI = TEST_DATABASE_URL
+    # Off by default in production, covered by test_instrumentation.py
+    SERVER_TIMING_ENABLED = True
+    METRICS_ENABLED = True
+    if TEST_DATABASE_URL.startswith('postgresql'):
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'options': f'-csearch_path={TEST_SCHEMA}'}}
+
+
+flask_app = create_app(TestingConfig)
 
 # Disable rate limiting for tests
 limiter.enabled = False
 
+# A session on a connection that's already in a transaction (the test's)
+# works in a SAVEPOINT: its commit releases it, its rollback undoes only it
+db.session.session_factory.configure(join_transaction_mode='create_savepoint')
+
+
+def use_sqlalchemy_transactions(engine):
+    """Let SQLAlchemy, not pysqlite, begin transactions, so SAVEPOINTs work.
+
+    One BEGIN per connection: code that opens a second connection while the
+    first is in a transaction (the shared in-memory connection is the same
+    one) joins that transaction instead of failing.
+    """
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _begin(connection):
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN')
+
+
+@cache
+def password_hash(password):
+    """A cheap hash, made once per run: the login checks it like any other,
+    without paying the production hashing cost in every test"""
+    return generate_password_hash(password, method='pbkdf2:sha256:1000')
+
+
+@pytest.fixture(scope='session')
+def database():
+    """The test database engine, with the schema created once for the run."""
+    with flask_app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            use_sqlalchemy_transactions(engine)
+        else:
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f'DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE')
+                connection.exec_driver_sql(f'CREATE SCHEMA {TEST_SCHEMA}')
+        db.create_all()
+        yield engine
+        db.session.remove()
+        if engine.dialect.name == 'sqlite':
+            db.drop_all()
+        else:
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f'DROP SCHEMA {TEST_SCHEMA} CASCADE')
+        engine.dispose()
+
 
 @pytest.fixture
-def app():
-    """Create and configure a test Flask application instance."""
+def app(request, database):
+    """Create and configure a test Flask application instance.
+
+    Every session in the test (any request, any thread) uses one connection
+    whose transaction is rolled back at the end, so nothing a test writes
+    outlives it. Tests marked `commits` - for code that opens connections
+    of its own - write to the database for real instead, and every table is
+    emptied afterwards.
+    """
     flask_app.config.update({
         'TESTING': True,
         'SECRET_KEY': 'test-secret-key',
@@ -26,10 +120,82 @@ def app():
     })
 
     with flask_app.app_context():
-        db.create_all()
-        yield flask_app
-        db.session.remove()
-        db.drop_all()
+        engines = db.engines
+        if request.node.get_closest_marker('commits'):
+            try:
+                yield flask_app
+            finally:
+                db.session.remove()
+                with database.begin() as connection:
+                    for table in reversed(db.metadata.sorted_tables):
+                        connection.execute(table.delete())
+        else:
+            connection = database.connect()
+            transaction = connection.begin()
+            engines[None] = connection
+            try:
+                yield flask_app
+            finally:
+                db.session.remove()
+                engines[None] = database
+                transaction.rollback()
+                connection.close()
+
+        # Each test starts again at data version 1, so drop cached results
+        clear_analytics()
+        clear_similarity()
+        clear_paths()
+        clear_levels()
+        clear_graph_index()
+        clear_query_cache()
+
+
+# The test transaction's savepoints (see `app`) aren't queries of the code under test
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+@pytest.fixture
+def count_queries():
+    """Record SQL statements: count_queries(engine) attaches a listener and
+    returns (statements, stop). Listeners still attached when the test ends
+    are removed."""
+    listeners = []
+
+    def count(engine):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if not statement.startswith(SAVEPOINT_STATEMENTS):
+                statements.append(statement)
+
+        def stop():
+            if event.contains(engine, 'before_cursor_execute', before_cursor_execute):
+                event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        listeners.append(stop)
+        return statements, stop
+
+    yield count
+    for stop in listeners:
+        stop()
+
+
+@pytest.fixture
+def login_admin():
+    """Log a test client in as the `admin_user` fixture: login_admin(client)"""
+    def login(client):
+        client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    return login
+
+
+@pytest.fixture
+def current_version(app):
+    """The committed data version: current_version()"""
+    def version():
+        with app.app_context():
+            return get_data_version()
+    return version
 
 
 @pytest.fixture
@@ -105,7 +271,7 @@ def admin_user(app):
     """Create an admin user for testing."""
     with app.app_context():
         user = User(username='admin', email='admin@test.com', is_admin=True)
-        user.set_password('admin123')
+        user.password_hash = password_hash('admin123')
         db.session.add(user)
         db.session.commit()
         return user
@@ -116,7 +282,7 @@ def regular_user(app):
     """Create a regular (non-admin) user for testing."""
     with app.app_context():
         user = User(username='testuser', email='test@test.com', is_admin=False)
-        user.set_password('test123')
+        user.password_hash = password_hash('test123')
         db.session.add(user)
         db.session.commit()
         return user
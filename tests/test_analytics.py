@@ -0,0 +1,111 @@
+"""Tests for the graph analytics module and /api/analytics endpoints."""
+import pytest
+
+from analytics import betweenness, compute_analytics, connected_components, pagerank, undirected_csr
+from graph_index import GraphIndex
+from jobs import refresh_graph_analytics
+from models import db, Band
+
+
+def test_pagerank_favours_hubs():
+    """Test that PageRank sums to one and ranks the centre of a star highest."""
+    offsets, indices = undirected_csr([(0, 1), (0, 2), (0, 3)], 5)  # node 4 has no edges
+    rank = pagerank(offsets, indices)
+
+    assert sum(rank) == pytest.approx(1.0)
+    assert rank[0] == max(rank)
+    assert rank[1] == pytest.approx(rank[2])
+
+
+def test_betweenness_on_a_path():
+    """Test exact and sampled betweenness on a -- b -- c -- d."""
+    offsets, indices = undirected_csr([(0, 1), (1, 2), (2, 3)], 4)
+
+    exact = betweenness(offsets, indices)
+    assert exact == pytest.approx([0.0, 2 / 3, 2 / 3, 0.0])
+
+    sampled = betweenness(offsets, indices, samples=2)
+    assert sampled[0] == 0.0 and sampled[3] == 0.0
+
+
+def test_connected_components():
+    """Test that components are numbered and counted."""
+    offsets, indices = undirected_csr([(0, 1), (2, 3)], 5)
+    labels, count = connected_components(offsets, indices)
+
+    assert count == 3
+    assert labels[0] == labels[1] != labels[2] == labels[3] != labels[4]
+
+
+def test_compute_analytics_finds_bridging_bands():
+    """Test degree counts and that bands spanning distant or separate genres are reported."""
+    index = GraphIndex.from_rows(
+        1,
+        genres=[('rock', 'Rock', None, 'root'), ('metal', 'Metal', 'rock', 'intermediate'),
+                ('doom', 'Doom', 'metal', 'leaf'), ('punk', 'Punk', 'rock', 'leaf'),
+                ('jazz', 'Jazz', None, 'root')],
+        bands=[('sabbath', 'Black Sabbath', 'doom'), ('crossover', 'Crossover', 'doom'),
+               ('fusion', 'Fusion', 'metal'), ('plain', 'Plain', 'punk')],
+        parent_pairs=[('metal', 'rock'), ('doom', 'metal'), ('punk', 'rock')],
+        membership_pairs=[('sabbath', 'doom'), ('sabbath', 'metal'),
+                          ('crossover', 'doom'), ('crossover', 'punk'),
+                          ('fusion', 'metal'), ('fusion', 'jazz'), ('plain', 'punk')],
+    )
+    data = compute_analytics(index)
+
+    genres = {g['id']: g for g in data['genres']}
+    assert genres['doom']['bands'] == 2
+    assert genres['rock']['children'] == 2
+    assert genres['metal']['genre_betweenness'] > 0
+
+    bridges = [(b['id'], b['span']) for b in data['bridges']]
+    # Unconnected genres first, then by distance; neighbouring genres aren't bridges
+    assert bridges == [('fusion', None), ('crossover', 3)]
+    assert data['summary']['genre_components'] == 2
+    assert data['summary']['components'] == 1
+
+
+def test_analytics_api_serves_worker_results(client, app, sample_bands):
+    """Test that requests never compute analytics: they serve what the worker stored."""
+    response = client.get('/api/analytics/genres')
+    assert response.status_code == 202
+    assert response.get_json()['status'] == 'computing'
+    assert client.get('/api/analytics/genres').status_code == 202
+
+    with app.app_context():
+        refresh_graph_analytics(None)
+    response = client.get('/api/analytics/genres')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['stale'] is False
+    assert {g['id'] for g in data['genres']} == {'rock', 'metal', 'death-metal', 'black-metal'}
+
+    limited = client.get('/api/analytics/bands?limit=1').get_json()
+    assert len(limited['bands']) == 1
+    assert client.get('/api/analytics/summary').get_json()['summary']['bands'] == 2
+
+
+def test_analytics_api_serves_stale_results_after_a_write(client, app, sample_bands):
+    """Test that results for the previous version are served, marked stale, until the worker catches up."""
+    with app.app_context():
+        refresh_graph_analytics(None)
+    first = client.get('/api/analytics/summary').get_json()
+
+    with app.app_context():
+        db.session.add(Band(id='opeth', name='Opeth', primary_genre_id='death-metal'))
+        db.session.commit()
+
+    response = client.get('/api/analytics/summary').get_json()
+    assert response['version'] == first['version']
+    assert response['stale'] is True
+
+    with app.app_context():
+        refresh_graph_analytics(None)
+    updated = client.get('/api/analytics/summary').get_json()
+    assert updated['stale'] is False
+    assert updated['summary']['bands'] == 3
+
+
+def test_analytics_api_unknown_kind(client, app):
+    """Test that unknown analytics names return 404."""
+    assert client.get('/api/analytics/nope').status_code == 404
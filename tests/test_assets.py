@@ -0,0 +1,143 @@
+"""Tests for fingerprinted, precompressed static assets."""
+import gzip
+import hashlib
+import io
+import json
+import os
+
+import pytest
+from flask import url_for
+
+import assets
+from assets import (VENDOR, VendorChecksumError, asset_url, build_assets, fetch_vendor, load_manifest, pin_vendor,
+                    read_pins)
+
+CSS = 'body { color: #333; }\n' * 40
+
+
+@pytest.fixture
+def built_static(app, tmp_path, monkeypatch):
+    """A built static folder the app serves from."""
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'style.css').write_text(CSS)
+    (tmp_path / 'js' / 'filter.js').write_text('var x = 1;\n')
+    (tmp_path / 'vendor').mkdir()
+    (tmp_path / 'vendor' / 'vis-network.min.js').write_text('var vis = {};\n')
+    manifest = build_assets(str(tmp_path), fetch=False)
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    load_manifest(app)
+    yield manifest
+    monkeypatch.undo()
+    load_manifest(app)
+
+
+def test_build_fingerprints_and_compresses(tmp_path):
+    """Test that the build writes hashed copies, gzip versions and a manifest."""
+    (tmp_path / 'style.css').write_text(CSS)
+    manifest = build_assets(str(tmp_path), fetch=False)
+
+    hashed = manifest['style.css']
+    assert hashed.startswith('style.') and hashed.endswith('.css') and hashed != 'style.css'
+    dist = tmp_path / 'dist'
+    assert (dist / hashed).read_text() == CSS
+    assert gzip.decompress((dist / (hashed + '.gz')).read_bytes()).decode() == CSS
+    assert json.loads((dist / 'manifest.json').read_text()) == manifest
+
+    # Same content, same name; changed content, new name
+    assert build_assets(str(tmp_path), fetch=False)['style.css'] == hashed
+    (tmp_path / 'style.css').write_text(CSS + 'p {}\n')
+    assert build_assets(str(tmp_path), fetch=False)['style.css'] != hashed
+
+
+def test_url_for_resolves_hashed_names(app, built_static):
+    """Test that url_for('static') points at the fingerprinted file."""
+    with app.test_request_context():
+        assert url_for('static', filename='style.css') == '/static/dist/' + built_static['style.css']
+        assert url_for('static', filename='not-built.png') == '/static/not-built.png'
+
+
+def test_hashed_assets_are_immutable(client, built_static):
+    """Test that fingerprinted files are cached forever and precompressed."""
+    url = '/static/dist/' + built_static['style.css']
+    response = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.data).decode() == CSS
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data.decode() == CSS
+
+
+def test_page_uses_hashed_stylesheet(client, built_static):
+    """Test that rendered pages link the fingerprinted stylesheet."""
+    assert ('/static/dist/' + built_static['style.css']).encode() in client.get('/login').data
+
+
+def test_vendored_script_served_locally(client, built_static):
+    """Test that a vendored script resolves to our own fingerprinted copy."""
+    with client.application.test_request_context():
+        assert asset_url('vendor/vis-network.min.js') == '/static/dist/' + built_static['vendor/vis-network.min.js']
+
+
+def test_vendor_falls_back_to_cdn(app):
+    """Test that vendored scripts use the CDN until the build has run."""
+    filename = 'vendor/vis-network.min.js'
+    with app.test_request_context():
+        if os.path.exists(os.path.join(app.static_folder, filename)):
+            assert asset_url(filename) == url_for('static', filename=filename)
+        else:
+            assert asset_url(filename) == VENDOR[filename]
+
+
+def test_fetch_vendor_checks_pinned_sha256(tmp_path, monkeypatch):
+    """Test that vendored scripts are only written when they match their pin, and unpinned ones are skipped."""
+    script = b'var vis = {};\n'
+    monkeypatch.setattr(assets.urllib.request, 'urlopen', lambda url, timeout: io.BytesIO(script))
+    monkeypatch.setattr(assets, 'VENDOR', {'vendor/lib.js': 'https://cdn.test/lib.js'})
+    pins = tmp_path / 'vendor.sha256'
+    target = tmp_path / 'vendor' / 'lib.js'
+
+    fetch_vendor(str(tmp_path), pin_file=str(pins))
+    assert not target.exists()
+
+    pins.write_text('0' * 64 + '  vendor/lib.js\n')
+    with pytest.raises(VendorChecksumError):
+        fetch_vendor(str(tmp_path), pin_file=str(pins))
+    assert not target.exists()
+
+    pins.write_text(f'{hashlib.sha256(script).hexdigest()}  vendor/lib.js\n')
+    fetch_vendor(str(tmp_path), pin_file=str(pins))
+    assert target.read_bytes() == script
+
+
+def test_pinned_vendor_script_is_served_locally(app, tmp_path, monkeypatch):
+    """Test that once vis-network is pinned, the build vendors it and pages load our fingerprinted copy."""
+    script = b'var vis = {Network: function () {}};\n'
+    monkeypatch.setattr(assets.urllib.request, 'urlopen', lambda url, timeout: io.BytesIO(script))
+    pins = tmp_path / 'vendor.sha256'
+    static = tmp_path / 'static'
+    static.mkdir()
+
+    assert pin_vendor(str(static), pin_file=str(pins)) == {
+        'vendor/vis-network.min.js': hashlib.sha256(script).hexdigest()}
+    assert read_pins(str(pins)) == {'vendor/vis-network.min.js': hashlib.sha256(script).hexdigest()}
+
+    (static / 'vendor' / 'vis-network.min.js').unlink()
+    manifest = build_assets(str(static), pin_file=str(pins))
+    assert (static / 'vendor' / 'vis-network.min.js').read_bytes() == script
+
+    monkeypatch.setattr(app, 'static_folder', str(static))
+    load_manifest(app)
+    try:
+        with app.test_request_context():
+            url = asset_url('vendor/vis-network.min.js')
+        assert url == '/static/dist/' + manifest['vendor/vis-network.min.js']
+        assert url.startswith('/static/dist/vendor/vis-network.min.') and url != VENDOR['vendor/vis-network.min.js']
+    finally:
+        monkeypatch.undo()
+        load_manifest(app)
@@ -0,0 +1,97 @@
+"""Tests for set-based, resumable data backfills."""
+import pytest
+
+from backfill import GenreParentsBackfill, get_progress, run_backfill
+from models import db, Genre, ChangeLog, Job, genre_parents, get_data_version
+
+# Backfills commit batch by batch on connections of their own
+pytestmark = pytest.mark.commits
+
+
+def parent_links():
+    return set(db.session.execute(
+        db.select(genre_parents.c.genre_id, genre_parents.c.parent_genre_id)).all())
+
+
+EXPECTED_LINKS = {('metal', 'rock'), ('death-metal', 'metal'), ('black-metal', 'metal')}
+
+
+def quiet(message):
+    pass
+
+
+def test_dry_run_counts_without_writing(app, sample_genres):
+    """Test that a dry run reports the rows to write and changes nothing."""
+    with app.app_context():
+        version = get_data_version()
+        assert run_backfill(GenreParentsBackfill(), dry_run=True, report=quiet) == 3
+        assert parent_links() == set()
+        assert get_progress('genre_parents') is None
+        assert get_data_version() == version
+
+
+def test_backfill_in_batches(app, sample_genres):
+    """Test that batches add every missing link, skip existing ones and log the changes."""
+    with app.app_context():
+        metal = db.session.get(Genre, 'metal')
+        metal.parent_genres = [db.session.get(Genre, 'rock')]
+        db.session.commit()
+        version = get_data_version()
+
+        assert run_backfill(GenreParentsBackfill(), batch_size=1, report=quiet) == 2
+        assert parent_links() == EXPECTED_LINKS
+
+        progress = get_progress('genre_parents')
+        assert progress.batches == 4  # One per genre, the last one running to the end
+        assert progress.rows_written == 2
+        assert progress.finished_at is not None
+
+        changed = {entry.entity_id for entry in ChangeLog.query.filter(ChangeLog.version > version)}
+        assert changed == {'death-metal', 'black-metal'}
+        assert [job.kind for job in Job.query.all()] == ['graph_analytics', 'similarity']
+
+
+def test_backfill_resumes_after_failure(app, sample_genres, monkeypatch):
+    """Test that an interrupted backfill keeps its committed batches and resumes after them."""
+    calls = []
+    apply = GenreParentsBackfill.apply
+
+    def failing_apply(self, connection, lower, upper):
+        calls.append((lower, upper))
+        if len(calls) == 2:
+            raise RuntimeError('connection lost')
+        return apply(self, connection, lower, upper)
+    monkeypatch.setattr(GenreParentsBackfill, 'apply', failing_apply)
+
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            run_backfill(GenreParentsBackfill(), batch_size=2, report=quiet)
+        assert parent_links() == {('black-metal', 'metal'), ('death-metal', 'metal')}
+        assert get_progress('genre_parents').finished_at is None
+
+        calls.clear()
+        assert run_backfill(GenreParentsBackfill(), batch_size=2, report=quiet) == 1
+        assert calls[0][0] == 'death-metal'  # Started after the last committed batch
+        assert parent_links() == EXPECTED_LINKS
+
+
+def test_finished_backfill_needs_restart(app, sample_genres):
+    """Test that a finished backfill only runs again with restart, and then writes nothing new."""
+    with app.app_context():
+        run_backfill(GenreParentsBackfill(), report=quiet)
+        assert run_backfill(GenreParentsBackfill(), report=quiet) == 0
+
+        db.session.execute(genre_parents.delete().where(genre_parents.c.genre_id == 'metal'))
+        db.session.commit()
+        assert run_backfill(GenreParentsBackfill(), restart=True, report=quiet) == 1
+        assert parent_links() == EXPECTED_LINKS
+
+
+def test_missing_parents_skipped(app, sample_genres):
+    """Test that a parent_id pointing at no genre is left alone."""
+    with app.app_context():
+        db.session.execute(Genre.__table__.insert().values(
+            id='ghost-child', name='Ghost Child', type='leaf', parent_id='ghost'))
+        db.session.commit()
+        assert run_backfill(GenreParentsBackfill(), report=quiet) == 3
+        assert ('ghost-child', 'ghost') not in parent_links()
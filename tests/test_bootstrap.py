@@ -0,0 +1,122 @@
+"""Tests for the container bootstrap script."""
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+from bootstrap import APP_TABLES, check_schema, create_missing_tables, migration_heads, wait_for_database
+from models import db
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "bootstrap.db"}')
+    yield engine
+    engine.dispose()
+
+
+def write_migration(directory, revision, down_revision):
+    versions = directory / 'versions'
+    versions.mkdir(parents=True, exist_ok=True)
+    (versions / f'{revision}_step.py').write_text(
+        f'revision = {revision!r}\ndown_revision = {down_revision!r}\n')
+
+
+def test_wait_for_database_ready(engine):
+    """Test that a reachable database succeeds on the first attempt."""
+    assert wait_for_database(engine, timeout=1) == 1
+
+
+def test_wait_for_database_gives_up(tmp_path):
+    """Test that an unreachable database raises once the timeout passes."""
+    engine = create_engine(f'sqlite:///{tmp_path / "missing-dir" / "x.db"}')
+    with pytest.raises(DBAPIError):
+        wait_for_database(engine, timeout=0.3, initial_delay=0.05)
+
+
+def test_check_schema_missing(engine, tmp_path):
+    """Test that an empty database needs initializing."""
+    assert check_schema(engine, str(tmp_path))[0] == 'missing'
+
+
+def test_check_schema_unversioned(engine, tmp_path):
+    """Test tables created by init_db.py without Flask-Migrate."""
+    db.metadata.create_all(engine)
+    assert check_schema(engine, str(tmp_path))[0] == 'unversioned'
+
+
+def test_app_tables_match_models():
+    """Test that the startup check knows every table the models define."""
+    assert set(APP_TABLES) == set(db.metadata.tables)
+
+
+def test_create_missing_tables(engine, tmp_path):
+    """Test that tables added after a database was initialized are created, counters filled."""
+    old_tables = ('genres', 'genre_parents', 'bands', 'band_genres', 'users')
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in old_tables])
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO genres (id, name, type) VALUES ('rock', 'Rock', 'root')"))
+        conn.execute(text("INSERT INTO bands (id, name, primary_genre_id) VALUES ('kiss', 'Kiss', 'rock')"))
+
+    status, detail = check_schema(engine, str(tmp_path))
+    assert status == 'incomplete'
+    assert 'genre_stats' in detail and 'jobs' in detail
+
+    create_missing_tables(engine, [name for name in APP_TABLES if name not in old_tables])
+    assert check_schema(engine, str(tmp_path))[0] == 'unversioned'
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT genre_id, direct_bands FROM genre_stats')).all() == [('rock', 1)]
+
+
+def test_check_schema_against_migrations(engine, tmp_path):
+    """Test comparing alembic_version with the migration scripts' head."""
+    write_migration(tmp_path, 'aaa111', None)
+    write_migration(tmp_path, 'bbb222', 'aaa111')
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE alembic_version (version_num VARCHAR(32) PRIMARY KEY)'))
+        conn.execute(text("INSERT INTO alembic_version VALUES ('aaa111')"))
+
+    assert check_schema(engine, str(tmp_path))[0] == 'outdated'
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE alembic_version SET version_num = 'bbb222'"))
+    assert check_schema(engine, str(tmp_path))[0] == 'current'
+
+
+def test_migration_heads_with_merge(tmp_path):
+    """Test head detection when a merge revision has two parents."""
+    write_migration(tmp_path, 'base', None)
+    write_migration(tmp_path, 'left', 'base')
+    write_migration(tmp_path, 'right', 'base')
+    assert migration_heads(str(tmp_path)) == {'left', 'right'}
+    write_migration(tmp_path, 'merge', ('left', 'right'))
+    assert migration_heads(str(tmp_path)) == {'merge'}
+
+
+def test_bootstrap_does_not_import_flask():
+    """Test that the startup check stays clear of the web stack."""
+    result = subprocess.run(
+        [sys.executable, '-c', 'import sys, bootstrap; print(sorted(m for m in sys.modules '
+                               'if m.split(".")[0] in ("flask", "flask_login", "flask_limiter", "app")))'],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_bootstrap_initializes_empty_database(tmp_path):
+    """Test the full command: initialize once, then leave the data alone."""
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp_path / "fresh.db"}')
+    first = subprocess.run([sys.executable, 'bootstrap.py'], cwd=ROOT, env=env,
+                           capture_output=True, text=True, check=True)
+    assert 'Schema missing' in first.stdout
+    assert 'Database initialized successfully!' in first.stdout
+
+    second = subprocess.run([sys.executable, 'bootstrap.py'], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    assert 'Schema unversioned' in second.stdout
+    assert 'Initializing database' not in second.stdout
@@ -0,0 +1,175 @@
+"""Tests for the data version counter and change log."""
+from models import (db, Genre, User, ChangeLog, bump_data_version, get_changed_entities,
+                    get_data_version, get_changes_since, prune_change_log, reset_data_version)
+
+
+def logged_changes(since):
+    """Set of (entity_type, entity_id, action) logged after `since`."""
+    _, rows = get_changes_since(since)
+    return {(row.entity_type, row.entity_id, row.action) for row in rows}
+
+
+def test_version_starts_at_zero(app):
+    """Test that an empty database reports version 0."""
+    with app.app_context():
+        assert get_data_version() == 0
+        assert get_changes_since(0) == (0, [])
+
+
+def test_commit_bumps_version(app, sample_genres):
+    """Test that committing tracked changes bumps the version and logs them."""
+    with app.app_context():
+        before = get_data_version()
+        assert before > 0
+
+        db.session.add(Genre(id='doom-metal', name='Doom Metal', type='leaf', parent_id='metal'))
+        db.session.commit()
+
+        assert get_data_version() == before + 1
+        assert logged_changes(before) == {
+            ('genre', 'doom-metal', 'insert'),
+            ('genre', 'metal', 'update'),  # its Child Genres panel changed
+        }
+
+
+def test_rollback_does_not_bump_version(app, sample_genres):
+    """Test that rolled back changes leave the version alone."""
+    with app.app_context():
+        before = get_data_version()
+        genre = db.session.get(Genre, 'rock')
+        genre.name = 'Rock and Roll'
+        db.session.flush()
+        db.session.rollback()
+
+        assert get_data_version() == before
+        assert ChangeLog.query.filter(ChangeLog.version > before).count() == 0
+
+
+def test_unmodified_objects_are_not_logged(app, sample_genres):
+    """Test that a commit without real changes doesn't bump the version."""
+    with app.app_context():
+        before = get_data_version()
+        genre = db.session.get(Genre, 'rock')
+        genre.name = genre.name  # No net change
+        db.session.commit()
+        assert get_data_version() == before
+
+
+def test_edit_band_logs_old_and_new_genres(client, app, admin_user, sample_bands, login_admin):
+    """Test that editing a band logs the genres it left and joined."""
+    login_admin(client)
+    with app.app_context():
+        before = get_data_version()
+
+    client.post('/edit-band/death', data={
+        'name': 'Death',
+        'primary_genre_id': 'black-metal',
+        'genres': ['black-metal'],
+    })
+
+    with app.app_context():
+        assert get_data_version() > before
+        changes = logged_changes(before)
+    assert ('band', 'death', 'update') in changes
+    assert ('genre', 'death-metal', 'update') in changes
+    assert ('genre', 'black-metal', 'update') in changes
+
+
+def test_delete_band_logs_delete(client, app, admin_user, sample_bands, login_admin):
+    """Test that deleting a band through the route is logged."""
+    login_admin(client)
+    with app.app_context():
+        before = get_data_version()
+
+    client.post('/delete-band/dimmu-borgir')
+
+    with app.app_context():
+        changes = logged_changes(before)
+    assert ('band', 'dimmu-borgir', 'delete') in changes
+    assert ('genre', 'black-metal', 'update') in changes
+
+
+def test_toggle_admin_logs_user_update(client, app, admin_user, regular_user, login_admin):
+    """Test that user changes are tracked too."""
+    login_admin(client)
+    with app.app_context():
+        before = get_data_version()
+        user_id = User.query.filter_by(username='testuser').first().id
+
+    client.post(f'/admin/users/toggle-admin/{user_id}')
+
+    with app.app_context():
+        assert ('user', str(user_id), 'update') in logged_changes(before)
+
+
+def test_bump_data_version_for_raw_writes(app, sample_genres):
+    """Test bumping the version by hand for writes that bypass the ORM."""
+    with app.app_context():
+        before = get_data_version()
+        version = bump_data_version(db.session.connection(), {('genre', 'rock'): 'update'})
+        db.session.commit()
+
+        assert version == before + 1
+        assert get_data_version() == version
+
+
+def test_changes_since_future_version_requires_reload(app, sample_genres):
+    """Test that a version newer than the database asks for a full reload."""
+    with app.app_context():
+        current = get_data_version()
+        assert get_changes_since(current + 10) == (current, None)
+
+
+def test_reset_keeps_version_monotonic(app, sample_genres):
+    """Test that a reset continues counting and invalidates older versions."""
+    with app.app_context():
+        before = get_data_version()
+        version = reset_data_version(before + 100)
+
+        assert version == before + 101
+        assert get_changes_since(before) == (version, None)
+        assert get_changes_since(version) == (version, [])
+
+
+def test_changes_since_limit(app, sample_genres):
+    """Test that more log rows than the limit ask for a reload."""
+    with app.app_context():
+        before = get_data_version()
+        for genre_id in ('rock', 'metal', 'rock'):
+            bump_data_version(db.session.connection(), {('genre', genre_id): 'update'})
+        db.session.commit()
+
+        assert len(get_changes_since(before, limit=3)[1]) == 3
+        assert get_changes_since(before, limit=2) == (before + 3, None)
+
+
+def test_changed_entities_are_distinct(app, sample_genres):
+    """Test that entities changed in several versions count once, other types not at all."""
+    with app.app_context():
+        before = get_data_version()
+        for genre_id in ('rock', 'metal', 'rock'):
+            bump_data_version(db.session.connection(), {('genre', genre_id): 'update', ('user', '1'): 'update'})
+        db.session.commit()
+
+        current, pairs = get_changed_entities(before, ('genre', 'band'), limit=2)
+        assert current == before + 3
+        assert sorted(pairs) == [('genre', 'metal'), ('genre', 'rock')]
+        assert get_changed_entities(before, ('genre', 'band'), limit=1) == (current, None)
+        assert get_changed_entities(current, ('genre', 'band'), limit=1) == (current, [])
+
+
+def test_prune_change_log(app, sample_genres):
+    """Test that pruning keeps recent versions and resets callers from before them."""
+    with app.app_context():
+        before = get_data_version()
+        for _ in range(5):
+            bump_data_version(db.session.connection(), {('genre', 'rock'): 'update'})
+        db.session.commit()
+        current = get_data_version()
+
+        assert prune_change_log(2) > 0
+        assert ChangeLog.query.filter(ChangeLog.version > current - 2).count() == 2
+        assert get_changes_since(before) == (current, None)
+        assert get_changed_entities(current - 3, ('genre',), limit=10) == (current, None)
+        assert [row.version for row in get_changes_since(current - 2)[1]] == [current - 1, current]
+        assert prune_change_log(100) == 0
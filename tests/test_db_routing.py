@@ -0,0 +1,104 @@
+"""Tests for routing read-only requests to a read replica."""
+import pytest
+
+from app import create_app
+from config import Config
+from database import create_db_app
+from db_routing import READ_PRIMARY_COOKIE, REPLICA_BIND
+from models import db, Genre, Band, User
+from graph_index import clear_graph_index
+from graph_lod import clear_levels
+
+from tests.test_graph_data import extract_graph_data
+
+
+def make_config(uri, replica_uri=None):
+    class TestConfig(Config):
+        TESTING = True
+        SECRET_KEY = 'test-secret-key'
+        SQLALCHEMY_DATABASE_URI = uri
+        SQLALCHEMY_BINDS = {REPLICA_BIND: replica_uri} if replica_uri else {}
+    return TestConfig
+
+
+def seed(uri, rock_name):
+    """Schema, a genre tree and an admin user in the database at `uri`"""
+    with create_db_app(make_config(uri)).app_context():
+        db.create_all()
+        db.session.add_all([
+            Genre(id='rock', name=rock_name, type='root'),
+            Genre(id='metal', name='Metal', type='leaf', parent_id='rock'),
+        ])
+        admin = User(username='admin', email='admin@test.com', is_admin=True)
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.fixture
+def replica_client(tmp_path):
+    """Client for an app whose primary and replica are two SQLite files.
+
+    The files disagree on rock's name, so responses show which one was read.
+    """
+    primary = f"sqlite:///{tmp_path / 'primary.db'}"
+    replica = f"sqlite:///{tmp_path / 'replica.db'}"
+    seed(primary, 'Rock (primary)')
+    seed(replica, 'Rock (replica)')
+    app = create_app(make_config(primary, replica))
+    yield app.test_client()
+    # init_app registered a (table-less) metadata for the bind on the shared
+    # `db`; other apps in this process have no such bind for create_all()
+    db.metadatas.pop(REPLICA_BIND, None)
+    clear_levels()
+    clear_graph_index()
+
+
+def genre_names(response):
+    return {genre_id: entity['name']
+            for genre_id, entity in extract_graph_data(response)['entities']['genres'].items()}
+
+
+def test_read_only_routes_use_replica(replica_client, login_admin):
+    """Test that the graph page, JSON reads and the admin listing read the replica."""
+    assert genre_names(replica_client.get('/'))['rock'] == 'Rock (replica)'
+    assert replica_client.get('/api/graph').get_json()['entities']['genres']['rock']['name'] == 'Rock (replica)'
+
+    login_admin(replica_client)
+    assert b'Rock (replica)' in replica_client.get('/admin').data
+
+
+def test_forms_use_primary(replica_client, login_admin):
+    """Test that routes that aren't marked read-only read the primary."""
+    login_admin(replica_client)
+    response = replica_client.get('/add-genre')
+    assert b'Rock (primary)' in response.data
+    assert b'Rock (replica)' not in response.data
+
+
+def test_writes_go_to_primary_and_read_back(replica_client, login_admin):
+    """Test that a write lands on the primary and the redirect after it reads the primary."""
+    login_admin(replica_client)
+    response = replica_client.post('/add-band', data={
+        'id': 'metallica', 'name': 'Metallica',
+        'primary_genre_id': 'metal', 'genres': ['metal'],
+    })
+    assert response.status_code == 302
+    assert READ_PRIMARY_COOKIE in response.headers['Set-Cookie']
+
+    app = replica_client.application
+    with app.app_context():
+        assert db.session.get(Band, 'metallica') is not None
+        with db.engines[REPLICA_BIND].connect() as replica:
+            assert replica.execute(db.select(Band.id)).all() == []
+
+    # Read-after-write: this browser sees its own write on the next pages
+    data = extract_graph_data(replica_client.get('/'))
+    assert 'metallica' in data['entities']['bands']
+    assert data['entities']['genres']['rock']['name'] == 'Rock (primary)'
+
+    # Once the cookie expires it's back to the replica
+    replica_client.delete_cookie(READ_PRIMARY_COOKIE)
+    data = extract_graph_data(replica_client.get('/'))
+    assert 'metallica' not in data['entities']['bands']
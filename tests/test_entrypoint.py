@@ -0,0 +1,78 @@
+"""Smoke tests for the container entrypoint's job worker supervisor (supervise.sh)."""
+import os
+import shutil
+import signal
+import subprocess
+import time
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+pytestmark = pytest.mark.skipif(shutil.which('bash') is None, reason='needs bash')
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def worker_pids(path):
+    try:
+        with open(path) as f:
+            return [int(line) for line in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+@pytest.fixture
+def supervisor(tmp_path):
+    """supervise_worker running a fake worker that records its pid, under set -e like entrypoint.sh."""
+    pids = tmp_path / 'pids'
+    worker = f'echo \\$$ >> {pids}; exec sleep 60'
+    process = subprocess.Popen(
+        ['bash', '-c', f'set -e; . {ROOT}/supervise.sh; supervise_worker sh -c "{worker}"'],
+        env=dict(os.environ, WORKER_RESTART_DELAY='0.1'), stdout=subprocess.PIPE, text=True)
+    yield process, str(pids)
+    if process.poll() is None:
+        process.kill()
+    for pid in worker_pids(pids):
+        if alive(pid):
+            os.kill(pid, signal.SIGKILL)
+
+
+def test_crashed_worker_is_restarted(supervisor):
+    """Test that a worker killed (non-zero exit) is started again."""
+    process, pids = supervisor
+    assert wait_for(lambda: len(worker_pids(pids)) == 1)
+
+    os.kill(worker_pids(pids)[0], signal.SIGKILL)
+    assert wait_for(lambda: len(worker_pids(pids)) == 2), 'worker was not restarted'
+    assert process.poll() is None
+
+    os.kill(worker_pids(pids)[1], signal.SIGKILL)
+    assert wait_for(lambda: len(worker_pids(pids)) == 3)
+
+
+def test_term_stops_worker_and_supervisor(supervisor):
+    """Test that SIGTERM is passed on to the worker and the supervisor exits cleanly."""
+    process, pids = supervisor
+    assert wait_for(lambda: len(worker_pids(pids)) == 1)
+
+    process.terminate()
+    assert process.wait(timeout=10) == 0
+    assert wait_for(lambda: not alive(worker_pids(pids)[0]))
+    assert len(worker_pids(pids)) == 1
+    assert 'restarting' not in process.stdout.read()
@@ -0,0 +1,129 @@
+"""Tests for the denormalized genre counters (genre_stats)."""
+from models import (db, Band, Genre, GenreStats, genre_parents, band_genres,
+                    get_data_version, verify_genre_stats)
+from graph_data import build_graph_data, GENRE_SIZES
+from read_models import list_genres
+
+
+def stats(app):
+    """genre id -> (direct, subtree, descendants) as stored"""
+    with app.app_context():
+        return {row.genre_id: (row.direct_bands, row.subtree_bands, row.descendant_genres)
+                for row in GenreStats.query.all()}
+
+
+def test_counters_follow_fixtures(app, sample_bands):
+    """Test that counters are filled as genres and bands are created."""
+    assert stats(app) == {
+        'rock': (0, 2, 3),
+        'metal': (0, 2, 2),
+        'death-metal': (1, 1, 0),
+        'black-metal': (1, 1, 0),
+    }
+
+
+def test_edit_band_moves_counts(client, app, admin_user, sample_bands, login_admin):
+    """Test that editing a band's genres moves it between genre counters."""
+    login_admin(client)
+    client.post('/edit-band/death', data={
+        'name': 'Death',
+        'primary_genre_id': 'black-metal',
+        'genres': ['black-metal'],
+    })
+
+    counts = stats(app)
+    assert counts['death-metal'] == (0, 0, 0)
+    assert counts['black-metal'] == (2, 2, 0)
+    assert counts['rock'] == (0, 2, 3)  # Still the same two bands below it
+    with app.app_context():
+        assert verify_genre_stats() == []
+
+
+def test_band_in_sibling_genres_counted_once(app, sample_bands):
+    """Test that a band in two genres under one parent counts once for it."""
+    with app.app_context():
+        band = db.session.get(Band, 'death')
+        band.genres.append(db.session.get(Genre, 'black-metal'))
+        db.session.commit()
+
+    counts = stats(app)
+    assert counts['black-metal'] == (2, 2, 0)
+    assert counts['metal'] == (0, 2, 2)
+
+
+def test_primary_change_without_loading_genres(app, sample_bands):
+    """Test that changing only the primary genre keeps listed memberships."""
+    with app.app_context():
+        # death stays listed in death-metal via band_genres
+        db.session.get(Band, 'death').primary_genre_id = 'black-metal'
+        db.session.commit()
+        assert verify_genre_stats() == []
+
+    counts = stats(app)
+    assert counts['death-metal'] == (1, 1, 0)
+    assert counts['black-metal'] == (2, 2, 0)
+
+
+def test_delete_band_decrements(client, app, admin_user, sample_bands, login_admin):
+    """Test that deleting a band takes it out of every ancestor's count."""
+    login_admin(client)
+    client.post('/delete-band/dimmu-borgir')
+
+    counts = stats(app)
+    assert counts['black-metal'] == (0, 0, 0)
+    assert counts['rock'] == (0, 1, 3)
+
+
+def test_add_and_delete_genre(client, app, admin_user, sample_bands, login_admin):
+    """Test that genre routes keep descendant counts up to date."""
+    login_admin(client)
+    client.post('/add-genre', data={
+        'id': 'doom-metal', 'name': 'Doom Metal', 'parent_id': 'metal', 'type': 'leaf',
+    })
+    counts = stats(app)
+    assert counts['doom-metal'] == (0, 0, 0)
+    assert counts['metal'] == (0, 2, 3)
+    assert counts['rock'] == (0, 2, 4)
+
+    client.post('/delete-genre/doom-metal')
+    counts = stats(app)
+    assert 'doom-metal' not in counts
+    assert counts['rock'] == (0, 2, 3)
+
+
+def test_second_parent_adds_subtree(app, sample_bands):
+    """Test that a genre_parents link counts the child's bands for the new parent."""
+    with app.app_context():
+        db.session.add(Genre(id='blackened-death', name='Blackened Death', type='leaf'))
+        db.session.commit()
+        genre = db.session.get(Genre, 'death-metal')
+        genre.parent_genres.append(db.session.get(Genre, 'blackened-death'))
+        db.session.commit()
+
+    assert stats(app)['blackened-death'] == (0, 1, 1)
+
+
+def test_verify_reports_and_repairs(app, sample_bands):
+    """Test that raw writes are caught by verify and fixed by repair."""
+    with app.app_context():
+        db.session.execute(band_genres.insert().values(band_id='death', genre_id='black-metal'))
+        db.session.execute(genre_parents.insert().values(genre_id='metal', parent_genre_id='rock'))
+        db.session.commit()
+        version = get_data_version()
+
+        assert verify_genre_stats() == [('black-metal', (1, 1, 0), (2, 2, 0))]
+        assert verify_genre_stats(repair=True)
+        assert verify_genre_stats() == []
+        assert get_data_version() == version + 1
+
+
+def test_counters_in_admin_and_graph(app, sample_bands):
+    """Test that the admin listing and graph nodes use the counters."""
+    with app.app_context():
+        rock = next(g for g in list_genres() if g.id == 'rock')
+        data = build_graph_data()
+
+    assert (rock.direct_bands, rock.subtree_bands, rock.descendant_genres) == (0, 2, 3)
+    sizes = {node['id']: node['size'] for node in data['nodes'] if node['group'] == 'genre'}
+    assert sizes['rock'] > GENRE_SIZES['root']
+    assert {'label': 'Bands (incl. subgenres)', 'value': 2} in data['entities']['genres']['rock']['fields']
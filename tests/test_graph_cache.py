@@ -0,0 +1,60 @@
+"""Tests for serving the main page to clients with a locally cached graph."""
+import json
+import re
+
+from models import db, Genre
+
+
+def extract_boot(response):
+    """Pull the graph-boot JSON document out of the rendered page."""
+    match = re.search(rb'<script type="application/json" id="graph-boot">(.*?)</script>',
+                      response.data, re.DOTALL)
+    assert match is not None, 'graph-boot script tag not found'
+    return json.loads(match.group(1))
+
+
+def test_first_visit_embeds_graph(client, sample_bands):
+    """Test that a page without a cache gets the whole graph embedded."""
+    response = client.get('/')
+    boot = extract_boot(response)
+    assert boot['cached'] is None
+    assert b'id="graph-data"' in response.data
+    assert b'js/graph-worker.js' in response.data
+
+
+def test_current_cache_skips_graph(client, app, sample_bands, current_version):
+    """Test that a page holding the current version gets no graph at all."""
+    version = current_version()
+    client.set_cookie('graph_cache', str(version))
+
+    response = client.get('/')
+    boot = extract_boot(response)
+    assert b'id="graph-data"' not in response.data
+    assert boot['cached'] == version
+    assert boot['version'] == version
+    assert boot['patch']['nodes']['upsert'] == []
+
+
+def test_stale_cache_gets_patch(client, app, sample_bands, current_version):
+    """Test that a page holding an older version gets only the changes."""
+    version = current_version()
+    with app.app_context():
+        db.session.get(Genre, 'black-metal').name = 'Black Metal (Norway)'
+        db.session.commit()
+    client.set_cookie('graph_cache', str(version))
+
+    response = client.get('/')
+    boot = extract_boot(response)
+    assert b'id="graph-data"' not in response.data
+    assert boot['version'] == current_version()
+    labels = {node['id']: node['label'] for node in boot['patch']['nodes']['upsert']}
+    assert labels['black-metal'] == 'Black Metal (Norway)'
+
+
+def test_unusable_cache_embeds_graph(client, app, sample_bands, current_version):
+    """Test that future or malformed cached versions fall back to a full embed."""
+    for value in (str(current_version() + 10), 'garbage', '-1'):
+        client.set_cookie('graph_cache', value)
+        response = client.get('/')
+        assert b'id="graph-data"' in response.data, value
+        assert extract_boot(response)['cached'] is None
@@ -0,0 +1,137 @@
+"""Tests for the graph delta sync endpoints."""
+import pytest
+from models import db, Genre, Band, get_data_version
+
+
+def test_graph_api_returns_full_graph(client, sample_bands):
+    """Test that /api/graph returns the same payload the page embeds."""
+    response = client.get('/api/graph')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['version'] > 0
+    assert {'rock', 'metal', 'death'} <= {node['id'] for node in data['nodes']}
+    assert 'death' in data['entities']['bands']
+
+
+def test_changes_up_to_date(client, app, sample_bands, current_version):
+    """Test that a client at the current version gets an empty patch."""
+    version = current_version()
+    patch = client.get(f'/api/graph/changes?since={version}').get_json()
+    assert patch['version'] == version
+    assert patch['reset'] is False
+    assert patch['nodes'] == {'upsert': [], 'remove': []}
+    assert patch['edges'] == {'upsert': [], 'remove': []}
+
+
+@pytest.mark.parametrize('since', ['', 'abc', '-1'])
+def test_changes_requires_valid_since(client, since):
+    """Test that a missing or invalid version is rejected."""
+    response = client.get(f'/api/graph/changes?since={since}')
+    assert response.status_code == 400
+
+
+def test_changes_after_edit_band(client, app, admin_user, sample_bands, login_admin, current_version):
+    """Test that editing a band returns just the band and affected genres."""
+    login_admin(client)
+    version = current_version()
+
+    client.post('/edit-band/death', data={
+        'name': "Death's Door",
+        'primary_genre_id': 'black-metal',
+        'genres': ['black-metal'],
+    })
+
+    patch = client.get(f'/api/graph/changes?since={version}').get_json()
+    assert patch['reset'] is False
+    assert patch['version'] > version
+
+    upserted = {node['id']: node for node in patch['nodes']['upsert']}
+    assert upserted['death']['label'] == "Death's Door"
+    assert upserted['death']['parentGenre'] == 'black-metal'
+    assert {'death-metal', 'black-metal'} <= set(upserted)
+    assert 'dimmu-borgir' not in upserted  # Untouched band isn't resent
+    assert 'rock' not in upserted
+
+    edges = {edge['id']: edge for edge in patch['edges']['upsert']}
+    assert edges['primary:death']['to'] == 'black-metal'
+
+    black_metal_bands = next(f for f in patch['entities']['genres']['black-metal']['fields']
+                             if f['label'] == 'Bands')
+    assert sorted(black_metal_bands['links']) == ['death', 'dimmu-borgir']
+    death_metal_bands = next(f for f in patch['entities']['genres']['death-metal']['fields']
+                             if f['label'] == 'Bands')
+    assert death_metal_bands['links'] == []
+
+
+def test_changes_after_delete_band(client, app, admin_user, sample_bands, login_admin, current_version):
+    """Test that deleted bands are removed along with their edge."""
+    login_admin(client)
+    version = current_version()
+
+    client.post('/delete-band/dimmu-borgir')
+
+    patch = client.get(f'/api/graph/changes?since={version}').get_json()
+    assert patch['nodes']['remove'] == ['dimmu-borgir']
+    assert 'primary:dimmu-borgir' in patch['edges']['remove']
+    assert 'dimmu-borgir' not in patch['entities']['bands']
+    # Its ancestors shrank, so they're redrawn (rock's own edge id is
+    # removed too, a no-op since roots have no parent edge)
+    assert {'black-metal', 'metal', 'rock'} <= {node['id'] for node in patch['nodes']['upsert']}
+    assert set(patch['edges']['remove']) <= {'primary:dimmu-borgir', 'parent:rock'}
+
+
+def test_changes_genre_loses_parent(client, app, sample_genres):
+    """Test that a genre whose parent is cleared drops its parent edge."""
+    with app.app_context():
+        genre = db.session.get(Genre, 'metal')
+        version = get_data_version()
+        genre.parent_id = None
+        db.session.commit()
+
+    patch = client.get(f'/api/graph/changes?since={version}').get_json()
+    assert 'metal' in {node['id'] for node in patch['nodes']['upsert']}
+    assert 'parent:metal' in patch['edges']['remove']
+
+
+def test_changes_from_future_version_resets(client, app, sample_genres, current_version):
+    """Test that a version the server never issued asks for a reload."""
+    version = current_version()
+    patch = client.get(f'/api/graph/changes?since={version + 5}').get_json()
+    assert patch['reset'] is True
+
+
+def test_changes_over_limit_resets(client, app, sample_genres, current_version):
+    """Test that patches bigger than the limit ask for a reload instead."""
+    version = current_version()
+    with app.app_context():
+        db.session.add_all([Band(id=f'band-{i}', name=f'Band {i}', primary_genre_id='death-metal')
+                            for i in range(5)])
+        db.session.commit()
+
+    app.config['GRAPH_CHANGES_LIMIT'] = 3
+    try:
+        patch = client.get(f'/api/graph/changes?since={version}').get_json()
+    finally:
+        app.config['GRAPH_CHANGES_LIMIT'] = 1000
+    assert patch['reset'] is True
+
+
+def test_stream_disabled_by_default(client):
+    """Test that the SSE stream is off unless enabled in config."""
+    response = client.get('/api/graph/stream')
+    assert response.status_code == 404
+
+
+def test_stream_sends_current_version(client, app, sample_genres, current_version):
+    """Test that an enabled stream announces the current version first."""
+    version = current_version()
+    app.config['GRAPH_STREAM_ENABLED'] = True
+    try:
+        response = client.get('/api/graph/stream', buffered=False)
+        first_event = next(iter(response.response))
+        response.close()
+    finally:
+        app.config['GRAPH_STREAM_ENABLED'] = False
+
+    assert response.mimetype == 'text/event-stream'
+    assert first_event == f'event: version\ndata: {{"version": {version}}}\n\n'.encode()
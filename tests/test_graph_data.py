@@ -0,0 +1,139 @@
+"""Tests for the graph data serializer and its JSON embedding in index.html."""
+import json
+import re
+
+import pytest
+
+from graph_data import build_graph_data
+from models import db, Genre, Band, genre_parents, band_genres, bump_data_version
+
+ADVERSARIAL_NAMES = [
+    "Guns N' Roses",
+    'The "Quoted" Band',
+    '</script><script>alert(1)</script>',
+    'Back\\slash & <b>Bold</b>',
+    'Line\nBreak',
+    "Motörhead   \U0001F3B8",
+]
+
+
+def extract_graph_data(response):
+    """Pull the embedded JSON document out of the rendered page."""
+    match = re.search(
+        rb'<script type="application/json" id="graph-data">(.*?)</script>',
+        response.data,
+        re.DOTALL,
+    )
+    assert match is not None, 'graph-data script tag not found'
+    return json.loads(match.group(1))
+
+
+def test_graph_data_structure(app, sample_genres, sample_bands):
+    """Test nodes, edges and panel entities built from the sample catalog."""
+    with app.app_context():
+        data = build_graph_data()
+
+    node_ids = {node['id'] for node in data['nodes']}
+    assert {'rock', 'metal', 'death-metal', 'black-metal', 'death', 'dimmu-borgir'} <= node_ids
+
+    edges = {edge['id']: (edge['from'], edge['to']) for edge in data['edges']}
+    assert edges['parent:metal'] == ('metal', 'rock')
+    assert edges['primary:death'] == ('death', 'death-metal')
+
+    metal = data['entities']['genres']['metal']
+    children = next(f for f in metal['fields'] if f['label'] == 'Child Genres')
+    assert sorted(children['links']) == ['black-metal', 'death-metal']
+
+    death = data['entities']['bands']['death']
+    assert death['fields'][0]['value'] == 'Death Metal'
+    assert death['fields'][1]['links'] == ['death-metal']
+
+
+def test_adversarial_names_round_trip(client, app, sample_genres):
+    """Names with quotes, script tags and control characters survive intact."""
+    with app.app_context():
+        for i, name in enumerate(ADVERSARIAL_NAMES):
+            band = Band(id=f'band-{i}', name=name, primary_genre_id='death-metal')
+            band.genres.append(db.session.get(Genre, 'death-metal'))
+            db.session.add(band)
+        db.session.add(Genre(id='odd-genre', name="Rock 'n' </script> Roll", type='leaf', parent_id='rock'))
+        db.session.commit()
+
+    response = client.get('/')
+    assert response.status_code == 200
+    # The raw closing tag must never reach the page unescaped
+    assert b'</script><script>alert(1)' not in response.data
+
+    data = extract_graph_data(response)
+    labels = {node['id']: node['label'] for node in data['nodes']}
+    for i, name in enumerate(ADVERSARIAL_NAMES):
+        assert labels[f'band-{i}'] == name
+        assert data['entities']['bands'][f'band-{i}']['name'] == name
+    assert labels['odd-genre'] == "Rock 'n' </script> Roll"
+
+    genre_bands = next(f for f in data['entities']['genres']['death-metal']['fields']
+                       if f['label'] == 'Bands')
+    assert set(ADVERSARIAL_NAMES) <= set(genre_bands['values'])
+
+
+def test_large_catalog_render(client, app, monkeypatch, count_queries):
+    """The page renders a large catalog with as many queries as a tiny one."""
+    monkeypatch.setitem(app.config, 'GRAPH_NODE_BUDGET', 0)  # Whole graph, no clustering
+    genre_count = 200
+    band_count = 5000
+
+    def add_catalog(genre_ids, band_ids):
+        db.session.execute(Genre.__table__.insert(),
+                           [{'id': f'g{i}', 'name': f"Genre {i}'s", 'parent_id': 'root', 'type': 'leaf'}
+                            for i in genre_ids])
+        db.session.execute(genre_parents.insert(),
+                           [{'genre_id': f'g{i}', 'parent_genre_id': 'root'} for i in genre_ids])
+        db.session.execute(Band.__table__.insert(),
+                           [{'id': f'b{i}', 'name': f"Band {i}'s", 'primary_genre_id': f'g{i % genre_count}'}
+                            for i in band_ids])
+        db.session.execute(band_genres.insert(),
+                           [{'band_id': f'b{i}', 'genre_id': f'g{i % genre_count}'} for i in band_ids])
+        bump_data_version(db.session.connection(), {})  # Core inserts don't bump it themselves
+        db.session.commit()
+
+    def render():
+        statements, stop = count_queries(db.engine)
+        try:
+            response = client.get('/')
+        finally:
+            stop()
+        assert response.status_code == 200
+        return response, statements
+
+    with app.app_context():
+        db.session.execute(Genre.__table__.insert(),
+                           [{'id': 'root', 'name': 'Root', 'parent_id': None, 'type': 'root'}])
+        add_catalog(range(2), range(2))
+        _, small_statements = render()
+        add_catalog(range(2, genre_count), range(2, band_count))
+        response, statements = render()
+
+    data = extract_graph_data(response)
+    assert len(data['nodes']) == genre_count + 1 + band_count
+    assert len(data['edges']) == genre_count + band_count
+
+    # One query per table plus the data version, however big the catalog -
+    # the old template lazy loaded per genre and band
+    assert len(statements) == len(small_statements)
+    assert len(statements) <= 5
+
+
+@pytest.mark.parametrize('name', ADVERSARIAL_NAMES)
+def test_admin_delete_confirm_is_escaped(client, app, admin_user, sample_genres, name):
+    """Admin delete confirmations embed names as JS string literals."""
+    with app.app_context():
+        band = Band(id='odd-band', name=name, primary_genre_id='death-metal')
+        db.session.add(band)
+        db.session.commit()
+
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    response = client.get('/admin')
+    assert response.status_code == 200
+    expected = json.dumps(f'Are you sure you want to delete {name}?')
+    match = re.search(rb"onsubmit='return confirm\((.*?)\);'", response.data.split(b'Bands (')[1], re.DOTALL)
+    assert json.loads(match.group(1)) == json.loads(expected)
@@ -0,0 +1,105 @@
+"""Tests for the array-backed graph index shared by Gunicorn workers."""
+import gc
+
+from sqlalchemy.engine import Connection
+
+from graph_data import load_graph_rows
+from graph_index import (StringTable, GraphIndex, build_csr, get_graph_index,
+                         clear_graph_index, preload_graph_index)
+from models import db, Genre
+
+
+def test_string_table_lookup():
+    """Test that sorted string tables find ids by binary search, including non-ASCII ones."""
+    strings = sorted(['ambient', 'black-metal', 'motörhead', 'zydeco', '\U0001F3B8'])
+    table = StringTable.from_strings(strings)
+
+    assert len(table) == 5
+    assert list(table) == strings
+    for i, string in enumerate(strings):
+        assert table.find(string) == i
+    assert table.find('missing') == -1
+    assert table.find('') == -1
+
+
+def test_build_csr():
+    """Test that (row, column) pairs become offsets and indices grouped by row."""
+    offsets, indices = build_csr([(2, 0), (0, 1), (2, 1), (0, 3)], 4)
+
+    assert list(offsets) == [0, 2, 2, 4, 4]
+    assert list(indices[offsets[0]:offsets[1]]) == [1, 3]
+    assert list(indices[offsets[1]:offsets[2]]) == []
+    assert list(indices[offsets[2]:offsets[3]]) == [0, 1]
+
+
+def test_index_matches_database_rows(app, sample_genres, sample_bands):
+    """Test that the index reproduces the rows the column-only queries return."""
+    with app.app_context():
+        index = get_graph_index()
+        rows = index.rows()
+        expected = load_graph_rows()
+
+    for key in ('genres', 'bands', 'genre_parents', 'band_genres', 'children'):
+        assert sorted(map(tuple, rows[key])) == sorted(map(tuple, expected[key])), key
+    assert rows['genre_names'] == expected['genre_names']
+    assert rows['band_names'] == expected['band_names']
+
+    metal = index.genre_index('metal')
+    assert index.genre_ids[index.genre_primary_parent[metal]] == 'rock'
+    assert [index.band_ids[b] for b in index.genre_bands(index.genre_index('death-metal'))] == ['death']
+    death = index.band_index('death')
+    assert [index.genre_ids[g] for g in index.band_genres(death)] == ['death-metal']
+    assert index.genre_index('not-a-genre') == -1
+
+
+def test_index_rebuilt_when_data_version_changes(app, sample_genres):
+    """Test that the cached index is reused until a write bumps the data version."""
+    with app.app_context():
+        first = get_graph_index()
+        assert get_graph_index() is first
+
+        db.session.add(Genre(id='grunge', name='Grunge', type='leaf', parent_id='rock'))
+        db.session.commit()
+
+        second = get_graph_index()
+        assert second is not first
+        assert second.version > first.version
+        assert second.genre_index('grunge') != -1
+
+
+def test_index_page_skips_graph_queries_when_unchanged(client, app, sample_genres, sample_bands):
+    """Test that repeat page loads only check the data version instead of re-reading the graph."""
+    client.get('/')
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    from sqlalchemy import event
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = client.get('/')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert response.status_code == 200
+    assert not [s for s in statements if 'FROM genres' in s or 'FROM bands' in s]
+
+
+def test_preload_builds_index_and_freezes_gc(app, sample_genres, monkeypatch):
+    """Test that the master-process preload hook builds the index, closes connections and freezes the GC."""
+    # The test's connection stands in for the engine (conftest.py): record the dispose
+    disposed = []
+    monkeypatch.setattr(Connection, 'dispose', lambda self: disposed.append(self), raising=False)
+    clear_graph_index()
+    try:
+        index = preload_graph_index(app)
+        assert disposed
+        assert isinstance(index, GraphIndex)
+        assert index.genre_count == len(sample_genres)
+        assert gc.get_freeze_count() > 0
+        with app.app_context():
+            assert get_graph_index() is index
+    finally:
+        gc.unfreeze()
@@ -0,0 +1,121 @@
+"""Tests for the level-of-detail (clustered) graph views."""
+import json
+
+from graph_index import GraphIndex
+from graph_lod import LevelIndex
+from models import db, Genre, Band, band_genres, bump_data_version
+
+from tests.test_graph_data import extract_graph_data
+
+
+def genre_nodes(data):
+    return {node['id']: node for node in data['nodes'] if node['group'] == 'genre'}
+
+
+def test_small_catalog_is_not_clustered(client, sample_bands):
+    """Test that a catalog within the node budget is drawn in full."""
+    data = extract_graph_data(client.get('/'))
+    assert data['lod'] is None
+    assert len(data['nodes']) == 6
+
+
+def test_clustered_initial_view(client, app, sample_bands, monkeypatch):
+    """Test that the page starts from the deepest level that fits the budget."""
+    monkeypatch.setitem(app.config, 'GRAPH_NODE_BUDGET', 3)
+    data = extract_graph_data(client.get('/'))
+
+    assert data['lod'] == {'budget': 3, 'level': 1, 'total_nodes': 6}
+    genres = genre_nodes(data)
+    assert set(genres) == {'rock', 'metal'}
+    assert genres['metal']['collapsed'] is True
+    assert genres['metal']['clusterGenres'] == 2
+    assert genres['metal']['bandCount'] == 2
+    assert 'collapsed' not in genres['rock']
+    assert set(data['entities']['genres']) == {'rock', 'metal'}
+
+
+def test_expand_cluster(client, app, sample_bands, monkeypatch):
+    """Test that expanding returns the genre's children and its bands."""
+    monkeypatch.setitem(app.config, 'GRAPH_NODE_BUDGET', 3)
+    data = client.get('/api/graph/expand/metal').get_json()
+    assert set(genre_nodes(data)) == {'metal', 'death-metal', 'black-metal'}
+    assert not any(node.get('collapsed') for node in data['nodes'])
+
+    data = client.get('/api/graph/expand/death-metal').get_json()
+    assert {node['id'] for node in data['nodes']} == {'death-metal', 'death'}
+    assert data['lod']['hidden_bands'] == 0
+    assert 'death' in data['entities']['bands']
+
+
+def test_expand_limits_bands(client, app, sample_bands, monkeypatch):
+    """Test that an expansion never returns more bands than the budget."""
+    monkeypatch.setitem(app.config, 'GRAPH_NODE_BUDGET', 1)
+    with app.app_context():
+        db.session.add(Band(id='morbid-angel', name='Morbid Angel', primary_genre_id='death-metal'))
+        db.session.commit()
+
+    data = client.get('/api/graph/expand/death-metal').get_json()
+    assert len([node for node in data['nodes'] if node['group'] == 'band']) == 1
+    assert data['lod']['hidden_bands'] == 1
+
+
+def test_expand_unknown_genre(client, sample_genres):
+    """Test that expanding a genre that doesn't exist is a 404."""
+    assert client.get('/api/graph/expand/nope').status_code == 404
+
+
+def test_level_index_tree():
+    """Test levels, tree sizes and the genre_parents / cycle fallbacks."""
+    index = GraphIndex.from_rows(
+        1,
+        [('a', 'A', None, 'root'), ('b', 'B', 'a', 'intermediate'), ('c', 'C', 'b', 'leaf'),
+         ('d', 'D', None, 'leaf'),                                   # Parent only in genre_parents
+         ('x', 'X', 'y', 'leaf'), ('y', 'Y', 'x', 'leaf')],          # A cycle
+        [('band', 'Band', 'c')],
+        [('d', 'b')],
+        [])
+    levels = LevelIndex(index)
+    position = index.genre_index
+
+    assert levels.depth[position('d')] == 2
+    assert levels.descendants[position('a')] == 3
+    assert [index.genre_ids[g] for g in levels.children[position('b')]] == ['c', 'd']
+    assert {levels.depth[position('x')], levels.depth[position('y')]} == {0, 1}
+    assert levels.level_sizes == [2, 4, 6]
+    assert levels.level_for(3) == 0
+    assert levels.level_for(5) == 1
+    assert levels.level_for(100) == 2
+    assert list(levels.bands(position('c'))) == [0]
+
+
+def test_clustered_payload_follows_budget(client, app, monkeypatch, count_queries):
+    """Test that clustered views and expansions list a capped number of members
+    in their panels, so their size doesn't grow with the catalog."""
+    monkeypatch.setitem(app.config, 'GRAPH_NODE_BUDGET', 10)
+    with app.app_context():
+        db.session.execute(Genre.__table__.insert(), [{'id': 'root', 'name': 'Root', 'parent_id': None, 'type': 'root'}]
+                           + [{'id': f'leaf-{i}', 'name': f'Leaf {i}', 'parent_id': 'root', 'type': 'leaf'}
+                              for i in range(3)])
+        db.session.execute(Band.__table__.insert(), [{'id': f'band-{i:04}', 'name': f'Band {i}',
+                                                      'primary_genre_id': f'leaf-{i % 3}'} for i in range(3000)])
+        db.session.execute(band_genres.insert(), [{'band_id': f'band-{i:04}', 'genre_id': f'leaf-{i % 3}'}
+                                                  for i in range(3000)])
+        bump_data_version(db.session.connection(), {})
+        db.session.commit()
+
+    response = client.get('/')
+    data = extract_graph_data(response)
+    assert len(data['nodes']) == 4
+    bands_field = next(f for f in data['entities']['genres']['leaf-0']['fields'] if f['label'] == 'Bands')
+    assert len(bands_field['links']) == 50
+    assert bands_field['more'] == 950
+    assert len(json.dumps(data)) < 15_000  # Every member listed would be ~100 KB
+
+    with app.app_context():
+        statements, stop = count_queries(db.engine)
+        response = client.get('/api/graph/expand/leaf-0')
+        stop()
+    data = response.get_json()
+    assert len([node for node in data['nodes'] if node['group'] == 'band']) == 10
+    assert len(response.data) < 15_000
+    assert len(statements) <= 1  # Only the data version: the view comes from the graph index
@@ -0,0 +1,72 @@
+"""Tests for shortest connection search and the /api/path endpoint."""
+from graph_index import GraphIndex
+from graph_paths import PathIndex, find_path
+from models import db, Band, Genre
+
+
+def make_path_index():
+    index = GraphIndex.from_rows(
+        1,
+        genres=[('rock', 'Rock', None, 'root'), ('metal', 'Metal', 'rock', 'intermediate'),
+                ('doom', 'Doom', 'metal', 'leaf'), ('punk', 'Punk', 'rock', 'leaf'),
+                ('jazz', 'Jazz', None, 'root'), ('free-jazz', 'Free Jazz', 'jazz', 'leaf')],
+        bands=[('sabbath', 'Black Sabbath', 'doom'), ('melvins', 'Melvins', 'doom'),
+               ('zorn', 'Naked City', 'free-jazz'), ('lonely', 'Lonely Band', 'punk')],
+        # The primary parent of free-jazz is only in genres.parent_id
+        parent_pairs=[('metal', 'rock'), ('doom', 'metal'), ('punk', 'rock')],
+        membership_pairs=[('sabbath', 'doom'), ('melvins', 'doom'), ('melvins', 'punk'),
+                          ('zorn', 'free-jazz'), ('zorn', 'punk'), ('lonely', 'punk')],
+    )
+    return PathIndex(index)
+
+
+def ids(path_index, nodes):
+    return [path_index.describe(node)['id'] for node in nodes]
+
+
+def test_shortest_path_through_bands_and_genres():
+    """Test that the search crosses band memberships and both kinds of parent link."""
+    p = make_path_index()
+
+    path = p.shortest_path(p.node('sabbath'), p.node('jazz'), max_depth=8)
+    assert ids(p, path) == ['sabbath', 'doom', 'melvins', 'punk', 'zorn', 'free-jazz', 'jazz']
+
+    assert ids(p, p.shortest_path(p.node('doom'), p.node('rock'), 8)) == ['doom', 'metal', 'rock']
+    assert ids(p, p.shortest_path(p.node('punk'), p.node('punk'), 8)) == ['punk']
+
+
+def test_depth_cap():
+    """Test that paths longer than the cap aren't returned."""
+    p = make_path_index()
+
+    assert p.shortest_path(p.node('sabbath'), p.node('jazz'), max_depth=5) is None
+    assert p.shortest_path(p.node('sabbath'), p.node('jazz'), max_depth=6) is not None
+
+
+def test_find_path_caches_results(app, sample_bands):
+    """Test that repeated and reversed queries come from the result cache."""
+    with app.app_context():
+        first = find_path(1, 'death', 'dimmu-borgir', 8)
+        assert find_path(1, 'death', 'dimmu-borgir', 8) is first
+        reverse = find_path(1, 'dimmu-borgir', 'death', 8)
+
+    assert [step['id'] for step in first['path']] == ['death', 'death-metal', 'metal', 'black-metal', 'dimmu-borgir']
+    assert reverse['path'] == first['path'][::-1]
+
+
+def test_path_api(client, app, sample_bands):
+    """Test the endpoint's responses, including after a write creates a shortcut."""
+    response = client.get('/api/path?from=death&to=dimmu-borgir')
+    assert response.status_code == 200
+    assert response.get_json()['length'] == 4
+
+    with app.app_context():
+        band = db.session.get(Band, 'death')
+        band.genres.append(db.session.get(Genre, 'black-metal'))
+        db.session.commit()
+
+    data = client.get('/api/path?from=death&to=dimmu-borgir').get_json()
+    assert [step['id'] for step in data['path']] == ['death', 'black-metal', 'dimmu-borgir']
+
+    assert client.get('/api/path?from=death').status_code == 400
+    assert client.get('/api/path?from=death&to=nobody').status_code == 404
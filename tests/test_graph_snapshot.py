@@ -0,0 +1,120 @@
+"""Tests for the memory-mapped binary graph snapshot."""
+import os
+
+import pytest
+
+from graph_index import GraphIndex, get_graph_index, clear_graph_index
+from graph_lod import build_graph_view
+from graph_snapshot import SnapshotError, open_snapshot, write_snapshot
+from jobs import rebuild_graph_snapshot
+from models import db, Genre
+
+
+def make_index(version=7):
+    return GraphIndex.from_rows(
+        version,
+        genres=[('rock', 'Rock', None, 'root'), ('metal', 'Metal', 'rock', 'intermediate'),
+                ('doom', 'Doom Métal', 'metal', 'leaf'), ('empty', 'Empty', None, 'root')],
+        bands=[('sabbath', 'Black Sabbath', 'doom'), ('motorhead', 'Motörhead', 'metal')],
+        parent_pairs=[('metal', 'rock'), ('doom', 'metal'), ('doom', 'rock')],
+        membership_pairs=[('sabbath', 'doom'), ('sabbath', 'metal'), ('motorhead', 'metal')],
+    )
+
+
+def test_snapshot_round_trip(tmp_path):
+    """Test that a written snapshot maps back to the same index without copying."""
+    index = make_index()
+    path = tmp_path / 'graph.snapshot'
+    write_snapshot(index, str(path))
+
+    mapped = open_snapshot(str(path))
+    assert mapped.version == 7
+    assert mapped.rows() == index.rows()
+    assert isinstance(mapped.parent_indices, memoryview)
+    assert mapped.parent_indices.readonly
+
+    doom = mapped.genre_index('doom')
+    assert sorted(mapped.genre_ids[p] for p in mapped.genre_parents(doom)) == ['metal', 'rock']
+    assert mapped.genre_names[doom] == 'Doom Métal'
+    assert mapped.genre_bands(mapped.genre_index('empty')).tolist() == []
+    assert mapped.nbytes == index.nbytes
+
+
+def test_snapshot_replaced_atomically(tmp_path):
+    """Test that rewriting leaves no temp files and open mappings keep the old data."""
+    path = str(tmp_path / 'graph.snapshot')
+    write_snapshot(make_index(version=1), path)
+    old = open_snapshot(path)
+
+    write_snapshot(make_index(version=2), path)
+
+    assert os.listdir(tmp_path) == ['graph.snapshot']
+    assert old.version == 1
+    assert old.band_names[old.band_index('sabbath')] == 'Black Sabbath'
+    assert open_snapshot(path).version == 2
+
+
+def test_invalid_snapshot_rejected(tmp_path):
+    """Test that files that aren't snapshots raise SnapshotError."""
+    path = tmp_path / 'graph.snapshot'
+    path.write_bytes(b'{"nodes": []}' * 10)
+    with pytest.raises(SnapshotError):
+        open_snapshot(str(path))
+
+    path.write_bytes(b'short')
+    with pytest.raises(SnapshotError):
+        open_snapshot(str(path))
+
+    path.write_bytes(b'')  # Truncated: mmap can't map an empty file
+    with pytest.raises(SnapshotError):
+        open_snapshot(str(path))
+
+
+def test_workers_share_snapshot(app, sample_genres, tmp_path, monkeypatch):
+    """Test that a process opens the snapshot written for the current version instead of querying."""
+    path = str(tmp_path / 'graph.snapshot')
+    monkeypatch.setitem(app.config, 'GRAPH_SNAPSHOT_PATH', path)
+
+    with app.app_context():
+        first = get_graph_index()
+        assert isinstance(first.genre_types, memoryview)
+        assert open_snapshot(path).version == first.version
+
+        # Another worker: no cached index, the snapshot is already current
+        builds = []
+        original = GraphIndex.from_database.__func__
+        monkeypatch.setattr(GraphIndex, 'from_database',
+                            classmethod(lambda cls, version: builds.append(version) or original(cls, version)))
+        clear_graph_index()
+        assert get_graph_index().rows() == first.rows()
+        assert builds == []
+
+        # After a write the previous index is served until the worker's
+        # snapshot job has written the new one
+        db.session.add(Genre(id='grunge', name='Grunge', type='leaf', parent_id='rock'))
+        db.session.commit()
+        assert get_graph_index().version == first.version
+        assert build_graph_view(0)['version'] == first.version  # Labelled with what it shows
+        assert builds == []
+
+        rebuild_graph_snapshot(None)
+        updated = get_graph_index()
+        assert builds == [updated.version]
+        assert updated.version > first.version
+        assert updated.genre_index('grunge') != -1
+        assert open_snapshot(path).version == updated.version
+
+
+def test_builds_snapshot_when_worker_is_late(app, sample_genres, tmp_path, monkeypatch):
+    """Test that a process builds the new snapshot itself once GRAPH_SNAPSHOT_WAIT is up."""
+    path = str(tmp_path / 'graph.snapshot')
+    monkeypatch.setitem(app.config, 'GRAPH_SNAPSHOT_PATH', path)
+    monkeypatch.setitem(app.config, 'GRAPH_SNAPSHOT_WAIT', 0)
+
+    with app.app_context():
+        first = get_graph_index()
+        db.session.add(Genre(id='grunge', name='Grunge', type='leaf', parent_id='rock'))
+        db.session.commit()
+        updated = get_graph_index()
+        assert updated.version > first.version
+        assert open_snapshot(path).version == updated.version
@@ -0,0 +1,52 @@
+"""Import-time regression tests (python -X importtime).
+
+CLI scripts and workers should only pay for Flask + SQLAlchemy, not the
+web-only extensions the full app pulls in.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules only the web app needs
+WEB_ONLY_MODULES = {'app', 'flask_limiter', 'flask_migrate', 'alembic', 'limits', 'instrumentation'}
+
+# Generous upper bound for importing the database entry point (microseconds);
+# it's ~0.5s on a laptop, the full app is roughly twice that
+DB_IMPORT_BUDGET_US = 2_000_000
+
+
+def import_times(statement):
+    """{module: cumulative import time in microseconds} for a fresh interpreter."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('module', ['database', 'init_db', 'make_admin', 'migrate_genre_parents', 'backfill'])
+def test_scripts_skip_web_only_modules(module):
+    """Test that database-only entry points never import the web stack."""
+    imported = {name.split('.')[0] for name in import_times(f'import {module}')}
+    assert not imported & WEB_ONLY_MODULES
+
+
+def test_database_import_time_budget():
+    """Test that the database entry point stays cheap to import."""
+    times = import_times('import database')
+    assert times['database'] < DB_IMPORT_BUDGET_US
+
+
+def test_database_import_cheaper_than_app():
+    """Test that skipping the web stack actually saves import time."""
+    db_time = import_times('import database')['database']
+    app_time = import_times('import app')['app']
+    assert db_time < app_time
@@ -0,0 +1,109 @@
+"""Tests for per-request performance instrumentation."""
+import re
+
+import pytest
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from instrumentation import Histogram, MetricsRegistry, metrics
+from models import db
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    """Start each test with empty metrics."""
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def parse_server_timing(header):
+    """{'db': (dur, desc), ...} from a Server-Timing header."""
+    timings = {}
+    for part in header.split(', '):
+        name, *params = part.split(';')
+        values = dict(p.split('=', 1) for p in params)
+        timings[name] = (float(values['dur']), values.get('desc', '').strip('"'))
+    return timings
+
+
+def test_server_timing_header(client, sample_bands):
+    """Test that responses report query count, DB, render and total time."""
+    response = client.get('/')
+    timings = parse_server_timing(response.headers['Server-Timing'])
+
+    assert set(timings) == {'db', 'render', 'total'}
+    query_count = int(timings['db'][1].split()[0])
+    assert query_count >= 1
+    assert timings['render'][0] > 0
+    assert timings['total'][0] >= timings['db'][0]
+
+
+def test_server_timing_can_be_disabled(client, app):
+    """Test the SERVER_TIMING_ENABLED switch."""
+    app.config['SERVER_TIMING_ENABLED'] = False
+    try:
+        response = client.get('/login')
+    finally:
+        app.config['SERVER_TIMING_ENABLED'] = True
+    assert 'Server-Timing' not in response.headers
+
+
+def test_metrics_endpoint(client, sample_bands):
+    """Test that /metrics exposes per-endpoint histograms."""
+    client.get('/')
+    client.get('/')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert 'http_requests_total{endpoint="main.index",method="GET",status="200"} 2' in text
+    assert 'http_request_duration_seconds_count{endpoint="main.index"} 2' in text
+    assert 'http_request_duration_seconds_bucket{endpoint="main.index",le="+Inf"} 2' in text
+    match = re.search(r'db_queries_per_request_sum\{endpoint="main.index"\} (\d+)', text)
+    assert match and int(match.group(1)) >= 2
+    assert 'template_render_seconds_count{endpoint="main.index"} 2' in text
+    assert 'response_size_bytes_count{endpoint="main.index"} 2' in text
+
+
+def test_metrics_token(client, app):
+    """Test that METRICS_TOKEN protects the metrics endpoint."""
+    app.config['METRICS_TOKEN'] = 'scrape-me'
+    try:
+        assert client.get('/metrics').status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+        assert response.status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test bucket placement and cumulative counts."""
+    histogram = Histogram((1, 5, 10))
+    for value in (0.5, 1, 3, 7, 50):
+        histogram.observe(value)
+
+    cumulative, total, count = histogram.snapshot()
+    assert cumulative == [2, 3, 4, 5]
+    assert total == 61.5
+    assert count == 5
+
+
+def test_registry_render_escapes_labels():
+    """Test the Prometheus text output for counters and label escaping."""
+    registry = MetricsRegistry()
+    registry.counter('things_total', 'Things')
+    registry.inc('things_total', name='say "hi"\\')
+    assert 'things_total{name="say \\"hi\\"\\\\"} 1' in registry.render()
+
+
+def test_failed_query_leaves_no_start_time(app):
+    """Test that a statement that raises doesn't leave its start time behind."""
+    with app.app_context():
+        connection = db.session.connection()
+        with pytest.raises((OperationalError, ProgrammingError)):
+            with connection.begin_nested():
+                connection.exec_driver_sql('SELECT * FROM no_such_table')
+        connection.exec_driver_sql('SELECT 1')
+        assert connection.info.get('query_start_time') == []
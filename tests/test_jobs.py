@@ -0,0 +1,204 @@
+"""Tests for the persistent background job queue."""
+import threading
+from datetime import timedelta
+
+import pytest
+
+from graph_snapshot import open_snapshot
+from jobs import (JOB_HANDLERS, claim_next_job, enqueue, enqueue_stale_rebuilds, job_status, requeue_stale,
+                  run_next_job, run_worker, utcnow)
+from models import db, Job, get_data_version
+
+
+def later(seconds=60):
+    return utcnow() + timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def snapshot_path(app, tmp_path, monkeypatch):
+    path = str(tmp_path / 'graph.snapshot')
+    monkeypatch.setitem(app.config, 'GRAPH_SNAPSHOT_PATH', path)
+    return path
+
+
+@pytest.fixture
+def flaky_job(monkeypatch):
+    """A job kind that fails the first `failures` times it runs"""
+    calls = []
+
+    def handler(payload):
+        calls.append(payload)
+        if len(calls) <= payload['failures']:
+            raise RuntimeError(f'failure {len(calls)}')
+    monkeypatch.setitem(JOB_HANDLERS, 'flaky', handler)
+    return calls
+
+
+def test_edits_enqueue_one_rebuild(client, app, admin_user, sample_genres, snapshot_path, login_admin):
+    """Test that admin edits enqueue the rebuild and repeated edits coalesce."""
+    login_admin(client)
+    for band_id in ('morbid-angel', 'obituary'):
+        response = client.post('/add-band', data={
+            'id': band_id, 'name': band_id.title(),
+            'primary_genre_id': 'death-metal', 'genres': ['death-metal'],
+        })
+        assert response.status_code == 302
+
+    with app.app_context():
+        jobs = Job.query.all()
+        assert [(job.kind, job.status) for job in jobs] == [('graph_snapshot', 'queued'),
+                                                            ('graph_analytics', 'queued'),
+                                                            ('similarity', 'queued')]
+
+
+def test_no_rebuild_without_snapshots(client, app, admin_user, sample_genres, login_admin):
+    """Test that only the analytics and similarity runs are queued when there's no snapshot to rebuild."""
+    login_admin(client)
+    client.post('/add-genre', data={'id': 'thrash', 'name': 'Thrash', 'type': 'leaf', 'parent_id': 'metal'})
+    with app.app_context():
+        assert [job.kind for job in Job.query.all()] == ['graph_analytics', 'similarity']
+
+
+def test_stale_rebuilds_queued(app, sample_bands):
+    """Test that the worker's check queues rebuilds behind the data version, once."""
+    with app.app_context():
+        assert enqueue_stale_rebuilds() == ['graph_analytics', 'similarity']
+        while run_next_job('test-worker', now=later()):
+            pass
+        assert enqueue_stale_rebuilds() == []
+        assert [job.kind for job in Job.query.all()] == ['graph_analytics', 'similarity']
+
+
+def test_stale_snapshot_queued(app, sample_bands, snapshot_path):
+    """Test that the worker's check queues a snapshot that's missing or behind."""
+    with app.app_context():
+        assert enqueue_stale_rebuilds() == ['graph_snapshot', 'graph_analytics', 'similarity']
+        while run_next_job('test-worker', now=later()):
+            pass
+        assert open_snapshot(snapshot_path).version == get_data_version()
+        assert enqueue_stale_rebuilds() == []
+
+
+def test_worker_runs_queued_job(app, sample_bands, snapshot_path):
+    """Test that a worker writes the snapshot and marks the job done."""
+    with app.app_context():
+        enqueue('graph_snapshot', delay=0)
+        db.session.commit()
+        version = get_data_version()
+
+        job = run_next_job('test-worker', now=later())
+        assert job.status == 'done'
+        assert job.attempts == 1
+        assert job.worker == 'test-worker'
+        assert open_snapshot(snapshot_path).version == version
+        assert run_next_job('test-worker', now=later()) is None
+
+
+def test_worker_stops_after_current_job(app, monkeypatch):
+    """Test that setting the stop event (SIGTERM in worker.py) lets the running job finish."""
+    stop = threading.Event()
+    monkeypatch.setitem(JOB_HANDLERS, 'stopper', lambda payload: stop.set())
+    with app.app_context():
+        enqueue('stopper', delay=0)
+        enqueue('stopper', dedup_key='second', delay=0)
+        db.session.commit()
+
+    run_worker(app, poll_interval=0, stop=stop)
+
+    with app.app_context():
+        assert [job.status for job in Job.query.filter_by(kind='stopper').order_by(Job.id)] == ['done', 'queued']
+
+
+def test_jobs_wait_until_due(app):
+    """Test that a job isn't claimed before its coalescing delay is up."""
+    with app.app_context():
+        enqueue('graph_snapshot', delay=30)
+        db.session.commit()
+        assert claim_next_job('test-worker') is None
+        assert claim_next_job('test-worker', now=later(31)) is not None
+
+
+def test_claim_retires_duplicates(app):
+    """Test that claiming a job retires other queued copies of it."""
+    with app.app_context():
+        # Two workers' worth of enqueues racing past the dedup check
+        for _ in range(3):
+            db.session.add(Job(kind='graph_snapshot', dedup_key='', run_at=utcnow()))
+        db.session.add(Job(kind='graph_snapshot', dedup_key='other', run_at=utcnow()))
+        db.session.commit()
+
+        job = claim_next_job('test-worker', now=later())
+        counts = job_status()['counts']
+        assert job.status == 'running'
+        assert counts == {'queued': 1, 'running': 1, 'done': 2, 'failed': 0}
+
+
+def test_failed_job_retries_then_fails(app, flaky_job, monkeypatch):
+    """Test that failures are retried with backoff until attempts run out."""
+    monkeypatch.setitem(app.config, 'JOB_RETRY_DELAY', 10)
+    with app.app_context():
+        job = enqueue('flaky', {'failures': 5}, delay=0, max_attempts=2)
+        db.session.commit()
+        job_id = job.id
+
+        run_next_job('test-worker', now=later())
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts) == ('queued', 1)
+        assert job.error == 'RuntimeError: failure 1'
+        assert job.run_at > utcnow() + timedelta(seconds=5)
+
+        run_next_job('test-worker', now=later())
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts) == ('failed', 2)
+        assert job.error == 'RuntimeError: failure 2'
+        assert run_next_job('test-worker', now=later(3600)) is None
+
+
+def test_retry_succeeds(app, flaky_job):
+    """Test that a job that fails once succeeds on its retry."""
+    with app.app_context():
+        job = enqueue('flaky', {'failures': 1}, delay=0)
+        db.session.commit()
+        job_id = job.id
+        run_next_job('test-worker', now=later())
+        run_next_job('test-worker', now=later(3600))
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts, job.error) == ('done', 2, None)
+        assert flaky_job == [{'failures': 1}, {'failures': 1}]
+
+
+def test_stale_running_job_requeued(app, monkeypatch):
+    """Test that a job whose worker died is queued again."""
+    monkeypatch.setitem(app.config, 'JOB_TIMEOUT', 60)
+    with app.app_context():
+        enqueue('graph_snapshot', delay=0)
+        db.session.commit()
+        job = claim_next_job('dead-worker', now=utcnow())
+
+        assert requeue_stale(now=utcnow()) == 0
+        assert requeue_stale(now=later(120)) == 1
+        db.session.refresh(job)
+        assert (job.status, job.worker) == ('queued', None)
+
+
+def test_unknown_kind_rejected(app):
+    """Test that enqueueing a job nobody can run is an error."""
+    with app.app_context():
+        with pytest.raises(ValueError):
+            enqueue('nope')
+
+
+def test_jobs_api_requires_admin(client, app, admin_user, regular_user, login_admin):
+    """Test that queue status is only shown to admins."""
+    with app.app_context():
+        enqueue('graph_snapshot')
+        db.session.commit()
+
+    client.post('/login', data={'username': 'testuser', 'password': 'test123'})
+    assert client.get('/api/jobs').status_code == 302
+    client.get('/logout')
+
+    login_admin(client)
+    data = client.get('/api/jobs').get_json()
+    assert data['counts']['queued'] == 1
+    assert data['recent'][0]['kind'] == 'graph_snapshot'
@@ -0,0 +1,126 @@
+"""Tests for the opt-in N+1 / slow query detector and request profiler."""
+import logging
+import os
+
+import pytest
+from flask import Flask, render_template_string
+
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from config import Config
+from models import db, Genre, Band
+from profiling import init_profiling
+
+# Lazy loads band.genres once per band - the classic N+1
+BAND_LIST_TEMPLATE = """
+{% for band in bands %}
+{{ band.name }}: {% for genre in band.genres %}{{ genre.name }}{% endfor %}
+{% endfor %}
+"""
+
+
+@pytest.fixture
+def profiled_app(app, tmp_path):
+    """A separate app with profiling enabled, sharing the test database."""
+    profiled = Flask(__name__)
+    profiled.config.from_object(Config)
+    profiled.config.update({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+        'PROFILING_ENABLED': True,
+        'PROFILE_N_PLUS_ONE_THRESHOLD': 3,
+        'PROFILE_SLOW_QUERY_MS': 10_000,
+        'PROFILE_THRESHOLD_MS': 10_000,
+        'PROFILE_DIR': str(tmp_path / 'profiles'),
+    })
+    db.init_app(profiled)
+    init_profiling(profiled)
+    # Same database: use the test's connection (an in-memory database is per connection)
+    with app.app_context():
+        connection = db.engines[None]
+    with profiled.app_context():
+        db.engines[None] = connection
+
+    @profiled.route('/bands')
+    def bands():
+        return render_template_string(BAND_LIST_TEMPLATE, bands=Band.query.all())
+
+    @profiled.route('/genres')
+    def genres():
+        return ', '.join(g.name for g in Genre.query.order_by(Genre.name).all())
+
+    return profiled
+
+
+@pytest.fixture
+def many_bands(app, sample_genres):
+    with app.app_context():
+        death_metal = db.session.get(Genre, 'death-metal')
+        for i in range(5):
+            band = Band(id=f'band-{i}', name=f'Band {i}', primary_genre_id='death-metal')
+            band.genres.append(death_metal)
+            db.session.add(band)
+        db.session.commit()
+
+
+def test_n_plus_one_is_reported_with_template_line(profiled_app, many_bands, caplog):
+    """Test that repeated lazy loads are flagged with the template location."""
+    with caplog.at_level(logging.WARNING):
+        response = profiled_app.test_client().get('/bands')
+    assert response.status_code == 200
+
+    warnings = [r.getMessage() for r in caplog.records if 'Possible N+1' in r.getMessage()]
+    assert len(warnings) == 1  # Reported once per statement, not once per query
+    assert 'GET /bands' in warnings[0]
+    assert 'triggered at <template>:3' in warnings[0]
+    assert 'band_genres' in warnings[0]
+
+
+def test_no_n_plus_one_for_single_query(profiled_app, many_bands, caplog):
+    """Test that a single bulk query isn't flagged."""
+    with caplog.at_level(logging.WARNING):
+        profiled_app.test_client().get('/genres')
+    assert not [r for r in caplog.records if 'Possible N+1' in r.getMessage()]
+
+
+def test_slow_query_logs_explain_plan(profiled_app, many_bands, caplog):
+    """Test that slow queries are logged with their EXPLAIN plan."""
+    profiled_app.config['PROFILE_SLOW_QUERY_MS'] = 0
+    with caplog.at_level(logging.WARNING):
+        profiled_app.test_client().get('/genres')
+
+    # (every statement is slow at 0 ms, the test transaction's SAVEPOINTs too)
+    slow = [r.getMessage() for r in caplog.records
+            if r.getMessage().startswith('Slow query') and 'FROM genres' in r.getMessage()]
+    assert slow
+    assert 'plan:' in slow[0]
+    assert 'test_profiling.py:' in slow[0] and 'in genres' in slow[0]
+
+
+def test_slow_request_profile_written(profiled_app, many_bands, caplog):
+    """Test that requests over the threshold are dumped as cProfile stats."""
+    profiled_app.config['PROFILE_THRESHOLD_MS'] = 0
+    with caplog.at_level(logging.WARNING):
+        profiled_app.test_client().get('/genres')
+
+    profile_dir = profiled_app.config['PROFILE_DIR']
+    files = os.listdir(profile_dir)
+    assert len(files) == 1
+    assert files[0].endswith('.prof')
+    assert '-genres-' in files[0]
+
+
+def test_failed_query_leaves_no_start_time(profiled_app):
+    """Test that a statement that raises doesn't leave its start time behind."""
+    with profiled_app.app_context():
+        connection = db.session.connection()
+        with pytest.raises((OperationalError, ProgrammingError)):
+            with connection.begin_nested():
+                connection.exec_driver_sql('SELECT * FROM no_such_table')
+        connection.exec_driver_sql('SELECT 1')
+        assert connection.info.get('profiling_start_time') == []
+
+
+def test_profiling_disabled_by_default(app):
+    """Test that the main app doesn't install the profiling hooks."""
+    assert app.config['PROFILING_ENABLED'] is False
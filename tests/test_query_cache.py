@@ -0,0 +1,86 @@
+"""Tests for memoized read queries."""
+from models import db, Genre
+from query_cache import bypass_query_cache, query_cache_stats
+from read_models import genre_options
+
+
+def counts(name='genre_options'):
+    return query_cache_stats()['functions'].get(name, {'hits': 0, 'misses': 0, 'bypasses': 0})
+
+
+def test_repeat_form_loads_hit_cache(client, admin_user, sample_genres):
+    """Test that loading a form again reuses the cached genre list."""
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    client.get('/add-band')
+    response = client.get('/add-band')
+    assert b'Death Metal' in response.data
+    assert counts() == {'hits': 1, 'misses': 1, 'bypasses': 0}
+
+
+def test_cache_follows_data_version(app, sample_genres):
+    """Test that a write makes the next lookup read the new data."""
+    with app.app_context():
+        assert [g.id for g in genre_options(leaf_only=True)] == ['black-metal', 'death-metal']
+        genre_options(leaf_only=True)
+        assert counts()['hits'] == 1
+
+        db.session.add(Genre(id='doom-metal', name='Doom Metal', type='leaf', parent_id='metal'))
+        db.session.commit()
+        assert 'doom-metal' in [g.id for g in genre_options(leaf_only=True)]
+        assert 'metal' not in [g.id for g in genre_options(exclude='metal')]
+        assert counts()['misses'] == 3
+
+
+def test_lru_eviction(app, sample_genres, monkeypatch):
+    """Test that the cache never holds more than QUERY_CACHE_SIZE results."""
+    monkeypatch.setitem(app.config, 'QUERY_CACHE_SIZE', 2)
+    with app.app_context():
+        for genre_id in ('rock', 'metal', 'death-metal'):
+            genre_options(exclude=genre_id)
+        genre_options(exclude='death-metal')
+        genre_options(exclude='rock')  # Evicted, so read again
+
+    stats = query_cache_stats()
+    assert stats['size'] == 2
+    assert stats['evictions'] == 2
+    assert counts() == {'hits': 1, 'misses': 4, 'bypasses': 0}
+
+
+def test_bypass(app, sample_genres, monkeypatch):
+    """Test that no-cache requests, bypass_query_cache() and size 0 skip the cache."""
+    with app.test_request_context('/', headers={'Cache-Control': 'no-cache'}):
+        genre_options()
+    with app.test_request_context('/'):
+        bypass_query_cache()
+        genre_options()
+    monkeypatch.setitem(app.config, 'QUERY_CACHE_SIZE', 0)
+    with app.app_context():
+        genre_options()
+
+    assert counts() == {'hits': 0, 'misses': 0, 'bypasses': 3}
+    assert query_cache_stats()['size'] == 0
+
+
+def test_uncommitted_writes_not_cached(app, sample_genres):
+    """Test that reads after a write in the same request neither use nor fill the cache."""
+    with app.test_request_context('/'):
+        genre_options()
+        db.session.add(Genre(id='doom-metal', name='Doom Metal', type='leaf', parent_id='metal'))
+        db.session.flush()
+        assert 'doom-metal' in [g.id for g in genre_options()]
+        db.session.rollback()
+    with app.test_request_context('/'):
+        assert 'doom-metal' not in [g.id for g in genre_options()]
+
+    assert counts() == {'hits': 1, 'misses': 1, 'bypasses': 1}
+
+
+def test_query_cache_api_requires_admin(client, admin_user, regular_user):
+    """Test that only admins can read the cache stats."""
+    client.post('/login', data={'username': 'testuser', 'password': 'test123'})
+    assert client.get('/api/query-cache').status_code == 302
+    client.get('/logout')
+
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    data = client.get('/api/query-cache').get_json()
+    assert set(data) == {'size', 'evictions', 'functions'}
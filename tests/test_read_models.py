@@ -0,0 +1,70 @@
+"""Tests for the read models used by the admin page."""
+import pytest
+
+from models import db, Genre, Band, band_genres
+from read_models import list_genres, list_bands, GenreListing
+
+
+def test_list_genres(app, sample_genres):
+    """Test that genres come back ordered by name with their parent's name."""
+    with app.app_context():
+        genres = list_genres()
+
+    assert [g.name for g in genres] == ['Black Metal', 'Death Metal', 'Metal', 'Rock']
+    by_id = {g.id: g for g in genres}
+    assert by_id['metal'].parent_name == 'Rock'
+    assert by_id['rock'].parent_name is None
+    assert by_id['death-metal'] == GenreListing('death-metal', 'Death Metal', 'leaf', 'metal', 'Metal')
+
+
+def test_list_bands(app, sample_bands):
+    """Test that bands carry their primary genre name and all genre names."""
+    with app.app_context():
+        db.session.execute(band_genres.insert().values(band_id='death', genre_id='metal'))
+        db.session.commit()
+        bands = list_bands()
+
+    assert [b.id for b in bands] == ['death', 'dimmu-borgir']
+    assert bands[0].primary_genre_name == 'Death Metal'
+    assert bands[0].genre_names == ('Death Metal', 'Metal')
+
+
+def test_read_models_are_immutable(app, sample_genres):
+    """Test that read models can't be modified by templates or views."""
+    with app.app_context():
+        genre = list_genres()[0]
+    with pytest.raises(AttributeError):
+        genre.name = 'Changed'
+
+
+def test_admin_page_query_count(client, app, admin_user, count_queries):
+    """Test that the admin page runs a fixed number of queries however many bands there are."""
+    with app.app_context():
+        db.session.add(Genre(id='root', name='Root', type='root'))
+        db.session.add_all([Genre(id=f'g{i}', name=f'Genre {i}', type='leaf', parent_id='root')
+                            for i in range(20)])
+        db.session.flush()
+        db.session.add_all([Band(id=f'b{i}', name=f'Band {i}', primary_genre_id=f'g{i % 20}')
+                            for i in range(200)])
+        db.session.flush()
+        db.session.execute(band_genres.insert(), [{'band_id': f'b{i}', 'genre_id': f'g{i % 20}'}
+                                                  for i in range(200)])
+        db.session.commit()
+
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    with app.app_context():
+        statements, stop = count_queries(db.engine)
+        try:
+            response = client.get('/admin')
+            page = response.data  # Streamed: the listing is read as the body is sent
+        finally:
+            stop()
+
+    assert response.status_code == 200
+    assert b'Band 199' in page
+    assert b'<td>Root</td>' in page
+    # Login user lookup + the two counts + genres + bands with their genre names.
+    # The listings must be among them: they're only read while the body streams
+    assert any(statement.startswith('SELECT genres.id') for statement in statements), statements
+    assert any(statement.startswith('SELECT bands.id') for statement in statements), statements
+    assert len(statements) <= 5, statements
@@ -0,0 +1,148 @@
+"""Tests for similar genres / related bands and the /api/similar endpoint."""
+import json
+
+import similarity
+from graph_index import GraphIndex, get_graph_index
+from jobs import refresh_similarity
+from models import db, Band, SimilarityPanel, band_genres, get_data_version
+from similarity import SimilarityModel, band_panel, genre_panel, get_similar, update_similarity
+
+
+def make_model():
+    index = GraphIndex.from_rows(
+        1,
+        genres=[('rock', 'Rock', None, 'root'), ('metal', 'Metal', 'rock', 'intermediate'),
+                ('doom', 'Doom', 'metal', 'leaf'), ('sludge', 'Sludge', 'metal', 'leaf'),
+                ('jazz', 'Jazz', None, 'root')],
+        bands=[('sabbath', 'Black Sabbath', 'doom'), ('melvins', 'Melvins', 'sludge'),
+               ('eyehategod', 'Eyehategod', 'sludge'), ('coltrane', 'John Coltrane', 'jazz')],
+        parent_pairs=[('metal', 'rock'), ('doom', 'metal'), ('sludge', 'metal')],
+        membership_pairs=[('sabbath', 'doom'), ('melvins', 'sludge'), ('melvins', 'doom'),
+                          ('eyehategod', 'sludge'), ('eyehategod', 'doom'), ('coltrane', 'jazz')],
+    )
+    return SimilarityModel(index)
+
+
+def stored_panels():
+    """{(entity type, id): version} of the stored panels, without the version row"""
+    return {(row.entity_type, row.entity_id): row.version
+            for row in SimilarityPanel.query.filter(SimilarityPanel.entity_type != 'all')}
+
+
+def test_similar_genres_from_shared_bands_and_ancestry():
+    """Test that genres sharing bands and parents rank first, unrelated genres never appear."""
+    model = make_model()
+    ids = model.index.genre_ids
+    similar = [ids[genre] for genre, _ in model.similar_genres(model.index.genre_index('sludge'), 3)]
+
+    assert similar[0] == 'doom'
+    assert 'jazz' not in similar
+
+
+def test_related_bands_by_genre_overlap():
+    """Test that bands with the same genres are most related and isolated bands have none."""
+    model = make_model()
+    index = model.index
+
+    assert band_panel(model, index.band_index('melvins'), 3)['related_bands'][0] == ['eyehategod', 1.0]
+    assert band_panel(model, index.band_index('coltrane'), 3)['related_bands'] == []
+
+
+def test_panel_combines_both_lists():
+    """Test that panels suggest genres/bands the entity isn't linked to yet."""
+    model = make_model()
+    index = model.index
+
+    panel = band_panel(model, index.band_index('sabbath'), 3)
+    assert [band_id for band_id, _ in panel['related_bands']][:2] == ['eyehategod', 'melvins']
+    assert [genre_id for genre_id, _ in panel['similar_genres']] == ['sludge']
+
+    # Every sludge band is already in doom
+    assert genre_panel(model, index.genre_index('doom'), 3)['related_bands'] == []
+
+
+def test_worker_stores_every_panel(app, sample_bands):
+    """Test that the first run stores a panel per genre and band, and reruns skip."""
+    with app.app_context():
+        refresh_similarity(None)
+        version = get_data_version()
+        assert set(stored_panels()) == {('genre', 'rock'), ('genre', 'metal'), ('genre', 'death-metal'),
+                                        ('genre', 'black-metal'), ('band', 'death'), ('band', 'dimmu-borgir')}
+        assert similarity.stored_similarity_version() == version
+        assert update_similarity(get_graph_index(version), app.config['SIMILARITY_TOP_K']) == 0
+
+
+def test_incremental_update_keeps_unaffected_panels(app, sample_bands):
+    """Test that a write only recomputes the panels it can affect."""
+    with app.app_context():
+        db.session.add(Band(id='obituary', name='Obituary', primary_genre_id='death-metal'))
+        db.session.flush()
+        db.session.execute(band_genres.insert().values(band_id='obituary', genre_id='death-metal'))
+        db.session.commit()
+        refresh_similarity(None)
+        before = stored_panels()
+
+        # Touches black-metal (and the band itself) only
+        db.session.get(Band, 'dimmu-borgir').name = 'Dimmu'
+        db.session.commit()
+        refresh_similarity(None)
+        after = stored_panels()
+
+        assert after[('band', 'death')] == before[('band', 'death')]
+        assert after[('band', 'dimmu-borgir')] == get_data_version()
+        panel = SimilarityPanel.query.filter_by(entity_type='band', entity_id='death').one()
+        assert json.loads(panel.data)['related_bands'] == [['obituary', 1.0]]
+
+        db.session.delete(db.session.get(Band, 'obituary'))
+        db.session.commit()
+        refresh_similarity(None)
+        assert ('band', 'obituary') not in stored_panels()
+
+
+def test_panels_served_stale_until_recomputed(app, sample_bands):
+    """Test that web workers keep serving the stored panels, with fresh names, after a write."""
+    with app.app_context():
+        refresh_similarity(None)
+        stored = get_data_version()
+        db.session.get(Band, 'dimmu-borgir').name = 'Dimmu'
+        db.session.commit()
+        version = get_data_version()
+
+        panel, panel_version = get_similar(version, 'genre', 'death-metal')
+        assert panel_version == stored < version
+        assert panel['related_bands'] == [{'id': 'dimmu-borgir', 'name': 'Dimmu',
+                                           'score': panel['related_bands'][0]['score']}]
+        assert get_similar(version, 'band', 'nope') == (None, stored)
+
+
+def test_panel_cache_is_bounded(app, sample_bands, monkeypatch):
+    """Test that unknown ids aren't cached and the panel cache stays within its size."""
+    monkeypatch.setattr(similarity, '_panels', similarity.PathCache(2))
+    with app.app_context():
+        refresh_similarity(None)
+        version = get_data_version()
+        for i in range(100):
+            assert get_similar(version, 'band', f'missing-{i}')[0] is None
+        for entity_id in ('metal', 'death-metal', 'black-metal'):
+            get_similar(version, 'genre', entity_id)
+
+    assert list(similarity._panels._entries) == [(version, 'genre', 'death-metal'),
+                                                 (version, 'genre', 'black-metal')]
+
+
+def test_similar_api(client, app, sample_bands):
+    """Test the JSON endpoint the detail panel calls."""
+    assert client.get('/api/similar/genre/death-metal').status_code == 202
+    with app.app_context():
+        refresh_similarity(None)
+
+    response = client.get('/api/similar/genre/death-metal')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['stale'] is False
+    assert {g['id'] for g in data['similar_genres']} >= {'metal', 'black-metal'}
+    assert data['related_bands'][0]['id'] == 'dimmu-borgir'
+
+    assert client.get('/api/similar/band/death').status_code == 200
+    assert client.get('/api/similar/band/nope').status_code == 404
+    assert client.get('/api/similar/user/1').status_code == 404
@@ -0,0 +1,111 @@
+"""Tests for the static export of the graph page (flask graph freeze)."""
+import json
+import os
+from datetime import timedelta
+
+import pytest
+
+import jobs
+from jobs import enqueue_stale_rebuilds, run_next_job
+from models import db, Genre, Job, get_data_version
+from static_site import freeze, frozen_version
+
+
+def read_json(*parts):
+    with open(os.path.join(*parts)) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def site_dir(app, tmp_path, monkeypatch):
+    path = str(tmp_path / 'site')
+    monkeypatch.setitem(app.config, 'STATIC_SITE_DIR', path)
+    return path
+
+
+def test_freeze_writes_site(app, sample_bands, site_dir):
+    """Test that a freeze writes the page, the versioned payload with positions and the static files."""
+    with app.app_context():
+        version = freeze(site_dir)
+        assert version == get_data_version()
+
+    site = read_json(site_dir, 'version.json')
+    assert site['version'] == version
+    data = read_json(site_dir, site['graph'])
+    assert data['version'] == version
+    assert data['layout'] is True
+    assert all('x' in node and 'y' in node for node in data['nodes'])
+    positions = {(node['x'], node['y']) for node in data['nodes']}
+    assert len(positions) == len(data['nodes'])  # Nothing stacked on anything else
+
+    page = open(os.path.join(site_dir, 'index.html')).read()
+    assert site['graph'] in page
+    assert 'id="graph-data"' not in page
+    assert 'id="path-form"' not in page
+    assert os.path.exists(os.path.join(site_dir, 'static', 'style.css'))
+
+
+def test_freeze_follows_data_version(app, sample_genres, site_dir):
+    """Test that a freeze is skipped at the same version and writes a new payload after a change."""
+    with app.app_context():
+        first = freeze(site_dir)
+        assert freeze(site_dir) is None
+        assert freeze(site_dir, force=True) == first
+
+        db.session.add(Genre(id='doom-metal', name='Doom Metal', type='leaf', parent_id='metal'))
+        db.session.commit()
+        second = freeze(site_dir)
+
+    assert second > first
+    assert frozen_version(site_dir) == second
+    ids = {node['id'] for node in read_json(site_dir, 'graph', str(second), 'graph.json')['nodes']}
+    assert 'doom-metal' in ids
+    assert os.path.exists(os.path.join(site_dir, 'graph', str(first), 'graph.json'))  # Open pages can finish
+
+
+def test_clustered_site_has_expansions(app, sample_bands, site_dir, monkeypatch):
+    """Test that a clustered export includes every genre's expansion, laid out like the main graph."""
+    monkeypatch.setitem(app.config, 'GRAPH_NODE_BUDGET', 3)
+    with app.app_context():
+        version = freeze(site_dir)
+
+    graph = read_json(site_dir, 'graph', str(version), 'graph.json')
+    assert graph['lod'] is not None
+    expansion = read_json(site_dir, 'graph', str(version), 'expand', 'metal.json')
+    assert {'death-metal', 'black-metal'} <= {node['id'] for node in expansion['nodes']}
+    positions = {node['id']: (node['x'], node['y']) for node in graph['nodes']}
+    for node in expansion['nodes']:
+        if node['id'] in positions:
+            assert positions[node['id']] == (node['x'], node['y'])
+
+
+def test_freeze_command(app, runner, sample_genres, tmp_path, monkeypatch):
+    """Test that flask graph freeze writes to --output and needs somewhere to write."""
+    output = str(tmp_path / 'out')
+    result = runner.invoke(args=['graph', 'freeze', '--output', output])
+    assert result.exit_code == 0
+    assert 'written' in result.output
+    assert os.path.exists(os.path.join(output, 'index.html'))
+
+    monkeypatch.setitem(app.config, 'STATIC_SITE_DIR', '')
+    result = runner.invoke(args=['graph', 'freeze'])
+    assert result.exit_code != 0
+
+
+def test_edits_refresh_static_site(client, app, admin_user, sample_genres, site_dir, monkeypatch):
+    """Test that an edit queues a static export and the worker writes it."""
+    monkeypatch.setattr(jobs, '_static_site_app', app)
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    response = client.post('/add-band', data={
+        'id': 'obituary', 'name': 'Obituary',
+        'primary_genre_id': 'death-metal', 'genres': ['death-metal'],
+    })
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert [job.kind for job in Job.query.all()] == ['graph_analytics', 'similarity', 'static_site']
+        while run_next_job('test-worker', now=jobs.utcnow() + timedelta(minutes=1)):
+            pass
+        assert {job.status for job in Job.query.all()} == {'done'}
+        assert frozen_version(site_dir) == get_data_version()
+        assert enqueue_stale_rebuilds() == []
@@ -0,0 +1,67 @@
+"""Tests for the streamed admin listing and exports."""
+import csv
+import io
+
+from models import db, band_genres
+from read_models import iter_bands
+from streaming import buffered
+
+
+def test_admin_page_streamed(client, admin_user, sample_bands, login_admin):
+    """Test that the admin listing is streamed with every row and the counts."""
+    login_admin(client)
+    response = client.get('/admin')
+    assert response.status_code == 200
+    assert response.is_streamed
+    page = response.get_data(as_text=True)
+    assert 'Genres (4)' in page
+    assert 'Bands (2)' in page
+    assert 'Dimmu Borgir' in page
+    assert page.rstrip().endswith('</html>')
+
+
+def test_flash_shown_once_on_streamed_page(client, admin_user, sample_genres, login_admin):
+    """Test that a flashed message is removed from the session before the page streams."""
+    login_admin(client)
+    client.post('/delete-genre/black-metal')
+    assert 'deleted' in client.get('/admin').get_data(as_text=True).lower()
+    assert 'deleted' not in client.get('/admin').get_data(as_text=True).lower()
+
+
+def test_iter_bands_groups_genres(app, sample_bands):
+    """Test that streamed band rows carry all their genre names, fetched in small batches."""
+    with app.app_context():
+        db.session.execute(band_genres.insert().values(band_id='death', genre_id='metal'))
+        db.session.commit()
+        bands = list(iter_bands(batch_size=1))
+
+    assert [band.id for band in bands] == ['death', 'dimmu-borgir']
+    assert bands[0].genre_names == ('Death Metal', 'Metal')
+
+
+def test_exports(client, admin_user, sample_bands, login_admin):
+    """Test that the CSV and JSON dumps hold every row."""
+    login_admin(client)
+    response = client.get('/admin/export/bands.csv')
+    assert response.is_streamed
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['id'] for row in rows] == ['death', 'dimmu-borgir']
+    assert rows[0]['primary_genre_name'] == 'Death Metal'
+
+    genres = client.get('/admin/export/genres.json').get_json()
+    assert [genre['name'] for genre in genres] == ['Black Metal', 'Death Metal', 'Metal', 'Rock']
+    assert genres[2]['parent_name'] == 'Rock'
+
+
+def test_exports_require_admin(client, regular_user, sample_genres):
+    """Test that only admins can download the dumps."""
+    assert client.get('/admin/export/genres.csv').status_code == 302
+    client.post('/login', data={'username': 'testuser', 'password': 'test123'})
+    assert client.get('/admin/export/genres.json').status_code == 302
+    assert client.get('/admin/export/users.csv').status_code == 404
+
+
+def test_buffered_joins_small_chunks():
+    """Test that small chunks go out in pieces of about the buffer size."""
+    assert list(buffered(['ab', 'cd', 'ef', 'g'], size=4)) == ['abcd', 'efg']
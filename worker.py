@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Background job worker: runs the jobs queued in the `jobs` table (see
+jobs.py). Any number of workers can share the queue.
+
+usage:
+# Run until interrupted
+python worker.py
+# Run every job that's due, then exit (cron, tests, debugging)
+python worker.py --once
+# Show job counts and the latest jobs
+python worker.py --status
+"""
+
+import argparse
+import signal
+import sys
+import threading
+
+from database import create_db_app
+from jobs import job_status, run_worker
+
+# Database-only app: scripts don't need the web stack
+app = create_db_app()
+
+
+def print_status(limit):
+    with app.app_context():
+        status = job_status(limit)
+    print('  '.join(f'{name}: {count}' for name, count in status['counts'].items()))
+    for job in status['recent']:
+        line = f"  #{job['id']} {job['kind']}"
+        if job['dedup_key']:
+            line += f":{job['dedup_key']}"
+        line += f" {job['status']} (attempt {job['attempts']}/{job['max_attempts']})"
+        if job['error']:
+            line += f" - {job['error']}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run queued background jobs.')
+    parser.add_argument('--once', action='store_true', help='exit when no job is due')
+    parser.add_argument('--status', action='store_true', help='show the queue and exit')
+    parser.add_argument('--poll', type=float, default=1.0, help='seconds between queue checks (default 1)')
+    parser.add_argument('--prune-days', type=int, default=7, help='delete finished jobs older than this (default 7)')
+    parser.add_argument('--limit', type=int, default=20, help='jobs listed by --status (default 20)')
+    args = parser.parse_args(argv)
+
+    if args.status:
+        print_status(args.limit)
+        return 0
+
+    # SIGTERM (container stop) lets the job in progress finish
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    print("Worker started" + (" (--once)" if args.once else ""))
+    try:
+        run_worker(app, poll_interval=args.poll, once=args.once, prune_days=args.prune_days, stop=stop)
+    except KeyboardInterrupt:
+        pass
+    print("Worker stopped")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())